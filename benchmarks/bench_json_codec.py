@@ -0,0 +1,96 @@
+"""Rows/sec of the JSON hot path on a realistic 25,000-row searchAnalytics page.
+
+Compares singer's default serialization (stdlib `json` to parse the
+response, simplejson for every RECORD message) with each installed codec
+of `tap_google_search_console.codec`.
+
+Run with: python -m benchmarks.bench_json_codec
+"""
+import json
+import random
+import time
+from datetime import date, timedelta
+
+import singer
+from singer.messages import format_message
+
+from tap_google_search_console import codec
+
+ROWS = 25000
+REPEAT = 3
+
+
+def make_page(rows: int = ROWS) -> bytes:
+    """Builds a performance_report_query response body."""
+    random.seed(1)
+    start = date(2024, 1, 1)
+    page = {
+        "rows": [
+            {
+                "keys": [str(start + timedelta(days=idx % 30)), f"search query number {idx} for singer tap"],
+                "clicks": random.randint(0, 500),
+                "impressions": random.randint(500, 50000),
+                "ctr": random.random(),
+                "position": random.uniform(1, 100),
+            }
+            for idx in range(rows)
+        ],
+        "responseAggregationType": "byProperty",
+    }
+    return json.dumps(page).encode("utf-8")
+
+
+def make_records(body: bytes):
+    return [
+        {
+            "site_url": "https://www.example.com/",
+            "search_type": "web",
+            "date": f"{row['keys'][0]}T00:00:00.000000Z",
+            "query": row["keys"][1],
+            "clicks": row["clicks"],
+            "impressions": row["impressions"],
+            "ctr": row["ctr"],
+            "position": row["position"],
+        }
+        for row in json.loads(body)["rows"]
+    ]
+
+
+def best_of(func) -> float:
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run_baseline(body: bytes, records) -> None:
+    json.loads(body)
+    for record in records:
+        format_message(singer.RecordMessage(stream="performance_report_query", record=record))
+
+
+def run_codec(selected: codec.JsonCodec, body: bytes, records) -> None:
+    selected.loads(body)
+    for record in records:
+        selected.dumps(singer.RecordMessage(stream="performance_report_query", record=record).asdict())
+
+
+def main() -> None:
+    body = make_page()
+    records = make_records(body)
+    baseline = best_of(lambda: run_baseline(body, records))
+    print(f"page: {ROWS} rows, {len(body) / 1024 / 1024:.1f} MiB")
+    print(f"{'singer default':<16} {ROWS / baseline:>12,.0f} rows/sec")
+    for name in codec.CODEC_PREFERENCE:
+        if not codec.INSTALLED[name]:
+            print(f"{name:<16} {'not installed':>12}")
+            continue
+        selected = codec.get_codec(name)
+        elapsed = best_of(lambda: run_codec(selected, body, records))
+        print(f"{name:<16} {ROWS / elapsed:>12,.0f} rows/sec  ({baseline / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
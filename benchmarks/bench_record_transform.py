@@ -0,0 +1,50 @@
+"""Rows/sec of building the final records of a 25,000-row searchAnalytics page.
+
+Compares the previous path (`ReportRow.to_record` then a singer
+`Transformer` per record) with the `RecordTransformer` compiled from the
+stream schema and catalog metadata, after checking both give the same
+records.
+
+Run with: python -m benchmarks.bench_record_transform
+"""
+from singer import Transformer
+
+from benchmarks.bench_json_codec import ROWS, best_of, make_page
+from tap_google_search_console.discover import get_schemas
+from tap_google_search_console.rows import RecordTransformer, decode_report_page
+
+STREAM = "performance_report_query"
+DIMENSIONS = ["date", "query"]
+SITE = "https://www.example.com/"
+
+
+def run_baseline(page, schema, stream_metadata):
+    records = []
+    for row in page:
+        with Transformer() as transformer:
+            record = row.to_record(STREAM, SITE, "web", DIMENSIONS)
+            records.append(transformer.transform(record, schema, stream_metadata))
+    return records
+
+
+def run_compiled(page, schema, stream_metadata):
+    transformer = RecordTransformer.compile(STREAM, schema, stream_metadata)
+    return [transformer.transform(row, SITE, "web", DIMENSIONS) for row in page]
+
+
+def main() -> None:
+    page = decode_report_page(make_page())
+    schema = get_schemas()[0][STREAM]
+    selections = (("all fields", {}), ("ctr unselected", {("properties", "ctr"): {"selected": False}}))
+    for label, stream_metadata in selections:
+        if run_compiled(page, schema, stream_metadata) != run_baseline(page, schema, stream_metadata):
+            raise AssertionError(f"compiled records differ from the singer Transformer ones ({label})")
+        baseline = best_of(lambda: run_baseline(page, schema, stream_metadata))
+        compiled = best_of(lambda: run_compiled(page, schema, stream_metadata))
+        print(f"{STREAM}, {label}: {ROWS} rows, same records")
+        print(f"{'to_record + Transformer':<24} {ROWS / baseline:>12,.0f} rows/sec")
+        print(f"{'RecordTransformer':<24} {ROWS / compiled:>12,.0f} rows/sec  ({baseline / compiled:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
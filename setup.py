@@ -9,12 +9,14 @@ setup(
     author="jeff.huth@bytecode.io",
     classifiers=["Programming Language :: Python :: 3 :: Only"],
     py_modules=["tap_google_search_console"],
-    install_requires=["backoff==2.2.1", "requests==2.32.4", "singer-python==6.0.1"],
+    install_requires=["requests==2.32.4", "singer-python==6.0.1"],
     extras_require={
         "dev": [
             "ipdb",
             "pylint",
-        ]
+        ],
+        "orjson": ["orjson>=3.8"],
+        "msgspec": ["msgspec>=0.18"],
     },
     entry_points="""
           [console_scripts]
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 from singer import get_logger, utils
 
+from tap_google_search_console import codec
 from tap_google_search_console.client import GoogleClient
 from tap_google_search_console.discover import discover
 from tap_google_search_console.sync import sync
@@ -14,6 +15,7 @@ REQUIRED_CONFIG_KEYS = ["client_id", "client_secret", "refresh_token", "start_da
 def main():
     # Parse command line arguments
     parsed_args = utils.parse_args(REQUIRED_CONFIG_KEYS)
+    codec.set_codec(parsed_args.config.get("json_codec"))
 
     # If discover flag was passed, run discovery mode and dump output to stdout
     with GoogleClient(
@@ -23,6 +25,11 @@ def main():
         parsed_args.config["site_urls"],
         parsed_args.config["user_agent"],
         parsed_args.config.get("request_timeout"),
+        max_workers=parsed_args.config.get("max_workers"),
+        rate_limit_db=parsed_args.config.get("rate_limit_db"),
+        token_refresh_margin=parsed_args.config.get("token_refresh_margin"),
+        token_cache_path=parsed_args.config.get("token_cache_path"),
+        report_shards=parsed_args.config.get("report_shards"),
     ) as client:
         if parsed_args.discover:
             catalog = discover(client)
@@ -1,20 +1,29 @@
-import json
+import threading
+import time
+from contextlib import ExitStack
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, Iterator
 from urllib.parse import quote
 
-import backoff
 import requests
 import singer
-from requests.exceptions import ConnectionError, Timeout
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
 from singer import metrics, utils
 
+from .codec import dumps, loads
 from .exceptions import (
     GoogleQuotaExceededError,
     GoogleRateLimitExceeded,
     Server5xxError,
     raise_for_error,
 )
+from .ratelimit import get_api_method, get_rate_limiter
+from .retry import RetryPolicy, RetryRule, constant, expo
+from .scheduler import DEFAULT_MAX_WORKERS, get_max_workers
+from .streaming import ReadTimer, iter_response_rows
+from .throttle import AIMDController
+from .token_cache import TokenCache, get_cache_key
 
 BASE_URL = "https://www.googleapis.com/webmasters/v3"
 GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
@@ -22,6 +31,23 @@ LOGGER = singer.get_logger()
 
 # set default timeout of 300 seconds
 REQUEST_TIMEOUT = 300
+# refresh the access token in the background 5 minutes before it expires
+TOKEN_REFRESH_MARGIN = 300
+
+# Single retry policy of the API requests, every rule keeps its own attempt budget:
+# wait 15 minutes (or `Retry-After`) in case of Quota Exceeded error, unless the unit of work is parked instead,
+# retry timeouts 5 times with a 10 seconds interval,
+# and 5xx, connection (also while streaming the body) and rate limit errors 7 times with an exponential backoff.
+# Repeated timeouts and 5xx errors are raised earlier when the caller can split the request in smaller ones.
+REQUEST_RETRY_POLICY = RetryPolicy(
+    RetryRule((GoogleQuotaExceededError,), max_tries=2, wait=constant(900), parkable=True),
+    RetryRule((Timeout,), max_tries=5, wait=constant(10), split_after=2),
+    RetryRule((Server5xxError,), max_tries=7, wait=expo(3), split_after=3),
+    RetryRule((ConnectionError, ChunkedEncodingError, GoogleRateLimitExceeded), max_tries=7, wait=expo(3)),
+)
+# errors of an oversized request, solved by splitting it
+SPLITTABLE_ERRORS = (Timeout, Server5xxError)
+TOKEN_RETRY_POLICY = RetryPolicy(RetryRule((Server5xxError, ConnectionError, Timeout), max_tries=5, wait=expo(2)))
 
 
 class GoogleClient:  # pylint: disable=too-many-instance-attributes
@@ -33,37 +59,116 @@ class GoogleClient:  # pylint: disable=too-many-instance-attributes
         site_urls: str,
         user_agent=None,
         timeout=REQUEST_TIMEOUT,
+        max_workers=DEFAULT_MAX_WORKERS,
+        rate_limit_db=None,
+        token_refresh_margin=TOKEN_REFRESH_MARGIN,
+        token_cache_path=None,
+        report_shards=None,
     ):
 
         self.__client_id, self.__client_secret, self.__refresh_token = (client_id, client_secret, refresh_token)
         self.__site_urls, self.__user_agent = site_urls, user_agent
         self.__access_token, self.__expires, self.base_url = None, None, None
+        self.__refresh_at = None
+        # held while the token is fetched, so that concurrent refreshes are coalesced into one call
+        self.__token_lock = threading.Lock()
+        self.__token_cache = TokenCache(token_cache_path) if token_cache_path else None
         self.__session = requests.Session()
-
+        self.max_workers = get_max_workers(max_workers)
+        # every sync worker may fetch the shards of its window concurrently
+        self.max_in_flight = self.max_workers * max(int(report_shards or 0), 1)
+        # size the connection pool so that every request in flight keeps its own connection alive
+        self.__session.mount("https://", HTTPAdapter(pool_maxsize=max(self.max_in_flight, 10)))
         try:
             self.request_timeout = REQUEST_TIMEOUT if timeout in (None, 0, "0", "0.0") else float(timeout)
         except ValueError:
             self.request_timeout = REQUEST_TIMEOUT
 
+        self.rate_limiter = get_rate_limiter(client_id, rate_limit_db)
+        self.throttle = AIMDController(self.rate_limiter, self.max_in_flight, self.request_timeout)
+
+        try:
+            self.token_refresh_margin = float(
+                TOKEN_REFRESH_MARGIN if token_refresh_margin in (None, "") else token_refresh_margin
+            )
+        except ValueError:
+            self.token_refresh_margin = TOKEN_REFRESH_MARGIN
+
     def check_sites_access(self) -> None:
         """Perform access check for each site url provided."""
-        body = json.dumps({"startDate": "2021-04-01", "endDate": "2021-05-01"})
+        body = dumps({"startDate": "2021-04-01", "endDate": "2021-05-01"})
         for site_url in self.__site_urls.replace(" ", "").split(","):
             self.post(f"sites/{quote(site_url, safe='')}/searchAnalytics/query", data=body)
 
-    @backoff.on_exception(backoff.expo, (Server5xxError, ConnectionError, Timeout), max_tries=5, factor=2)
     def __enter__(self):
-        self.get_access_token()
+        TOKEN_RETRY_POLICY.call(self.get_access_token)
         return self
 
     def __exit__(self, exception_type, exception_value, traceback):
         self.__session.close()
 
     def get_access_token(self) -> None:
-        """Performs authentication and the access token if expired."""
+        """Ensures a valid access token.
 
+        Only a missing or expired token is fetched inline, every other
+        thread waits for that single refresh. Within the refresh margin
+        before expiry the token is renewed in the background so that
+        requests never wait on the token endpoint.
+        """
         if self.__access_token and self.__expires > datetime.now(timezone.utc):
+            if self.__refresh_at <= datetime.now(timezone.utc):
+                self.__refresh_in_background()
+            return
+
+        with self.__token_lock:
+            # another thread may have refreshed the token while this one was waiting
+            if self.__access_token and self.__expires > datetime.now(timezone.utc):
+                return
+            if not self.__load_cached_token():
+                self.__fetch_access_token()
+
+    def __refresh_in_background(self) -> None:
+        """Starts a background refresh, unless a refresh is already
+        running."""
+        if not self.__token_lock.acquire(blocking=False):
             return
+
+        def refresh():
+            try:
+                # another tap process may have renewed the token already
+                if not self.__load_cached_token(fresh_only=True):
+                    TOKEN_RETRY_POLICY.call(self.__fetch_access_token)
+            except Exception as err:  # pylint: disable=broad-except
+                # the token is refreshed inline once it has expired
+                LOGGER.warning(f"Background refresh of the access token failed: {err}")
+            finally:
+                self.__token_lock.release()
+
+        threading.Thread(target=refresh, name="gsc-token-refresh", daemon=True).start()
+
+    def __load_cached_token(self, fresh_only: bool = False) -> bool:
+        """Takes the access token from the token cache, if enabled and still
+        valid (and with `fresh_only`, not yet due for renewal)."""
+        if not self.__token_cache:
+            return False
+        cached = self.__token_cache.get(get_cache_key(self.__client_id, self.__refresh_token))
+        if not cached:
+            return False
+        access_token, expires, lifetime = cached
+        refresh_at = self.__get_refresh_at(expires, lifetime)
+        if fresh_only and refresh_at <= datetime.now(timezone.utc):
+            return False
+        self.__access_token, self.__expires, self.__refresh_at = access_token, expires, refresh_at
+        LOGGER.info("Using cached access token, token expires = %s", self.__expires)
+        return True
+
+    def __get_refresh_at(self, expires: datetime, lifetime: timedelta) -> datetime:
+        """Returns when to renew a token, never earlier than half way through
+        its lifetime."""
+        return expires - min(timedelta(seconds=self.token_refresh_margin), lifetime / 2)
+
+    def __fetch_access_token(self) -> None:
+        """Performs authentication to get a new access token."""
         headers = {"User-Agent": self.__user_agent or ""}
         response = self.__session.post(
             url=GOOGLE_TOKEN_URI,
@@ -81,29 +186,77 @@ class GoogleClient:  # pylint: disable=too-many-instance-attributes
             raise_for_error(response)
 
         data = response.json()
-        self.__access_token = data["access_token"]
-        self.__expires = utils.now() + timedelta(seconds=data["expires_in"])
+        lifetime = timedelta(seconds=data["expires_in"])
+        expires = utils.now() + lifetime
+        refresh_at = self.__get_refresh_at(expires, lifetime)
+        self.__access_token, self.__expires, self.__refresh_at = data["access_token"], expires, refresh_at
+        if self.__token_cache:
+            self.__token_cache.put(
+                get_cache_key(self.__client_id, self.__refresh_token), self.__access_token, expires, lifetime
+            )
 
         LOGGER.info("Authorized, token expires = %s", self.__expires)
 
-    # Backoff for 15 minutes in case of Quota Exceeded error
-    @backoff.on_exception(backoff.constant, GoogleQuotaExceededError, max_tries=2, interval=900, jitter=None)
-    # backoff for 5 times, with 10 seconds consistent interval
-    @backoff.on_exception(backoff.constant, Timeout, max_tries=5, interval=10, jitter=None)
-    @backoff.on_exception(
-        backoff.expo, (Server5xxError, ConnectionError, GoogleRateLimitExceeded), max_tries=7, factor=3
-    )
-    @utils.ratelimit(1200, 60)
-    def request(self, method: str, path: str = None, url: str = None, **kwargs) -> Any:
+    def request(
+        self, method: str, path: str = None, url: str = None, park_on_quota: bool = False,
+        split_on_failure: bool = False, **kwargs,
+    ) -> Any:
         """Wrapper method around request.sessions get/post method using the
-        session object of the GoogleClient Object."""
+        session object of the GoogleClient Object, retried according to the
+        request retry policy.
 
-        # TODO: Consolidate multiple backoff decorators
+        With `park_on_quota` a quota exceeded error is raised at once
+        with its `retry_after`, for callers which can park their work
+        and continue with other work meanwhile. With `split_on_failure`
+        repeated timeouts and 5xx errors are raised after fewer attempts,
+        for callers which can split the request in smaller ones. With `stream_key` the
+        response body is not loaded at once, an iterator over the array
+        under that key is returned, parsed incrementally off the socket.
+        A body failing partway is requested again from its first row not
+        read yet, retried as the request. A `decoder` replaces the JSON
+        decoding of the response body.
+        """
+        rows = REQUEST_RETRY_POLICY.call(
+            self.__request, method, path, url, park=park_on_quota, split=split_on_failure, **kwargs
+        )
+        if kwargs.get("stream_key"):
+            return self.__resume_rows(rows, method, path, url, park_on_quota, **kwargs)
+        return rows
+
+    def __resume_rows(self, rows: Iterator, method: str, path: str, url: str, park: bool, **kwargs) -> Iterator:
+        """Yields the streamed rows of a paginated report query, requesting
+        the rows not read yet again when the body fails partway."""
+        body, read, attempts = loads(kwargs["data"]), 0, {}
+        while True:
+            try:
+                for row in rows:
+                    read += 1
+                    yield row
+                return
+            except Exception as err:  # pylint: disable=broad-except
+                if body.get("rowLimit") is not None and read >= body["rowLimit"]:
+                    return
+                # the rows already read were consumed, the smaller request can no longer be split
+                REQUEST_RETRY_POLICY.retry(err, attempts, park=park)
+                LOGGER.info(f"Resuming the response body after {read} rows")
+                data = {**body, "startRow": body.get("startRow", 0) + read}
+                if body.get("rowLimit") is not None:
+                    data["rowLimit"] = body["rowLimit"] - read
+                rows = REQUEST_RETRY_POLICY.call(
+                    self.__request, method, path, url, park=park, **{**kwargs, "data": dumps(data)}
+                )
+
+    def __request(self, method: str, path: str = None, url: str = None, **kwargs) -> Any:
+        """Performs a single request attempt."""
+        kwargs = {**kwargs, "headers": dict(kwargs.get("headers") or {})}
         self.get_access_token()
+        self.rate_limiter.acquire(*get_api_method(path))
         url = url or f"{self.base_url or BASE_URL}/{path}"
 
-        endpoint, kwargs["headers"] = kwargs.get("endpoint", None), kwargs.get("headers", {})
-        kwargs.pop("endpoint", None)
+        endpoint, stream_key = kwargs.pop("endpoint", None), kwargs.pop("stream_key", None)
+        decoder = kwargs.pop("decoder", loads)
+        if stream_key:
+            kwargs["stream"] = True
 
         kwargs["headers"]["Authorization"] = f"Bearer {self.__access_token}"
         if self.__user_agent:
@@ -111,14 +264,38 @@ class GoogleClient:  # pylint: disable=too-many-instance-attributes
         if method == "POST":
             kwargs["headers"]["Content-Type"] = "application/json"
 
-        with metrics.http_request_timer(endpoint) as timer:
-            response = self.__session.request(method, url, timeout=self.request_timeout, **kwargs)
-            timer.tags[metrics.Tag.http_status_code] = response.status_code
+        with ExitStack() as slot:
+            slot.enter_context(self.throttle.slot())
+            with metrics.http_request_timer(endpoint) as timer:
+                started = time.monotonic()
+                response = self.__session.request(method, url, timeout=self.request_timeout, **kwargs)
+                timer.tags[metrics.Tag.http_status_code] = response.status_code
 
-        if response.status_code != 200:
-            raise_for_error(response)
+            if response.status_code != 200:
+                try:
+                    raise_for_error(response)
+                except (GoogleRateLimitExceeded, GoogleQuotaExceededError) as err:
+                    self.throttle.on_throttled(type(err).__name__)
+                    raise
+
+            if stream_key:
+                # the slot is held until the body is read, handed over to the rows
+                rows = self.__stream_rows(response, stream_key, slot.pop_all(), time.monotonic() - started)
+                # started, so that the slot is also released if the rows are closed unread
+                next(rows)
+                return rows
+        self.throttle.on_success(time.monotonic() - started)
+        return decoder(response.content)
 
-        return response.json()
+    def __stream_rows(self, response, stream_key: str, slot: ExitStack, latency: float) -> Iterator:
+        """Yields the rows of a streamed response body, holding its
+        in-flight slot until the body is read. The latency recorded covers
+        the waits for the body, not the time the rows are consumed."""
+        timer = ReadTimer(latency)
+        with slot, response:
+            yield
+            yield from iter_response_rows(response, stream_key, timer)
+        self.throttle.on_success(timer.elapsed)
 
     def get(self, path: str, **kwargs) -> Any:
         """wrapper for get method."""
@@ -0,0 +1,96 @@
+import decimal
+import json
+from typing import Any, Callable, Dict, NamedTuple, Optional, Union
+
+import singer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+LOGGER = singer.get_logger()
+
+# preferred codecs first, `auto` picks the first one installed
+CODEC_PREFERENCE = ("orjson", "msgspec", "json")
+
+
+class JsonCodec(NamedTuple):
+    """JSON serialization functions of one library."""
+
+    name: str
+    dumps: Callable[[Any], str]
+    loads: Callable[[Union[bytes, str]], Any]
+
+
+def _default(obj: Any) -> Any:
+    """Serializes the types the fast codecs do not support natively."""
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _get_orjson_codec() -> JsonCodec:
+    return JsonCodec("orjson", lambda obj: orjson.dumps(obj, default=_default).decode("utf-8"), orjson.loads)
+
+
+def _get_msgspec_codec() -> JsonCodec:
+    encoder = msgspec.json.Encoder(enc_hook=_default, decimal_format="number")
+    decoder = msgspec.json.Decoder()
+    return JsonCodec("msgspec", lambda obj: encoder.encode(obj).decode("utf-8"), decoder.decode)
+
+
+def _get_json_codec() -> JsonCodec:
+    return JsonCodec("json", lambda obj: json.dumps(obj, default=_default), json.loads)
+
+
+CODEC_FACTORIES: Dict[str, Callable[[], JsonCodec]] = {
+    "orjson": _get_orjson_codec,
+    "msgspec": _get_msgspec_codec,
+    "json": _get_json_codec,
+}
+INSTALLED = {"orjson": orjson is not None, "msgspec": msgspec is not None, "json": True}
+
+
+def get_codec(name: Optional[str] = "auto") -> JsonCodec:
+    """Returns the named codec, or the fastest installed one for `auto`.
+
+    Falls back to the stdlib `json` module if the requested library is
+    not installed.
+    """
+    name = name or "auto"
+    if name == "auto":
+        name = next(codec for codec in CODEC_PREFERENCE if INSTALLED[codec])
+    if name not in CODEC_FACTORIES:
+        raise ValueError(f"Unknown json_codec {name}, expected one of auto, {', '.join(CODEC_PREFERENCE)}")
+    if not INSTALLED[name]:
+        LOGGER.warning(f"JSON codec {name} is not installed, falling back to json")
+        name = "json"
+    return CODEC_FACTORIES[name]()
+
+
+_codec = get_codec()
+
+
+def set_codec(name: Optional[str]) -> JsonCodec:
+    """Selects the codec used for request bodies, API responses and Singer
+    messages."""
+    global _codec  # pylint: disable=global-statement
+    _codec = get_codec(name)
+    LOGGER.info(f"Using the {_codec.name} JSON codec")
+    return _codec
+
+
+def dumps(obj: Any) -> str:
+    """Serializes to a JSON string with the selected codec."""
+    return _codec.dumps(obj)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Deserializes a JSON document with the selected codec."""
+    return _codec.loads(data)
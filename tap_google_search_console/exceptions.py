@@ -1,8 +1,15 @@
 import json
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from singer import utils
 
 
 class GoogleError(Exception):
-    pass
+    def __init__(self, *args, retry_after: Optional[float] = None):
+        super().__init__(*args)
+        # seconds to wait before retrying, as requested by the `Retry-After` response header
+        self.retry_after = retry_after
 
 
 class Server5xxError(GoogleError):
@@ -138,6 +145,22 @@ ERROR_CODE_EXCEPTION_MAPPING = {
 }
 
 
+def get_retry_after(response) -> Optional[float]:
+    """Returns the seconds to wait from the `Retry-After` header, given
+    either as seconds or as an HTTP date."""
+    value = (getattr(response, "headers", None) or {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - utils.now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
 def raise_for_error(response):
     """Forming a response message for raising custom exception"""
     try:
@@ -161,4 +184,4 @@ def raise_for_error(response):
         message = f"HTTP-error-code: {error_code}, Error: invalid_grant"
     else:
         ex = ERROR_CODE_EXCEPTION_MAPPING.get(error_code, {}).get("raise_exception", GoogleError)
-    raise ex(message) from None
+    raise ex(message, retry_after=get_retry_after(response)) from None
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import date
+from typing import Dict, Optional, Sequence, Tuple
+
+import singer
+
+LOGGER = singer.get_logger()
+
+
+def get_fingerprint(record: Dict, key_properties: Sequence[str]) -> str:
+    """Returns a hash of the values of the record other than its primary
+    key."""
+    values = {field: value for field, value in record.items() if field not in key_properties}
+    return hashlib.blake2b(json.dumps(values, sort_keys=True, default=str).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class FingerprintStore:
+    """Fingerprints of the records emitted by the previous runs, kept in a
+    SQLite database, so that the rows synced again unchanged are not
+    emitted again.
+
+    The fingerprints of a (stream, site, sub_type) unit are staged in
+    memory and only written by the `commit` of that unit, once its records
+    are emitted and its state flushed, so that an interrupted unit emits
+    its records again on the next run whatever the other units commit.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.expanduser(path)
+        self.__lock = threading.Lock()
+        # fingerprints not committed yet, by unit then key: (day, fingerprint)
+        self.__staged: Dict[Tuple[str, str, str], Dict[str, Tuple[str, str]]] = {}
+        self.__connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints (stream TEXT NOT NULL, key TEXT NOT NULL, site TEXT NOT NULL,"
+            " sub_type TEXT NOT NULL, day TEXT NOT NULL, fingerprint TEXT NOT NULL, PRIMARY KEY (stream, key))"
+        )
+        self.__connection.execute(
+            "CREATE INDEX IF NOT EXISTS fingerprints_day ON fingerprints (stream, site, sub_type, day)"
+        )
+        self.__connection.commit()
+
+    def is_changed(self, stream: str, record: Dict, key_properties: Sequence[str], replication_key: str) -> bool:
+        """Returns whether the record is new or changed since it was last
+        emitted, and stages its fingerprint for the `commit` of its unit."""
+        key = json.dumps([record.get(field) for field in key_properties], default=str)
+        fingerprint = get_fingerprint(record, key_properties)
+        with self.__lock:
+            staged = self.__staged.setdefault((stream, record.get("site_url"), record.get("search_type")), {})
+            if key in staged:
+                previous = staged[key][1]
+            else:
+                row = self.__connection.execute(
+                    "SELECT fingerprint FROM fingerprints WHERE stream = ? AND key = ?", (stream, key)
+                ).fetchone()
+                previous = row[0] if row else None
+            if previous == fingerprint:
+                return False
+            staged[key] = (str(record.get(replication_key))[:10], fingerprint)
+        return True
+
+    def prune(self, stream: str, site: str, sub_type: str, before: date) -> int:
+        """Drops the fingerprints of the days before `before`, never synced
+        again. Returns the number of fingerprints dropped."""
+        with self.__lock:
+            cursor = self.__connection.execute(
+                "DELETE FROM fingerprints WHERE stream = ? AND site = ? AND sub_type = ? AND day < ?",
+                (stream, site, sub_type, before.isoformat()),
+            )
+            self.__connection.commit()
+        return cursor.rowcount
+
+    def commit(self, stream: str, site: str, sub_type: str) -> None:
+        """Writes the fingerprints staged by a (stream, site, sub_type)
+        unit."""
+        with self.__lock:
+            staged = self.__staged.pop((stream, site, sub_type), {})
+            self.__connection.executemany(
+                "REPLACE INTO fingerprints (stream, key, site, sub_type, day, fingerprint) VALUES (?, ?, ?, ?, ?, ?)",
+                [(stream, key, site, sub_type, day, fingerprint) for key, (day, fingerprint) in staged.items()],
+            )
+            self.__connection.commit()
+
+    def close(self) -> None:
+        """Closes the database, dropping the fingerprints not committed."""
+        with self.__lock:
+            self.__connection.close()
+
+
+def get_fingerprint_store(db_path: Optional[str]) -> Optional[FingerprintStore]:
+    """Opens the fingerprint store if `db_path` is set."""
+    return FingerprintStore(db_path) if db_path else None
@@ -1,8 +1,9 @@
-from typing import Dict, List
+from typing import Any, Dict, Iterable, Iterator, List
 import hashlib
-import json
 import os
+import queue
 import re
+import threading
 from urllib.parse import quote
 
 import singer
@@ -10,6 +11,88 @@ import singer
 LOGGER = singer.get_logger()
 
 
+class CountingIterator:
+    """Iterator wrapper counting the items consumed from it."""
+
+    def __init__(self, iterable: Iterable) -> None:
+        self.iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self) -> "CountingIterator":
+        return self
+
+    def __next__(self) -> Any:
+        item = next(self.iterator)
+        self.count += 1
+        return item
+
+
+_PREFETCH_DONE = object()
+
+
+def prefetch(iterable: Iterable, depth: int) -> Iterator:
+    """Iterates `iterable` in a background thread, running up to `depth`
+    items ahead of the consumer, errors are raised to the consumer.
+
+    With a `depth` of 0 the iterable is consumed in the calling thread.
+    """
+    if depth <= 0:
+        yield from iterable
+        return
+    yield from interleave([iterable], depth)
+
+
+class _Producer:
+    """Iterates an iterable in a background thread, putting its items on
+    the queue shared with the consumer until it stops."""
+
+    def __init__(self, items: queue.Queue, stop: threading.Event) -> None:
+        self.items = items
+        self.stop = stop
+
+    def put(self, item: Any, error: BaseException = None) -> None:
+        while not self.stop.is_set():
+            try:
+                self.items.put((item, error), timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def run(self, iterable: Iterable) -> None:
+        try:
+            for item in iterable:
+                self.put(item)
+                if self.stop.is_set():
+                    return
+            self.put(_PREFETCH_DONE)
+        except BaseException as err:  # pylint: disable=broad-except
+            self.put(_PREFETCH_DONE, err)
+
+
+def interleave(iterables: List[Iterable], depth: int) -> Iterator:
+    """Iterates every iterable in its own background thread, and yields
+    their items as they are produced, up to `depth` items ahead of the
+    consumer. The items of one iterable keep their order, errors are
+    raised to the consumer."""
+    items, stop = queue.Queue(maxsize=max(depth, 1)), threading.Event()
+    producer = _Producer(items, stop)
+    for iterable in iterables:
+        threading.Thread(target=producer.run, args=(iterable,), name="gsc-prefetch", daemon=True).start()
+    try:
+        running = len(iterables)
+        while running:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _PREFETCH_DONE:
+                running -= 1
+                continue
+            yield item
+    finally:
+        # the consumer is done, possibly early, let the producers stop
+        stop.set()
+
+
 def get_abs_path(path: str):
     """Returns absolute path for URL."""
     return os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
@@ -58,16 +141,6 @@ def convert_json(data_object: Dict):
     return out
 
 
-def remove_keys_nodes(data_object: Dict, path: str):
-    """Remove `keys` node, if exists."""
-    idx = 0
-    for record in list(data_object[path]):
-        if record.get("keys", None):
-            data_object[path][idx].pop("keys")
-        idx = idx + 1
-    return data_object
-
-
 def hash_data(data):
     """Create MD5 hash key for data element Prepares the project id hash."""
     hash_id = hashlib.md5()
@@ -75,24 +148,6 @@ def hash_data(data):
     return hash_id.hexdigest()
 
 
-def denest_key_fields(data_object: Dict, stream_name: str, path: str, dimensions_list: List):
-    """Denest keys values list to dimension_list keys"""
-    idx = 0
-    for record in list(data_object[path]):
-        for key in list(record.keys()):
-            if isinstance(record[key], list) and key == "keys":
-                dim_num = 0
-                # Add dimensions_hash_key for performance_report_custom
-                if stream_name == "performance_report_custom":
-                    dims_md5 = str(hash_data(json.dumps(record[key], sort_keys=True)))
-                    data_object[path][idx]["dimensions_hash_key"] = dims_md5
-                for dimension in dimensions_list:
-                    data_object[path][idx][dimension] = record[key][dim_num]
-                    dim_num = dim_num + 1
-        idx = idx + 1
-    return data_object
-
-
 def add_site_url_search_type(data_object: Dict, path: str, site: str, key_name: str = "site_url"):
     """Adds site_url or Search_type key, value to each object
         Default of key_name is site_url"""
@@ -103,24 +158,10 @@ def add_site_url_search_type(data_object: Dict, path: str, site: str, key_name:
     return data_object
 
 
-def transform_reports(data_object: Dict, stream_name: str, path: str, site: str, sub_type: str, dimensions_list: List):
-    """de-nest keys array to dimension fields and add MD5 hash key for custom report"""
-    denested_json = denest_key_fields(data_object, stream_name, path, dimensions_list)
-    # remove keys array node
-    keyless_json = remove_keys_nodes(denested_json, path)
-    return add_site_url_search_type(add_site_url_search_type(keyless_json, path, site), path, sub_type,
-                                    key_name="search_type")
-
-
-def transform_json(data_object: Dict, stream_name: str, path: str = "", site: str = "",
-                   sub_type: str = "", dimensions_list: List = None):
+def transform_json(data_object: Dict, stream_name: str, path: str = "", site: str = ""):
     """Run all transforms: convert camelCase to snake_case for field_name keys,
-    and stream-specific transforms for sitemaps and performance_reports."""
-    dimensions_list = dimensions_list or []
+    and stream-specific transforms for sitemaps."""
     converted_json = convert_json(data_object)
     if stream_name == "sitemaps":
         return add_site_url_search_type(converted_json, path, site)
-    elif stream_name.startswith("performance_report"):
-        return transform_reports(converted_json, stream_name, path, site, sub_type, dimensions_list)
     return converted_json
-
@@ -0,0 +1,216 @@
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, TextIO, Union
+
+import singer
+
+from tap_google_search_console import codec
+
+LOGGER = singer.get_logger()
+
+# Singer messages are written to a single stdout stream, serialize access to it
+# (and to the shared state dict) so that messages from concurrent sync units never interleave.
+OUTPUT_LOCK = threading.RLock()
+
+# messages waiting to be written, producers block (backpressure) once the buffer is full
+OUTPUT_BUFFER_SIZE = 10000
+# messages serialized and written with a single write call
+OUTPUT_FLUSH_SIZE = 500
+# seconds a buffered message waits at most before being written
+OUTPUT_FLUSH_INTERVAL = 1.0
+
+# seconds between two coalesced STATE messages
+STATE_FLUSH_INTERVAL = 30.0
+# records written after which a STATE message is emitted regardless of the interval
+STATE_FLUSH_RECORDS = 50000
+
+_STOP = object()
+
+
+class BufferedWriter:
+    """Writes Singer messages from a dedicated thread.
+
+    Messages are handed over through a bounded queue, serialized in
+    batches and written with one write and flush per batch, so fetching
+    and writing overlap. A slow target fills the queue and blocks the
+    producers, the time they spend blocked is reported on close.
+    """
+
+    def __init__(
+        self,
+        stream: TextIO = None,
+        buffer_size: int = OUTPUT_BUFFER_SIZE,
+        flush_size: int = OUTPUT_FLUSH_SIZE,
+        flush_interval: float = OUTPUT_FLUSH_INTERVAL,
+    ) -> None:
+        self.stream = stream or sys.stdout
+        self.flush_size, self.flush_interval = max(flush_size, 1), flush_interval
+        self.queue = queue.Queue(maxsize=max(buffer_size, 1))
+        self.error: Optional[BaseException] = None
+        self.messages, self.blocked_seconds = 0, 0.0
+        self.thread = threading.Thread(target=self.run, name="gsc-output-writer", daemon=True)
+
+    def start(self) -> "BufferedWriter":
+        self.thread.start()
+        return self
+
+    def put(self, item: Union[singer.Message, str]) -> None:
+        """Queues a message, or an already serialized message line."""
+        if self.error:
+            raise self.error
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            started = time.monotonic()
+            self.queue.put(item)
+            self.blocked_seconds += time.monotonic() - started
+
+    def write_batch(self, batch: List[Union[singer.Message, str]]) -> None:
+        if not batch:
+            return
+        lines = [item if isinstance(item, str) else codec.dumps(item.asdict()) for item in batch]
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+        self.messages += len(batch)
+
+    def run(self) -> None:
+        batch, deadline = [], None
+        try:
+            while True:
+                timeout = None if not batch else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    self.write_batch(batch)
+                    return
+                if item is not None:
+                    batch.append(item)
+                    deadline = deadline if len(batch) > 1 else time.monotonic() + self.flush_interval
+                if len(batch) >= self.flush_size or (batch and time.monotonic() >= deadline):
+                    self.write_batch(batch)
+                    batch = []
+        except BaseException as err:  # pylint: disable=broad-except
+            self.error = err
+            # keep draining so that blocked producers wake up and see the error
+            while self.queue.get() is not _STOP:
+                pass
+
+    def close(self) -> None:
+        """Writes the remaining messages and stops the writer thread."""
+        self.queue.put(_STOP)
+        self.thread.join()
+        LOGGER.info(
+            f"Output writer wrote {self.messages} messages, producers blocked {self.blocked_seconds:.1f} seconds "
+            f"on a full buffer"
+        )
+        if self.error:
+            raise self.error
+
+
+_writer: Optional[BufferedWriter] = None
+
+
+@contextmanager
+def buffered_output(config: Dict) -> Iterator[BufferedWriter]:
+    """Routes all the Singer messages through a `BufferedWriter` for the
+    duration of the block, the buffer is flushed when leaving it."""
+    global _writer  # pylint: disable=global-statement
+    writer = BufferedWriter(
+        buffer_size=int(config.get("output_buffer_size") or OUTPUT_BUFFER_SIZE),
+        flush_size=int(config.get("output_flush_size") or OUTPUT_FLUSH_SIZE),
+        flush_interval=float(config.get("output_flush_interval") or OUTPUT_FLUSH_INTERVAL),
+    ).start()
+    _writer = writer
+    try:
+        yield writer
+    finally:
+        _writer = None
+        writer.close()
+
+
+def write_message(message: Union[singer.Message, str]) -> None:
+    """Writes a Singer message (or serialized message line) to stdout,
+    through the buffered writer when one is active."""
+    if _writer is not None:
+        _writer.put(message)
+        return
+    line = message if isinstance(message, str) else codec.dumps(message.asdict())
+    with OUTPUT_LOCK:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+def write_record(stream_name: str, record: Dict, time_extracted: datetime = None) -> None:
+    """Writes a single RECORD message."""
+    write_message(singer.RecordMessage(stream=stream_name, record=record, time_extracted=time_extracted))
+
+
+def write_schema(stream_name: str, schema: Dict, key_properties: List[str], bookmark_properties=None) -> None:
+    """Writes a SCHEMA message."""
+    if isinstance(key_properties, str):
+        key_properties = [key_properties]
+    if isinstance(bookmark_properties, str):
+        bookmark_properties = [bookmark_properties]
+    write_message(
+        singer.SchemaMessage(
+            stream=stream_name, schema=schema, key_properties=key_properties, bookmark_properties=bookmark_properties
+        )
+    )
+
+
+def write_state(state: Dict) -> None:
+    """Writes a STATE message, serialized right away since the state keeps
+    changing after the call."""
+    with OUTPUT_LOCK:
+        write_message(codec.dumps(singer.StateMessage(value=state).asdict()))
+
+
+class StateCheckpointer:
+    """Coalesces STATE messages.
+
+    Bookmark updates are only emitted once `interval` seconds have passed
+    or `records` records were written since the last STATE message, or
+    when flushed at the end of a unit. The state is serialized after the
+    records behind its bookmarks were queued, so an emitted bookmark never
+    gets ahead of the written records.
+    """
+
+    def __init__(self, interval: float = STATE_FLUSH_INTERVAL, records: int = STATE_FLUSH_RECORDS) -> None:
+        self.interval, self.records = interval, records
+        self.pending_records, self.dirty = 0, False
+        self.last_emitted = time.monotonic()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "StateCheckpointer":
+        interval = config.get("state_flush_interval")
+        records = config.get("state_flush_records")
+        return cls(
+            STATE_FLUSH_INTERVAL if interval in (None, "") else float(interval),
+            STATE_FLUSH_RECORDS if records in (None, "") else int(records),
+        )
+
+    def emit(self, state: Dict) -> None:
+        write_state(state)
+        self.pending_records, self.dirty = 0, False
+        self.last_emitted = time.monotonic()
+
+    def checkpoint(self, state: Dict, records: int = 0) -> None:
+        """Notes a bookmark update made after `records` more records were
+        written, emits the state if due."""
+        with OUTPUT_LOCK:
+            self.dirty = True
+            self.pending_records += records
+            if self.pending_records >= self.records or time.monotonic() - self.last_emitted >= self.interval:
+                self.emit(state)
+
+    def flush(self, state: Dict) -> None:
+        """Emits the state if it has unwritten bookmark updates."""
+        with OUTPUT_LOCK:
+            if self.dirty:
+                self.emit(state)
@@ -0,0 +1,141 @@
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import singer
+
+from tap_google_search_console.codec import dumps
+from tap_google_search_console.helpers import encode_and_format_url
+from tap_google_search_console.output import OUTPUT_LOCK
+from tap_google_search_console.rows import decode_report_page
+from tap_google_search_console.site_metadata import SiteMetadataCache
+from tap_google_search_console.windows import get_retention_start
+
+LOGGER = singer.get_logger()
+
+PROBE_PATH = "sites/{}/searchAnalytics/query"
+PROBE_ROW_LIMIT = 25000
+# consecutive runs a search type is found without data before it is skipped
+EMPTY_RUNS_BEFORE_SKIP = 3
+# days after which a skipped search type is probed again
+REPROBE_DAYS = 7
+# recent days probed for the latest finalized date of a site
+LATEST_DATE_PROBE_DAYS = 10
+# top pages sampled for the page prefixes the page reports are sharded by
+PAGE_PROBE_ROW_LIMIT = 1000
+
+
+def probe_data_dates(client, site: str, sub_type: str, start: date, end: date) -> List[date]:
+    """Returns the sorted days between `start` and `end` having (final)
+    data, with one date-only query."""
+    body = {
+        "type": sub_type,
+        "startDate": start.isoformat(),
+        "endDate": end.isoformat(),
+        "dimensions": ["date"],
+        "aggregationType": "auto",
+        "rowLimit": PROBE_ROW_LIMIT,
+    }
+    LOGGER.info(f"Probing the days with data of {site} {sub_type} between {body['startDate']} {body['endDate']}")
+    rows = client.post(
+        encode_and_format_url(site, PROBE_PATH), endpoint="data_probe", data=dumps(body), park_on_quota=True,
+        decoder=decode_report_page,
+    )
+    return sorted(date.fromisoformat(row.keys[0][:10]) for row in rows if row.keys)
+
+
+def update_sub_type_history(state: Dict, site: str, sub_type: str, has_data: bool, today: date) -> None:
+    """Counts the consecutive runs a search type was found without data."""
+    with OUTPUT_LOCK:
+        sites = state.setdefault("sub_type_history", {})
+        history = sites.get(site, {}).pop(sub_type, None)
+        if not has_data:
+            empty_runs = history["empty_runs"] + 1 if history else 1
+            sites.setdefault(site, {})[sub_type] = {"empty_runs": empty_runs, "probed_at": today.isoformat()}
+        if not sites.get(site, True):
+            del sites[site]
+        if not sites:
+            del state["sub_type_history"]
+
+
+def get_data_dates(
+    client, site_metadata: SiteMetadataCache, state: Dict, site: str, sub_type: str, today: date
+) -> List[date]:
+    """Returns the days with data of the (site, search type) over the
+    retention horizon, probed once per run for all the streams.
+
+    A search type found empty by `EMPTY_RUNS_BEFORE_SKIP` runs in a row is
+    not probed again, and taken as empty, until `REPROBE_DAYS` days after
+    its last probe. The history is kept in the state.
+    """
+
+    def load() -> List[date]:
+        with OUTPUT_LOCK:
+            history = state.get("sub_type_history", {}).get(site, {}).get(sub_type)
+        if (
+            history and history["empty_runs"] >= EMPTY_RUNS_BEFORE_SKIP and
+            (today - date.fromisoformat(history["probed_at"])).days < REPROBE_DAYS
+        ):
+            return []
+        dates = probe_data_dates(client, site, sub_type, get_retention_start(today), today)
+        update_sub_type_history(state, site, sub_type, bool(dates), today)
+        return dates
+
+    return site_metadata.get(site, ("data_dates", sub_type, today), load)
+
+
+def get_latest_date(client, site_metadata: SiteMetadataCache, site: str, today: date) -> Optional[date]:
+    """Returns the most recent day the site has finalized data for, probed
+    once per run over the last `LATEST_DATE_PROBE_DAYS` days, None if none
+    of them has data."""
+
+    def load() -> Optional[date]:
+        dates = probe_data_dates(client, site, "web", today - timedelta(days=LATEST_DATE_PROBE_DAYS), today)
+        LOGGER.info(f"Latest finalized date of {site}: {dates[-1] if dates else None}")
+        return dates[-1] if dates else None
+
+    return site_metadata.get(site, ("latest_date", today), load)
+
+
+def get_page_prefix(page: str) -> Optional[str]:
+    """Returns the first path segment of a page url, e.g.
+    `https://a.com/blog/` for `https://a.com/blog/post`, None for the pages
+    at the root of the site."""
+    scheme, _, rest = page.partition("://")
+    host, _, path = rest.partition("/")
+    segment, slash, _ = path.partition("/")
+    return f"{scheme}://{host}/{segment}/" if segment and slash else None
+
+
+def probe_page_prefixes(client, site: str, sub_type: str, start: date, end: date, count: int) -> List[str]:
+    """Returns up to `count` page prefixes having the most impressions
+    between `start` and `end`, among the top pages found with one query."""
+    body = {
+        "type": sub_type,
+        "startDate": start.isoformat(),
+        "endDate": end.isoformat(),
+        "dimensions": ["page"],
+        "rowLimit": PAGE_PROBE_ROW_LIMIT,
+    }
+    LOGGER.info(f"Probing the page prefixes of {site} {sub_type} between {body['startDate']} {body['endDate']}")
+    rows = client.post(
+        encode_and_format_url(site, PROBE_PATH), endpoint="page_probe", data=dumps(body), park_on_quota=True,
+        decoder=decode_report_page,
+    )
+    impressions = Counter()
+    for row in rows:
+        prefix = get_page_prefix(row.keys[0]) if row.keys else None
+        if prefix:
+            impressions[prefix] += row.impressions or 0
+    return [prefix for prefix, _ in impressions.most_common(count)]
+
+
+def get_page_prefixes(
+    client, site_metadata: SiteMetadataCache, site: str, sub_type: str, start: date, end: date, count: int
+) -> List[str]:
+    """Returns the page prefixes of the (site, search type), probed once
+    per run for all the streams."""
+    return site_metadata.get(
+        site, ("page_prefixes", sub_type, count),
+        lambda: probe_page_prefixes(client, site, sub_type, start, end, count),
+    )
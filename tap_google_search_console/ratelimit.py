@@ -0,0 +1,133 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+import singer
+
+LOGGER = singer.get_logger()
+
+SEARCH_ANALYTICS_METHOD = "searchAnalytics.query"
+DEFAULT_METHOD = "default"
+
+# Search Console usage limits in queries per minute, https://developers.google.com/webmaster-tools/limits
+# `project` limits are shared by every user of the Cloud project (OAuth client), `site` limits by every
+# request against one property and `method` limits by every request of the user for an API method.
+QUOTA_LIMITS = {
+    SEARCH_ANALYTICS_METHOD: {"project": 40000, "site": 1200, "method": 1200},
+    DEFAULT_METHOD: {"method": 200},
+}
+
+
+def get_api_method(path: Optional[str]) -> Tuple[Optional[str], str]:
+    """Returns the (site_url, API method) pair a request path is accounted
+    against."""
+    parts = (path or "").strip("/").split("/")
+    site = unquote(parts[1]) if len(parts) > 1 and parts[0] == "sites" else None
+    if (path or "").endswith("searchAnalytics/query"):
+        return site, SEARCH_ANALYTICS_METHOD
+    return site, DEFAULT_METHOD
+
+
+class MemoryBackend:
+    """Keeps the token buckets in process memory, shared by all threads."""
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__buckets: Dict[str, List[float]] = {}
+
+    def reserve(self, key: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        """Takes `tokens` from the bucket, returns the seconds to wait before
+        they are actually available."""
+        with self.__lock:
+            now = time.monotonic()
+            available, updated = self.__buckets.get(key, (capacity, now))
+            available = min(capacity, available + (now - updated) * rate) - tokens
+            self.__buckets[key] = [available, now]
+        return max(0.0, -available / rate)
+
+
+class SQLiteBackend:
+    """Keeps the token buckets in a SQLite database so that several tap
+    processes on one host share the same budget."""
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.expanduser(path)
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def reserve(self, key: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        """Takes `tokens` from the bucket within an exclusive transaction,
+        returns the seconds to wait before they are actually available."""
+        with self.__lock:
+            cursor = self.__connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = cursor.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                available, updated = row or (capacity, now)
+                available = min(capacity, available + max(0.0, now - updated) * rate) - tokens
+                cursor.execute("REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, available, now))
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        return max(0.0, -available / rate)
+
+    def close(self) -> None:
+        self.__connection.close()
+
+
+class RateLimiter:
+    """Thread safe token bucket rate limiter keyed by project, site and API
+    method.
+
+    Every request takes one token from each bucket it is accounted
+    against and sleeps until the most constrained bucket has refilled.
+    `scale` shrinks all the limits, it is adjusted at runtime by the
+    adaptive throttle.
+    """
+
+    def __init__(self, namespace: str = "", backend=None, limits: Dict = None) -> None:
+        self.namespace = namespace
+        self.backend = backend or MemoryBackend()
+        self.limits = limits or QUOTA_LIMITS
+        self.scale = 1.0
+
+    def get_buckets(self, site: Optional[str], api_method: str) -> List[Tuple[str, float]]:
+        """Returns the (key, queries per minute) of the buckets a request is
+        accounted against."""
+        limits = self.limits.get(api_method, self.limits[DEFAULT_METHOD])
+        buckets = []
+        if "project" in limits:
+            buckets.append((f"{self.namespace}:project:{api_method}", limits["project"]))
+        if "site" in limits and site:
+            buckets.append((f"{self.namespace}:site:{api_method}:{site}", limits["site"]))
+        if "method" in limits:
+            buckets.append((f"{self.namespace}:method:{api_method}", limits["method"]))
+        return buckets
+
+    def acquire(self, site: Optional[str] = None, api_method: str = DEFAULT_METHOD) -> float:
+        """Blocks until a request for the site and API method is allowed,
+        returns the time spent waiting."""
+        wait = 0.0
+        for key, queries_per_minute in self.get_buckets(site, api_method):
+            rate = queries_per_minute * self.scale / 60
+            # allow a burst of one second worth of requests
+            wait = max(wait, self.backend.reserve(key, rate, max(rate, 1.0)))
+        if wait > 0:
+            LOGGER.debug(f"Rate limit reached for {api_method} {site or ''}, sleeping {wait:.2f} seconds")
+            time.sleep(wait)
+        return wait
+
+
+def get_rate_limiter(namespace: str, db_path: Optional[str] = None) -> RateLimiter:
+    """Creates the rate limiter, shared through SQLite across processes if
+    `db_path` is set."""
+    backend = SQLiteBackend(db_path) if db_path else MemoryBackend()
+    return RateLimiter(namespace, backend)
@@ -0,0 +1,77 @@
+import random
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import singer
+
+LOGGER = singer.get_logger()
+
+
+def constant(interval: float) -> Callable[[int], float]:
+    """Waits the same interval before every retry."""
+    return lambda attempt: interval
+
+
+def expo(factor: float) -> Callable[[int], float]:
+    """Waits exponentially longer before every retry, with full jitter."""
+    return lambda attempt: random.uniform(0, factor * 2 ** (attempt - 1))  # nosec
+
+
+class RetryRule(NamedTuple):
+    """Retry behaviour for one category of errors."""
+
+    exceptions: Tuple[type, ...]
+    max_tries: int
+    wait: Callable[[int], float]
+    # errors of parkable rules are raised without waiting when the caller can continue with other work
+    parkable: bool = False
+    # attempts after which the error is raised to a caller able to split the request in smaller ones, 0 never
+    split_after: int = 0
+
+
+class RetryPolicy:
+    """Retries a call according to the first rule matching the raised error.
+
+    Every rule has its own attempt budget, a `retry_after` set on the
+    error (from the `Retry-After` response header) takes precedence over
+    the wait of the rule.
+    """
+
+    def __init__(self, *rules: RetryRule) -> None:
+        self.rules = rules
+
+    def get_rule(self, error: Exception) -> Optional[RetryRule]:
+        return next((rule for rule in self.rules if isinstance(error, rule.exceptions)), None)
+
+    def call(self, func: Callable, *args, park: bool = False, split: bool = False, **kwargs):
+        """Calls `func` and retries it on matching errors.
+
+        With `park` set, errors of parkable rules are raised at once
+        with their `retry_after` filled in, so that the caller can
+        resume the work later instead of blocking. With `split` set,
+        errors are raised after the `split_after` attempts of their rule,
+        so that the caller can split the request instead.
+        """
+        attempts: Dict[RetryRule, int] = {}
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as err:  # pylint: disable=broad-except
+                self.retry(err, attempts, park=park, split=split)
+
+    def retry(self, err: Exception, attempts: Dict[RetryRule, int], park: bool = False, split: bool = False) -> None:
+        """Waits before the next attempt after `err`, counted in
+        `attempts`, or raises it once it is not retried anymore."""
+        rule = self.get_rule(err)
+        if rule is None:
+            raise err
+        attempts[rule] = attempts.get(rule, 0) + 1
+        wait = getattr(err, "retry_after", None)
+        wait = rule.wait(attempts[rule]) if wait is None else wait
+        if rule.parkable and park:
+            err.retry_after = wait
+            raise err
+        if attempts[rule] >= rule.max_tries or (split and 0 < rule.split_after <= attempts[rule]):
+            raise err
+        LOGGER.info(f"Retrying {type(err).__name__} in {wait:.1f} seconds, attempt {attempts[rule]}")
+        time.sleep(wait)
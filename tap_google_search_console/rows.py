@@ -0,0 +1,219 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from singer import Transformer, metadata
+from singer.transform import string_to_datetime
+
+from tap_google_search_console import codec
+from tap_google_search_console.helpers import hash_data
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+Metric = Union[int, float, None]
+
+
+class _ReportRowMethods:
+    """Methods shared by both implementations of `ReportRow`."""
+
+    __slots__ = ()
+
+    def to_record(self, stream_name: str, site: str, sub_type: str, dimensions_list: Sequence[str]) -> Dict:
+        """Builds the record in its final output shape: the `keys` are de-
+        nested to the dimension fields, `site_url` and `search_type` are
+        added, plus `dimensions_hash_key` for the custom report."""
+        record = {"clicks": self.clicks, "impressions": self.impressions, "ctr": self.ctr, "position": self.position}
+        if self.keys:
+            # Add dimensions_hash_key for performance_report_custom
+            if stream_name == "performance_report_custom":
+                record["dimensions_hash_key"] = hash_data(json.dumps(list(self.keys), sort_keys=True))
+            record.update(zip(dimensions_list, self.keys))
+        record["site_url"], record["search_type"] = site, sub_type
+        return record
+
+
+if msgspec:
+
+    class ReportRow(msgspec.Struct, _ReportRowMethods, gc=False):
+        """One row of a performance report response, decoded straight from
+        the response body."""
+
+        keys: Tuple[str, ...] = ()
+        clicks: Metric = None
+        impressions: Metric = None
+        ctr: Metric = None
+        position: Metric = None
+
+    class _ReportPage(msgspec.Struct, gc=False):
+        rows: List[ReportRow] = []
+
+    _PAGE_DECODER = msgspec.json.Decoder(_ReportPage)
+
+else:
+
+    class ReportRow(_ReportRowMethods):
+        """One row of a performance report response."""
+
+        __slots__ = ("keys", "clicks", "impressions", "ctr", "position")
+
+        def __init__(
+            self,
+            keys: Tuple[str, ...] = (),
+            clicks: Metric = None,
+            impressions: Metric = None,
+            ctr: Metric = None,
+            position: Metric = None,
+        ) -> None:
+            self.keys, self.clicks, self.impressions, self.ctr, self.position = (
+                keys, clicks, impressions, ctr, position
+            )
+
+    _PAGE_DECODER = None
+
+
+def row_from_dict(row: Dict) -> ReportRow:
+    """Converts a row already parsed into a dict."""
+    return ReportRow(
+        tuple(row.get("keys") or ()), row.get("clicks"), row.get("impressions"), row.get("ctr"), row.get("position")
+    )
+
+
+def decode_report_page(content: Optional[bytes]) -> List[ReportRow]:
+    """Decodes the `rows` of a performance report response body into typed
+    rows, directly with msgspec when installed."""
+    if not content:
+        return []
+    if _PAGE_DECODER is not None:
+        return _PAGE_DECODER.decode(content).rows
+    data = codec.loads(content) or {}
+    return [row_from_dict(row) for row in data.get("rows", [])]
+
+
+# converters of the simple JSON schema types, singer's `Transformer` casts the same way
+TYPE_CONVERTERS = {"string": str, "integer": int, "number": float}
+METRICS = ("clicks", "impressions", "ctr", "position")
+
+
+def is_selected(stream_metadata: Dict, field: str) -> bool:
+    """Whether singer's `Transformer` keeps the field of a record given the
+    catalog metadata."""
+    breadcrumb = ("properties", field)
+    if metadata.get(stream_metadata, breadcrumb, "inclusion") == "automatic":
+        return True
+    return not (
+        metadata.get(stream_metadata, breadcrumb, "selected") is False or
+        metadata.get(stream_metadata, breadcrumb, "inclusion") == "unsupported"
+    )
+
+
+class RecordTransformer:
+    """Builds the final records of a performance report stream from typed
+    rows in a single pass.
+
+    Equivalent to `ReportRow.to_record` followed by singer's
+    `Transformer`: the selected fields and their converters are resolved
+    once from the schema and catalog metadata, the record builder once per
+    (site, search type, dimensions) and each date is formatted once. A
+    value the converters reject goes through singer's `Transformer`, which
+    raises the same error as before.
+    """
+
+    def __init__(self, stream_name: str, schema: Dict, stream_metadata: Dict) -> None:
+        self.stream_name, self.schema, self.stream_metadata = stream_name, schema, stream_metadata
+        self.dates: Dict[str, Optional[str]] = {}
+        self.builders: Dict[Tuple, Callable[[ReportRow], Dict]] = {}
+        properties = schema.get("properties", {})
+        self.converters = {
+            field: self.get_converter(properties[field])
+            for field in properties
+            if is_selected(stream_metadata, field)
+        }
+
+    @classmethod
+    def compile(cls, stream_name: str, schema: Dict, stream_metadata: Dict) -> Optional["RecordTransformer"]:
+        """Returns the transformer of the stream, None if its schema uses
+        types only singer's `Transformer` handles."""
+        properties = schema.get("properties")
+        if schema.get("type") not in ("object", ["null", "object"]) or not properties:
+            return None
+        if any(cls.get_converter(field_schema) is None for field_schema in properties.values()):
+            return None
+        return cls(stream_name, schema, stream_metadata)
+
+    @staticmethod
+    def get_converter(field_schema: Dict) -> Optional[Callable[[Any], Any]]:
+        """Returns the converter of a nullable simple type, or of a
+        date-time string."""
+        types = field_schema.get("type")
+        types = [types] if isinstance(types, str) else list(types or [])
+        if "anyOf" in field_schema or len([typ for typ in types if typ != "null"]) != 1:
+            return None
+        if field_schema.get("format") == "date-time":
+            return string_to_datetime
+        if field_schema.get("format"):
+            return None
+        return TYPE_CONVERTERS.get(next(typ for typ in types if typ != "null"))
+
+    def format_date(self, value: str) -> Optional[str]:
+        """Formats a date-time value like singer's `Transformer`, once per
+        distinct value."""
+        formatted = self.dates.get(value)
+        if formatted is None:
+            if value == "":
+                return None
+            formatted = string_to_datetime(value)
+            if formatted is None:
+                raise ValueError(f"Invalid date-time {value}")
+            self.dates[value] = formatted
+        return formatted
+
+    def get_builder(self, site: str, sub_type: str, dimensions: Sequence[str]) -> Callable[[ReportRow], Dict]:
+        """Returns the function building the records of the rows grouped by
+        `dimensions`."""
+        cache_key = (site, sub_type, tuple(dimensions))
+        builder = self.builders.get(cache_key)
+        if builder is not None:
+            return builder
+        converters = self.converters
+        metrics = [(index, field, converters[field]) for index, field in enumerate(METRICS) if field in converters]
+        keys = [
+            (index, field, self.format_date if converters[field] is string_to_datetime else converters[field])
+            for index, field in enumerate(dimensions)
+            if field in converters
+        ]
+        hash_key = self.stream_name == "performance_report_custom" and "dimensions_hash_key" in converters
+        constants = [
+            (field, converters[field](value))
+            for field, value in (("site_url", site), ("search_type", sub_type))
+            if field in converters
+        ]
+
+        def build(row: ReportRow) -> Dict:
+            values = (row.clicks, row.impressions, row.ctr, row.position)
+            record = {field: None if values[index] is None else convert(values[index])
+                      for index, field, convert in metrics}
+            row_keys = row.keys
+            if row_keys:
+                if hash_key:
+                    record["dimensions_hash_key"] = hash_data(json.dumps(list(row_keys), sort_keys=True))
+                for index, field, convert in keys:
+                    if index < len(row_keys):
+                        value = row_keys[index]
+                        record[field] = None if value is None else convert(value)
+            record.update(constants)
+            return record
+
+        self.builders[cache_key] = build
+        return build
+
+    def transform(self, row: ReportRow, site: str, sub_type: str, dimensions: Sequence[str]) -> Dict:
+        """Returns the selected, typed record of a row."""
+        try:
+            return self.get_builder(site, sub_type, dimensions)(row)
+        except (TypeError, ValueError):
+            with Transformer() as transformer:
+                return transformer.transform(
+                    row.to_record(self.stream_name, site, sub_type, dimensions), self.schema, self.stream_metadata
+                )
@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Hashable, List, NamedTuple, Union
+
+import singer
+
+from .exceptions import GoogleQuotaExceededError
+
+LOGGER = singer.get_logger()
+
+DEFAULT_MAX_WORKERS = 1
+# number of times a unit is parked on quota exhaustion before its error is raised
+MAX_PARKS = 3
+
+
+class WorkUnit(NamedTuple):
+    """An independent piece of sync work, e.g. one (site, sub_type) of a
+    performance report stream.
+
+    Units of the same `group` share a quota (e.g. a site), they are all
+    held back while one of them is parked.
+    """
+
+    key: Hashable
+    func: Callable[[], None]
+    group: Hashable = None
+
+
+def get_max_workers(value: Union[str, int, None]) -> int:
+    """Returns the configured worker count, falls back to the default for
+    empty or invalid values."""
+    try:
+        return max(int(value), 1) if value not in (None, "") else DEFAULT_MAX_WORKERS
+    except ValueError:
+        return DEFAULT_MAX_WORKERS
+
+
+class WorkScheduler:
+    """Runs work units on a bounded pool of worker threads.
+
+    A unit failing with a quota exceeded error is parked in a delayed
+    queue until its `retry_after` has elapsed and then run again, while
+    the units of other groups keep running. Units must therefore be
+    resumable, performance report units restart from their bookmark.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS) -> None:
+        self.max_workers = max_workers
+        self.__ready = deque()
+        self.__parked = []
+        self.__group_resume_at: Dict[Hashable, float] = {}
+        self.__parks: Dict[Hashable, int] = {}
+        self.__sequence = itertools.count()
+
+    def park(self, unit: WorkUnit, error: GoogleQuotaExceededError) -> bool:
+        """Parks the unit until its retry time, returns False once the unit
+        was parked too often."""
+        self.__parks[unit.key] = self.__parks.get(unit.key, 0) + 1
+        if self.__parks[unit.key] > MAX_PARKS:
+            return False
+        resume_at = time.monotonic() + (error.retry_after or 0)
+        if unit.group is not None:
+            self.__group_resume_at[unit.group] = max(self.__group_resume_at.get(unit.group, 0), resume_at)
+        heapq.heappush(self.__parked, (resume_at, next(self.__sequence), unit))
+        LOGGER.info(f"Quota exceeded for {unit.key}, parking it for {error.retry_after or 0:.0f} seconds")
+        return True
+
+    def next_ready(self) -> Union[WorkUnit, None]:
+        """Pops the first ready unit whose group is not held back."""
+        now = time.monotonic()
+        while self.__parked and self.__parked[0][0] <= now:
+            self.__ready.append(heapq.heappop(self.__parked)[2])
+        for unit in self.__ready:
+            if self.__group_resume_at.get(unit.group, 0) <= now:
+                self.__ready.remove(unit)
+                return unit
+        return None
+
+    def next_resume_in(self) -> float:
+        """Seconds until the next parked unit or held back group can
+        resume."""
+        now = time.monotonic()
+        times = [resume_at for resume_at, _, _ in self.__parked[:1]]
+        times += [self.__group_resume_at.get(unit.group, 0) for unit in self.__ready]
+        return max(0.0, min(times, default=now) - now)
+
+    def run(self, units: List[WorkUnit]) -> None:
+        """Runs all the units, raises the first error encountered after
+        cancelling the units which did not start yet."""
+        self.__ready.extend(units)
+        if self.max_workers > 1 and len(units) > 1:
+            LOGGER.info(f"Running {len(units)} work units with {self.max_workers} workers")
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gsc-worker") as executor:
+            while self.__ready or self.__parked or running:
+                unit = self.next_ready() if len(running) < self.max_workers else None
+                while unit is not None:
+                    running[executor.submit(unit.func)] = unit
+                    unit = self.next_ready() if len(running) < self.max_workers else None
+
+                if not running:
+                    time.sleep(self.next_resume_in())
+                    continue
+
+                # with a free worker, wake up when the next parked unit can resume
+                has_waiting = self.__ready or self.__parked
+                timeout = self.next_resume_in() if has_waiting and len(running) < self.max_workers else None
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    unit, error = running.pop(future), future.exception()
+                    if error is None:
+                        continue
+                    if isinstance(error, GoogleQuotaExceededError) and self.park(unit, error):
+                        continue
+                    for pending in running:
+                        pending.cancel()
+                    raise error
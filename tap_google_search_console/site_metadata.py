@@ -0,0 +1,27 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class SiteMetadataCache:
+    """Facts learned about the sites during a run (days with data, page
+    prefixes, ...), shared by all the streams of the run.
+
+    The first stream needing a fact loads it, the later ones read it, a
+    fact is loaded only once even when requested by concurrent units.
+    """
+
+    def __init__(self) -> None:
+        self.values: Dict[Tuple[str, Hashable], Any] = {}
+        self.locks: Dict[Tuple[str, Hashable], threading.Lock] = {}
+        self.lock = threading.Lock()
+
+    def get(self, site: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Returns the fact `key` of the site, loaded with `loader` if not
+        known yet."""
+        cache_key = (site, key)
+        with self.lock:
+            key_lock = self.locks.setdefault(cache_key, threading.Lock())
+        with key_lock:
+            if cache_key not in self.values:
+                self.values[cache_key] = loader()
+            return self.values[cache_key]
@@ -0,0 +1,125 @@
+import codecs
+import json
+import time
+from typing import Any, Dict, Iterator, Optional
+
+DECODER = json.JSONDecoder()
+WHITESPACE = " \t\n\r"
+CHUNK_SIZE = 64 * 1024
+
+
+class _TextBuffer:
+    """Text decoded incrementally from a stream of byte chunks, consumed from
+    the left."""
+
+    def __init__(self, chunks: Iterator[bytes]) -> None:
+        self.chunks = chunks
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text, self.pos, self.eof = "", 0, False
+
+    def fill(self) -> bool:
+        """Reads the next chunk, returns False at the end of the stream."""
+        if self.eof:
+            return False
+        # drop the consumed text so that the buffer stays around one chunk in size
+        self.text, self.pos = self.text[self.pos:], 0
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            self.text += self.decoder.decode(b"", final=True)
+            return False
+        self.text += self.decoder.decode(chunk)
+        return True
+
+    def peek(self) -> str:
+        """Returns the next non whitespace character without consuming it,
+        empty at the end of the stream."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text) or not self.fill():
+                return self.text[self.pos:self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        """Consumes the next non whitespace character, which must be one of
+        `chars`."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Invalid JSON stream, expected one of {chars!r} but found {char!r}")
+        self.pos += 1
+        return char
+
+    def decode_value(self) -> Any:
+        """Decodes the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.text, self.pos)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_json_array(chunks: Iterator[bytes], key: str, fields: Optional[Dict] = None) -> Iterator[Any]:
+    """Yields the elements of the array under `key` of a JSON object one at a
+    time, as they are read from the byte chunks.
+
+    Only one element is held in memory at a time, the other members of
+    the object are collected into `fields` if given.
+    """
+    buffer = _TextBuffer(iter(chunks))
+    if not buffer.peek():
+        return
+    buffer.expect("{")
+    if buffer.peek() == "}":
+        return
+    while True:
+        name = buffer.decode_value()
+        buffer.expect(":")
+        if name == key and buffer.peek() == "[":
+            buffer.expect("[")
+            if buffer.peek() == "]":
+                buffer.expect("]")
+            else:
+                while True:
+                    yield buffer.decode_value()
+                    if buffer.expect(",]") == "]":
+                        break
+        else:
+            value = buffer.decode_value()
+            if fields is not None:
+                fields[name] = value
+        if buffer.expect(",}") == "}":
+            return
+
+
+class ReadTimer:
+    """Time spent waiting on the chunks of a response body, not counting
+    the time its rows are consumed."""
+
+    def __init__(self, elapsed: float = 0.0) -> None:
+        self.elapsed = elapsed
+
+    def iter_chunks(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        while True:
+            started = time.monotonic()
+            chunk = next(chunks, None)
+            self.elapsed += time.monotonic() - started
+            if chunk is None:
+                return
+            yield chunk
+
+
+def iter_response_rows(response, key: str, timer: Optional[ReadTimer] = None) -> Iterator[Any]:
+    """Streams the rows of a `requests` response opened with `stream=True`,
+    the response is closed once the rows are consumed."""
+    try:
+        chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+        yield from iter_json_array(timer.iter_chunks(chunks) if timer else chunks, key)
+    finally:
+        response.close()
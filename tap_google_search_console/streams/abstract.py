@@ -1,24 +1,69 @@
-import json
+import functools
+import itertools
 from abc import ABC, abstractmethod
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Union
-
-from singer import (
-    Transformer,
-    metadata,
-    metrics,
-    should_sync_field,
-    utils,
-    write_record,
-    write_state,
-)
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from singer import Transformer, metadata, metrics, should_sync_field, utils
 from singer.logger import get_logger
 from singer.metadata import get_standard_metadata
 
-from tap_google_search_console.helpers import encode_and_format_url, transform_json
+from tap_google_search_console.client import SPLITTABLE_ERRORS
+from tap_google_search_console.codec import dumps
+from tap_google_search_console.fingerprints import FingerprintStore
+from tap_google_search_console.helpers import CountingIterator, encode_and_format_url, interleave, prefetch
+from tap_google_search_console.output import (
+    OUTPUT_LOCK,
+    StateCheckpointer,
+    write_record,
+)
+from tap_google_search_console.probes import get_data_dates, get_latest_date, get_page_prefixes
+from tap_google_search_console.rows import RecordTransformer, ReportRow, decode_report_page, row_from_dict
+from tap_google_search_console.scheduler import (
+    WorkScheduler,
+    WorkUnit,
+    get_max_workers,
+)
+from tap_google_search_console.site_metadata import SiteMetadataCache
+from tap_google_search_console.windows import (
+    DateWindow,
+    SplitBudget,
+    get_adaptive_window_size,
+    get_filter_shards,
+    get_max_rows,
+    get_prefix_shards,
+    get_retention_start,
+    plan_windows,
+    split_filters,
+    split_window,
+    update_row_density,
+)
 
 LOGGER = get_logger()
 
+DEFAULT_PREFETCH_PAGES = 1
+# most rows held by prefetched pages of a (site, sub_type) unit
+MAX_PREFETCH_ROWS = 100000
+# days per window of the fresh data lane, one day of partial data is small and becomes final the soonest
+FRESH_WINDOW_SIZE = 1
+# days the request sizes a failing request was split to are used for, the larger requests are tried again after
+REQUEST_LIMITS_TTL_DAYS = 7
+
+
+class ReportPage(NamedTuple):
+    """One fetched page of a performance report window."""
+
+    window: DateWindow
+    offset: int
+    row_limit: int
+    dimensions: List[str]
+    rows: Iterable[ReportRow]
+    time_extracted: datetime
+    # dimension filters of a window split on failures
+    filters: Tuple[Dict, ...] = ()
+    # part of a window split in smaller requests, the window is resumed at its start
+    split: bool = False
+
 
 class BaseStream(ABC):
     """Base class representing generic stream methods and meta-attributes."""
@@ -63,9 +108,16 @@ class BaseStream(ABC):
     def sync(self, state: Dict, schema: Dict, stream_metadata: Dict):
         """Performs Sync."""
 
-    def __init__(self, client=None, config=None) -> None:
+    def __init__(
+        self, client=None, config=None, site_metadata: SiteMetadataCache = None,
+        fingerprints: FingerprintStore = None,
+    ) -> None:
         self.client = client
         self.config = config
+        # facts about the sites shared by the streams of a run
+        self.site_metadata = site_metadata or SiteMetadataCache()
+        # fingerprints of the records emitted by the previous runs, if enabled
+        self.fingerprints = fingerprints
 
     @classmethod
     def get_metadata(cls, schema) -> Dict[str, str]:
@@ -90,16 +142,21 @@ class IncrementalTableStream(BaseStream, ABC):
     replication_key = "date"
     pagination = "body"
     sub_types = ["discover", "googleNews", "image", "news", "video", "web"]
-    row_limit = 10000
+    # most rows the API returns per request
+    row_limit = 25000
     path = "sites/{}/searchAnalytics/query"
     data_key = "rows"
-    now_dt_tm = utils.now()
     dimension_list = []
     body_params = {}
 
-    # declaring this variable to keep track of number of
-    # records processed per stream, per site, per sub_type
-    records_extracted = 0
+    def __init__(
+        self, client=None, config=None, site_metadata: SiteMetadataCache = None,
+        fingerprints: FingerprintStore = None,
+    ) -> None:
+        super().__init__(client, config, site_metadata, fingerprints)
+        # evaluated per sync, not once when the module is imported
+        self.now_dt_tm = utils.now()
+        self.checkpointer = StateCheckpointer.from_config(config or {})
 
     @staticmethod
     def get_bookmark(state: Dict, stream: str, site: str, sub_type: str, default: str) -> str:
@@ -112,43 +169,272 @@ class IncrementalTableStream(BaseStream, ABC):
 
     @property
     def get_attribution_days(self) -> Union[str, int]:
-        """Sets this value to 4days since there is data delay of 2-3 days from GSC"""
-        return int(self.config.get("ATTRIBUTION_DAYS") or 4)
+        """Days re-synced before the end of the range. Defaults to 4 days
+        since there is data delay of 2-3 days from GSC, or to none when the
+        range ends at the latest finalized date."""
+        value = self.config.get("ATTRIBUTION_DAYS")
+        if value in (None, ""):
+            return 0 if self.probe_data_availability else 4
+        return int(value)
 
     @property
     def get_date_window_size(self) -> Union[str, int]:
         return int(self.config.get("DATE_WINDOW_SIZE") or 30)
 
-    def write_bookmark(self, state: Dict, site: str, sub_type: str, value: str) -> None:
-        """Writes bookmark to state file for a given stream, site, sub_type."""
-        if "bookmarks" not in state:
-            state["bookmarks"] = {}
-        if self.tap_stream_id not in state["bookmarks"]:
-            state["bookmarks"][self.tap_stream_id] = {}
-        if site not in state["bookmarks"][self.tap_stream_id]:
-            state["bookmarks"][self.tap_stream_id][site] = {}
-        state["bookmarks"][self.tap_stream_id][site][sub_type] = value
-        LOGGER.info(f"Write state for Stream: {self.tap_stream_id}, Site: {site}, Type: {sub_type}, value: {value}")
-        write_state(state)
-
-    def set_start_and_end_times(self, state: Dict, stream: str, sub_type: str, site: str) -> Tuple[datetime, datetime]:
-        """Method to set start and end times."""
-        # get the bookmark from state file
-        report_bookmark = self.get_bookmark(state, stream, site, sub_type, self.config.get("start_date"))
-        reports_dt_tm = utils.strptime_to_utc(report_bookmark)
+    @property
+    def stream_responses(self) -> bool:
+        """Whether report responses are parsed incrementally instead of being
+        loaded at once."""
+        return str(self.config.get("stream_responses", "")).lower() in ("true", "1")
 
-        delta_days = (self.now_dt_tm - reports_dt_tm).days
+    @property
+    def get_target_rows_per_request(self) -> int:
+        """Number of rows the adaptive date windows aim at, 0 keeps the
+        fixed `DATE_WINDOW_SIZE`."""
+        return int(self.config.get("target_rows_per_request") or 0)
 
-        if delta_days < self.get_attribution_days:
-            start_dt_tm = self.now_dt_tm - timedelta(days=self.get_attribution_days)
-        else:
-            start_dt_tm = reports_dt_tm
+    @property
+    def get_prefetch_pages(self) -> int:
+        """Number of pages fetched ahead of the one being written, bounded
+        to `MAX_PREFETCH_ROWS` rows held in memory. Pages streamed off the
+        socket are not prefetched."""
+        if self.stream_responses:
+            return 0
+        value = self.config.get("prefetch_pages")
+        pages = DEFAULT_PREFETCH_PAGES if value in (None, "") else int(value)
+        return max(0, min(pages, MAX_PREFETCH_ROWS // self.row_limit))
 
-        end_dt_tm = start_dt_tm + timedelta(days=self.get_date_window_size)
-        if end_dt_tm > self.now_dt_tm:
-            end_dt_tm = self.now_dt_tm
+    @property
+    def probe_data_start(self) -> bool:
+        """Whether the first sync of a (site, sub_type) starts at its first
+        day with data, found with a date-only query."""
+        return str(self.config.get("probe_data_start", "true")).lower() not in ("false", "0")
 
-        return start_dt_tm, end_dt_tm
+    @property
+    def probe_data_availability(self) -> bool:
+        """Whether the range ends at the latest finalized date of the site,
+        found with a date-only query, instead of today."""
+        return str(self.config.get("probe_data_availability", "true")).lower() not in ("false", "0")
+
+    @property
+    def prune_sub_types(self) -> bool:
+        """Whether the sub_types without data are skipped, as found by a
+        date-only query shared by the streams."""
+        return str(self.config.get("prune_sub_types", "true")).lower() not in ("false", "0")
+
+    @property
+    def checkpoint_pages(self) -> bool:
+        """Whether the window and offset of the page being synced are kept in
+        the state, so that an interrupted unit resumes at that page."""
+        return str(self.config.get("checkpoint_pages", "")).lower() in ("true", "1")
+
+    @property
+    def fresh_data(self) -> bool:
+        """Whether the days after the latest finalized date are also synced,
+        with their fresh but not yet final data."""
+        return str(self.config.get("fresh_data", "")).lower() in ("true", "1")
+
+    @property
+    def get_report_shards(self) -> int:
+        """Number of disjoint shards the windows of unbounded reports (by
+        query or page) are split in and fetched concurrently, 0 disables
+        sharding."""
+        return int(self.config.get("report_shards") or 0)
+
+    @property
+    def split_failed_requests(self) -> bool:
+        """Whether requests failing with repeated timeouts or 5xx errors are
+        split in smaller ones."""
+        return str(self.config.get("split_failed_requests", "true")).lower() not in ("false", "0")
+
+    @property
+    def get_max_workers(self) -> int:
+        """Number of (site, sub_type) units synced concurrently, defaults to
+        1."""
+        return get_max_workers(self.config.get("max_workers"))
+
+    def get_row_density(self, state: Dict, site: str, sub_type: str) -> Optional[float]:
+        """Returns the rows per day observed for a (site, sub_type) by the
+        previous windows."""
+        return state.get("row_density", {}).get(self.tap_stream_id, {}).get(site, {}).get(sub_type)
+
+    def write_row_density(self, state: Dict, site: str, sub_type: str, rows: int, days: int) -> None:
+        """Records the rows per day observed over a window."""
+        with OUTPUT_LOCK:
+            sites = state.setdefault("row_density", {}).setdefault(self.tap_stream_id, {})
+            density = update_row_density(self.get_row_density(state, site, sub_type), rows, days)
+            sites.setdefault(site, {})[sub_type] = round(density, 3)
+
+    def get_request_limits(self, state: Dict, site: str, sub_type: str) -> Dict:
+        """Returns the request sizes a (site, sub_type) had to be split to,
+        `max_days` per window and `filter_splits` per day, unless recorded
+        more than `REQUEST_LIMITS_TTL_DAYS` days ago."""
+        expiry = (self.now_dt_tm.date() - timedelta(days=REQUEST_LIMITS_TTL_DAYS)).isoformat()
+        with OUTPUT_LOCK:
+            limits = state.get("request_limits", {}).get(self.tap_stream_id, {}).get(site, {}).get(sub_type, {})
+            return dict(limits) if limits.get("since", "") > expiry else {}
+
+    def write_request_limits(
+        self, state: Dict, site: str, sub_type: str, max_days: int = None, filter_splits: int = None
+    ) -> None:
+        """Records the size of a request that succeeded once a larger one
+        failed, removes the expired limits if neither is given."""
+        with OUTPUT_LOCK:
+            limits = self.get_request_limits(state, site, sub_type)
+            streams = state.setdefault("request_limits", {})
+            sites = streams.setdefault(self.tap_stream_id, {})
+            if max_days is not None or filter_splits is not None:
+                if max_days is not None:
+                    limits["max_days"] = min(max_days, limits.get("max_days", max_days))
+                if filter_splits is not None:
+                    limits["filter_splits"] = max(filter_splits, limits.get("filter_splits", filter_splits))
+                # kept from the first success, so that the larger requests are tried again once it expires
+                limits.setdefault("since", self.now_dt_tm.date().isoformat())
+                sites.setdefault(site, {})[sub_type] = limits
+                return
+            if not limits:
+                sites.get(site, {}).pop(sub_type, None)
+            if not sites.get(site, True):
+                del sites[site]
+            if not sites:
+                del streams[self.tap_stream_id]
+            if not streams:
+                del state["request_limits"]
+
+    def get_window_size(self, state: Dict, site: str, sub_type: str) -> int:
+        """Returns the number of days of the next date window, sized from
+        the row density to hold `target_rows_per_request` rows if set, and
+        at most the days a failing window had to be split to."""
+        size = get_adaptive_window_size(
+            self.get_row_density(state, site, sub_type), self.get_target_rows_per_request, self.get_date_window_size
+        )
+        return min(size, self.get_request_limits(state, site, sub_type).get("max_days", size))
+
+    def get_page_checkpoint(self, state: Dict, site: str, sub_type: str) -> Optional[Dict]:
+        """Returns the window and page offset a (site, sub_type) unit was
+        syncing, if it was interrupted."""
+        units = state.get("currently_syncing_units", {}).get(self.tap_stream_id, {})
+        return units.get(site, {}).get(sub_type)
+
+    def write_page_checkpoint(self, state: Dict, site: str, sub_type: str, page: Optional[Dict]) -> None:
+        """Records the window and page offset a (site, sub_type) unit is
+        syncing, removes it once the unit is done."""
+        if not self.checkpoint_pages:
+            return
+        with OUTPUT_LOCK:
+            units = state.setdefault("currently_syncing_units", {})
+            sites = units.setdefault(self.tap_stream_id, {})
+            if page is not None:
+                sites.setdefault(site, {})[sub_type] = page
+                return
+            sites.get(site, {}).pop(sub_type, None)
+            if not sites.get(site, True):
+                del sites[site]
+            if not sites:
+                del units[self.tap_stream_id]
+            if not units:
+                del state["currently_syncing_units"]
+
+    def get_provisional_days(self, state: Dict, site: str, sub_type: str) -> Optional[Dict]:
+        """Returns the days of a (site, sub_type) synced with fresh data, not
+        yet synced again once final."""
+        return state.get("provisional_days", {}).get(self.tap_stream_id, {}).get(site, {}).get(sub_type)
+
+    def write_provisional_days(self, state: Dict, site: str, sub_type: str, days: Optional[Dict]) -> None:
+        """Records the days of a (site, sub_type) synced with fresh data,
+        removes them once they are all final."""
+        with OUTPUT_LOCK:
+            streams = state.setdefault("provisional_days", {})
+            sites = streams.setdefault(self.tap_stream_id, {})
+            if days is not None:
+                sites.setdefault(site, {})[sub_type] = days
+                return
+            sites.get(site, {}).pop(sub_type, None)
+            if not sites.get(site, True):
+                del sites[site]
+            if not sites:
+                del streams[self.tap_stream_id]
+            if not streams:
+                del state["provisional_days"]
+
+    def finalize_provisional_days(self, state: Dict, site: str, sub_type: str, end_date: date) -> None:
+        """Drops the provisional days up to `end_date`, synced again with
+        their final data."""
+        provisional = self.get_provisional_days(state, site, sub_type)
+        if not provisional or date.fromisoformat(provisional["start_date"]) > end_date:
+            return
+        if date.fromisoformat(provisional["end_date"]) <= end_date:
+            self.write_provisional_days(state, site, sub_type, None)
+        else:
+            self.write_provisional_days(
+                state, site, sub_type, {**provisional, "start_date": (end_date + timedelta(days=1)).isoformat()}
+            )
+
+    def write_bookmark(self, state: Dict, site: str, sub_type: str, value: str, records: int = 0) -> None:
+        """Writes bookmark to state file for a given stream, site, sub_type,
+        the STATE message is emitted by the checkpointer once due."""
+        with OUTPUT_LOCK:
+            if "bookmarks" not in state:
+                state["bookmarks"] = {}
+            if self.tap_stream_id not in state["bookmarks"]:
+                state["bookmarks"][self.tap_stream_id] = {}
+            if site not in state["bookmarks"][self.tap_stream_id]:
+                state["bookmarks"][self.tap_stream_id][site] = {}
+            state["bookmarks"][self.tap_stream_id][site][sub_type] = value
+            LOGGER.info(
+                f"Write state for Stream: {self.tap_stream_id}, Site: {site}, Type: {sub_type}, value: {value}"
+            )
+            self.checkpointer.checkpoint(state, records)
+
+    def get_sync_range(
+        self, state: Dict, stream: str, sub_type: str, site: str, prune: bool = True
+    ) -> Tuple[date, date]:
+        """Returns the inclusive range of days to sync, from the bookmark (or
+        the attribution days lookback, if earlier) up to today.
+
+        With `probe_data_availability` the range ends at the latest
+        finalized date of the site instead, and starts the day after the
+        bookmark since finalized days never change. Days synced with fresh
+        data are synced again, once final. The range never starts before the data
+        retention horizon, nor on a first sync, before the first day with
+        data. It is empty for a pruned sub_type without data since its
+        start.
+        """
+        # get the bookmark from state file
+        report_bookmark = self.get_bookmark(state, stream, site, sub_type, None)
+        today = end_date = self.now_dt_tm.date()
+        if self.probe_data_availability:
+            end_date = get_latest_date(self.client, self.site_metadata, site, today) or today
+        start_date = utils.strptime_to_utc(report_bookmark or self.config.get("start_date")).date()
+        if report_bookmark and self.probe_data_availability:
+            start_date += timedelta(days=1)
+        provisional = self.get_provisional_days(state, site, sub_type)
+        if provisional:
+            # the finalization pass, the final rows replace the fresh ones
+            start_date = min(start_date, date.fromisoformat(provisional["start_date"]))
+        if self.get_attribution_days:
+            start_date = min(start_date, end_date - timedelta(days=self.get_attribution_days))
+        start_date = max(start_date, get_retention_start(today))
+        if (report_bookmark is None and self.probe_data_start) or (prune and self.prune_sub_types):
+            data_dates = get_data_dates(self.client, self.site_metadata, state, site, sub_type, today)
+            data_dates = [day for day in data_dates if day >= start_date]
+            if not data_dates:
+                LOGGER.info(f"No data for {site} {sub_type} since {start_date}")
+                return start_date, start_date - timedelta(days=1)
+            if report_bookmark is None:
+                start_date = data_dates[0]
+        return start_date, end_date
+
+    def get_pinned_sub_types(self, stream_metadata: Dict) -> Optional[List[str]]:
+        """Returns the sub_types pinned with the `sub_types` stream metadata,
+        they are always synced."""
+        pinned = metadata.get(stream_metadata, (), "sub_types")
+        if pinned is None:
+            return None
+        unknown = set(pinned) - set(self.sub_types)
+        if unknown:
+            LOGGER.warning(f"Ignoring the unknown sub_types {sorted(unknown)} pinned for {self.tap_stream_id}")
+        return [sub_type for sub_type in self.sub_types if sub_type in pinned]
 
     def set_dimensions_in_payload(self, stream_metadata: Dict) -> List:
         """Set only the selected (field selection) dimensions in API
@@ -164,25 +450,29 @@ class IncrementalTableStream(BaseStream, ABC):
 
     def make_payload(self, sub_type: str, start_date: str, end_date: str, stream_metadata: Dict) -> Dict:
         """Creates payload for POST API Call."""
+        # Work on a copy, `body_params` is a class attribute shared by concurrently synced sub_types
+        body_params = dict(self.body_params)
+        if "dimensions" in body_params:
+            body_params["dimensions"] = list(body_params["dimensions"])
         if self.tap_stream_id == "performance_report_custom":
-            self.body_params["dimensions"] = self.set_dimensions_in_payload(stream_metadata)
+            body_params["dimensions"] = self.set_dimensions_in_payload(stream_metadata)
             # Remove discover dimension from dimension_list if sub_type is discover
             # Requests for Discover cannot be grouped by device
-            if sub_type == "discover" and "device" in self.body_params["dimensions"]:
+            if sub_type == "discover" and "device" in body_params["dimensions"]:
                 LOGGER.info(f"Removing the device dimension/field since it is incompatible with"
                             f" {sub_type} sub_type for custom report")
-                self.body_params["dimensions"].remove("device")
+                body_params["dimensions"].remove("device")
         if sub_type in {"discover", "googleNews"}:
-            self.body_params["aggregationType"] = "auto"
+            body_params["aggregationType"] = "auto"
             # Remove query from dimension list if the sub_type is either discover or googleNews
             # query seems to be an invalid argument while grouping data for discover and googleNews
             if self.tap_stream_id == "performance_report_custom" and \
-                    "query" in self.body_params["dimensions"]:
+                    "query" in body_params["dimensions"]:
                 LOGGER.info(f"Removing the query dimension/field since it is incompatible with"
                             f" {sub_type} sub_type for custom report")
-                self.body_params["dimensions"].remove("query")
+                body_params["dimensions"].remove("query")
 
-        return {"type": sub_type, "startDate": start_date, "endDate": end_date, **self.body_params}
+        return {"type": sub_type, "startDate": start_date, "endDate": end_date, **body_params}
 
     def validate_keys_in_data(self, extracted_data: List) -> None:
         """Validates the data by checking the primary keys in extracted
@@ -193,147 +483,448 @@ class IncrementalTableStream(BaseStream, ABC):
                     primary_keys_only = {id_field: record.get(id_field) for id_field in self.key_properties}
                     raise ValueError(f"Missing key {key} in record with primary keys {primary_keys_only}")
 
-    def modify_start_end_dt_tm(self, end_dt_tm: datetime) -> Tuple[datetime, datetime]:
-        """Sets start_date_time of a new window to end_date_time of old window
-        Sets end_date_time of new window to 30 days(date_window_size) ahead
-        since start_date_time."""
-        start_dt_tm = end_dt_tm
-        end_dt_tm = start_dt_tm + timedelta(days=self.get_date_window_size)
-        if end_dt_tm > self.now_dt_tm:
-            end_dt_tm = self.now_dt_tm
-        return start_dt_tm, end_dt_tm
-
     def process_records(
         self,
         schema: Dict,
         stream_metadata: Dict,
-        records: List,
+        records: Iterable[Dict],
         time_extracted: datetime,
         max_bookmark_value=None,
-        last_datetime=None,
-    ) -> str:
+        transformed: bool = False,
+    ) -> Tuple[str, int]:
         """Filters out the unselected fields by the user Picks the latest
-        bookmark value from extracted data Writes the records to stdout."""
+        bookmark value from extracted data Writes the records to stdout,
+        except the ones unchanged since emitted by a previous run if
+        fingerprints are kept. Returns the new bookmark value and the
+        number of records written.
 
+        `transformed` records were already built by a
+        `RecordTransformer`, they skip singer's `Transformer`.
+        """
+
+        unchanged, latest_value = 0, None
         with metrics.record_counter(self.tap_stream_id) as counter:
             for record in records:
-                # Transform record for Singer.io
-                with Transformer() as transformer:
-                    transformed_record = transformer.transform(record, schema, stream_metadata)
-
-                    # Reset max_bookmark_value to new value if higher
-                    if self.replication_key in transformed_record:
-                        bookmark_date = transformed_record.get(self.replication_key)
-                        bookmark_dt_tm = utils.strptime_to_utc(bookmark_date)
-                        last_dt_tm = utils.strptime_to_utc(last_datetime)
-
-                        if not max_bookmark_value:
-                            max_bookmark_value = last_datetime
-
-                        max_bookmark_dt_tm = utils.strptime_to_utc(max_bookmark_value)
-
-                        if bookmark_dt_tm > max_bookmark_dt_tm:
-                            max_bookmark_value = utils.strftime(bookmark_dt_tm)
-
-                        # Keep only records whose bookmark is after the last_datetime
-                        if bookmark_dt_tm >= last_dt_tm:
-                            write_record(self.tap_stream_id, transformed_record, time_extracted=time_extracted)
-                            counter.increment()
-                    else:
-                        write_record(self.tap_stream_id, transformed_record, time_extracted=time_extracted)
-                        counter.increment()
+                if transformed:
+                    transformed_record = record
+                else:
+                    # Transform record for Singer.io
+                    with Transformer() as transformer:
+                        transformed_record = transformer.transform(record, schema, stream_metadata)
+
+                # transformed date-times share one format, the latest one sorts last
+                value = transformed_record.get(self.replication_key)
+                if value is not None and (latest_value is None or value > latest_value):
+                    latest_value = value
+
+                if self.fingerprints and not self.fingerprints.is_changed(
+                    self.tap_stream_id, transformed_record, self.key_properties, self.replication_key
+                ):
+                    unchanged += 1
+                    continue
+
+                write_record(self.tap_stream_id, transformed_record, time_extracted=time_extracted)
+                counter.increment()
+
+            # Reset max_bookmark_value to new value if higher
+            if latest_value is not None:
+                bookmark_dt_tm = utils.strptime_to_utc(latest_value)
+                if not max_bookmark_value or bookmark_dt_tm > utils.strptime_to_utc(max_bookmark_value):
+                    max_bookmark_value = utils.strftime(bookmark_dt_tm)
 
             LOGGER.info(f"Stream: {self.tap_stream_id}, Processed {counter.value} records")
-            self.records_extracted += counter.value
-            return max_bookmark_value
+            if unchanged:
+                LOGGER.info(f"Stream: {self.tap_stream_id}, Skipped {unchanged} unchanged records")
+            return max_bookmark_value, counter.value
 
-    def get_records_for_sub_type(
-        self, site_url: str, sub_type: str, state: Dict, schema: Dict, stream_metadata: Dict
-    ) -> None:
-        """Sync the data for a given sub_type, stream, site Gets the bookmark
-        value or start date value, extracts data for date window size of 30
-        days."""
-        start_dt_tm, end_dt_tm = self.set_start_and_end_times(state, self.tap_stream_id, sub_type, site_url)
-        LOGGER.info(f"bookmark value or start date for {self.tap_stream_id} {site_url} {sub_type}: {start_dt_tm}")
-        site_path = encode_and_format_url(site_url, self.path)
-        while start_dt_tm < end_dt_tm:
-            offset, row_limit, batch_count = 0, self.row_limit, self.row_limit
-            last_datetime = self.get_bookmark(
-                state, self.tap_stream_id, site_url, sub_type, self.config.get("start_date")
-            )
-            bookmark_value = last_datetime
-            start_str, end_str = utils.strftime(start_dt_tm)[:10], utils.strftime(end_dt_tm)[:10]
+    def get_page_rows(self, site_path: str, body: Dict, split: bool = False) -> Iterable[ReportRow]:
+        """Fetches one page of the report.
 
+        Rows are decoded into typed `ReportRow`s, in streaming mode
+        parsed off the socket one at a time, so memory stays flat
+        whatever the page size. With `split` repeated failures are raised
+        early, for the request to be split.
+        """
+        if self.stream_responses:
+            return map(row_from_dict, self.client.post(
+                site_path, endpoint=self.tap_stream_id, data=dumps(body), park_on_quota=True,
+                split_on_failure=split, stream_key=self.data_key,
+            ))
+        return self.client.post(
+            site_path, endpoint=self.tap_stream_id, data=dumps(body), park_on_quota=True,
+            split_on_failure=split, decoder=decode_report_page,
+        )
+
+    def get_page_records(
+        self, site_url: str, sub_type: str, page: "ReportPage", transformer: RecordTransformer = None
+    ) -> Iterator[Dict]:
+        """Yields the records of a page, in their final selected and typed
+        shape with a `transformer`."""
+        # the page is held as compact typed rows, records are built one at a time as they are written
+        for row in page.rows:
+            if transformer:
+                record = transformer.transform(row, site_url, sub_type, page.dimensions)
+            else:
+                record = row.to_record(self.tap_stream_id, site_url, sub_type, page.dimensions)
+            self.validate_keys_in_data([record])
+            yield record
+
+    def split_request(
+        self, window: DateWindow, dimensions: List[str], filters: Tuple[Dict, ...]
+    ) -> Optional[List[Tuple[DateWindow, Tuple[Dict, ...]]]]:
+        """Returns the smaller requests covering the rows of a failing one:
+        the two halves of its window, or for a single day its rows split by
+        dimension filter. None if it cannot be split."""
+        if not self.split_failed_requests:
+            return None
+        if window[0] < window[1]:
+            return [(half, filters) for half in split_window(window)]
+        parts = split_filters(dimensions, filters)
+        return [(window, part) for part in parts] if parts else None
+
+    def get_pages(
+        self, site_url: str, sub_type: str, state: Dict, stream_metadata: Dict, windows: Iterable[DateWindow],
+        offset: int = 0, data_state: Optional[str] = None,
+    ) -> Iterator["ReportPage"]:
+        """Yields the pages of every window, in order.
+
+        The next page is only requested once the previous one was
+        consumed, or when prefetching, fully read. `data_state` sets the
+        `dataState` of the queries, final data only by default.
+        """
+        site_path = encode_and_format_url(site_url, self.path)
+        for window_start, window_end in windows:
+            start_str, end_str = window_start.isoformat(), window_end.isoformat()
             LOGGER.info(
                 f"Running sync for {site_url}, {self.tap_stream_id}, {sub_type} between date window "
                 f"{start_str} {end_str}"
             )
             payload = self.make_payload(sub_type, start_str, end_str, stream_metadata)
-            while row_limit == batch_count:
-                body = {"startRow": offset, "rowLimit": row_limit, **payload}
-                time_extracted = utils.now()
-                LOGGER.info(f"body = {body}")
-                data = self.client.post(site_path, endpoint=self.tap_stream_id, data=json.dumps(body))
-                if not data:
-                    self.write_bookmark(state, site_url, sub_type, bookmark_value)
-                    LOGGER.info(f"There are no raw data records for date window {start_dt_tm} to {end_dt_tm}, "
-                                f" from offset value {offset}")
-                    start_dt_tm, end_dt_tm = self.modify_start_end_dt_tm(end_dt_tm)
-                transformed_data = []
-                if self.data_key in data:
-                    transformed_data = transform_json(
-                        data,
-                        self.tap_stream_id,
-                        self.data_key,
-                        site_url,
-                        sub_type,
-                        dimensions_list=payload.get("dimensions", []),
-                    )[self.data_key]
-
-                if not transformed_data:
-                    self.write_bookmark(state, site_url, sub_type, bookmark_value)
-                    start_dt_tm, end_dt_tm = self.modify_start_end_dt_tm(end_dt_tm)
-
-                self.validate_keys_in_data(transformed_data)
-                LOGGER.info(f"Total synced records for {sub_type} {self.tap_stream_id}: {len(transformed_data)}")
-                batch_count = len(transformed_data)
-                bookmark_value = self.process_records(
-                    schema,
-                    stream_metadata,
-                    transformed_data,
-                    time_extracted,
-                    bookmark_value,
-                    last_datetime=last_datetime,
+            if data_state:
+                payload["dataState"] = data_state
+            shards = self.get_shards(site_url, sub_type, (window_start, window_end), payload.get("dimensions", []))
+            splits = SplitBudget()
+            # a window resumed mid-way is not sharded, its offset is the one of the whole window
+            if len(shards) > 1 and not offset:
+                rows = yield from self.get_sharded_pages(
+                    site_path, site_url, sub_type, state, (window_start, window_end), payload, shards, splits
                 )
-                self.write_bookmark(state, site_url, sub_type, bookmark_value)
-                offset = offset + row_limit
+            else:
+                rows = yield from self.get_window_pages(
+                    site_path, site_url, sub_type, state, (window_start, window_end), payload, offset, (), splits
+                )
+            # the density sizes the next window, record it as soon as the window is fetched
+            # partial days would understate the density
+            if self.get_target_rows_per_request and not data_state:
+                self.write_row_density(state, site_url, sub_type, rows, (window_end - window_start).days + 1)
+            offset = 0
+
+    def get_shards(
+        self, site_url: str, sub_type: str, window: DateWindow, dimensions: List[str]
+    ) -> List[Tuple[Dict, ...]]:
+        """Returns the dimension filters of the disjoint shards a window is
+        split in, `report_shards` of them for the reports with unbounded
+        rows. Reports by page are split by the page prefixes with the most
+        impressions, the others with `get_filter_shards`."""
+        count = self.get_report_shards
+        if count < 2 or get_max_rows(dimensions, (window[1] - window[0]).days + 1) is not None:
+            return [()]
+        if "page" in dimensions:
+            prefixes = get_page_prefixes(self.client, self.site_metadata, site_url, sub_type, *window, count - 1)
+            if prefixes:
+                return get_prefix_shards(prefixes)
+        return get_filter_shards(dimensions, count)
+
+    def get_sharded_pages(
+        self, site_path: str, site_url: str, sub_type: str, state: Dict, window: DateWindow, payload: Dict,
+        shards: List[Tuple[Dict, ...]], splits: Optional[SplitBudget] = None,
+    ) -> Iterator["ReportPage"]:
+        """Yields the pages of one window split in disjoint shards, fetched
+        concurrently, returns its number of rows.
+
+        Every row falls in exactly one shard, the records of all the
+        shards keep the stream `key_properties`. At most
+        `MAX_PREFETCH_ROWS` rows wait to be written.
+        """
+        LOGGER.info(
+            f"Sharding the {self.tap_stream_id} {site_url} {sub_type} window {window[0]} {window[1]} in {len(shards)}"
+        )
+        splits = splits or SplitBudget()
+        pages = interleave(
+            [self.get_window_pages(site_path, site_url, sub_type, state, window, payload, 0, shard, splits)
+             for shard in shards],
+            max(1, MAX_PREFETCH_ROWS // self.row_limit),
+        )
+        rows = 0
+        for page in pages:
+            rows += len(page.rows)
+            # the window is resumed as a whole, whatever the date splits of its shards
+            yield page._replace(window=window)
+        return rows
+
+    def get_window_pages(
+        self, site_path: str, site_url: str, sub_type: str, state: Dict, window: DateWindow, payload: Dict,
+        offset: int = 0, filters: Tuple[Dict, ...] = (), splits: Optional[SplitBudget] = None,
+        limit: Optional[Dict] = None,
+    ) -> Iterator["ReportPage"]:
+        """Yields the pages of one window, returns its number of rows.
+
+        On repeated timeouts or 5xx errors the window is split, first by
+        date then by dimension filter, until the requests succeed or the
+        `splits` of the window are used up. The sizes that worked, the
+        `limit` of a part of a failed request, are kept in the state for
+        the next runs. The pages of the window already yielded are fetched
+        again with the smaller requests.
+        """
+        splits = splits or SplitBudget()
+        window_start, window_end = window
+        days = (window_end - window_start).days + 1
+        dimensions = payload.get("dimensions", [])
+        limits = self.get_request_limits(state, site_url, sub_type)
+        if days == 1 and len(filters) < limits.get("filter_splits", 0):
+            # split up front as far as a previous run had to
+            parts = self.split_request(window, dimensions, filters)
+            if parts:
+                return (yield from self.get_split_pages(
+                    site_path, site_url, sub_type, state, window, payload, parts, splits
+                ))
+        payload = {**payload, "startDate": window_start.isoformat(), "endDate": window_end.isoformat()}
+        if filters:
+            payload["dimensionFilterGroups"] = [{"groupType": "and", "filters": list(filters)}]
+        parts = self.split_request(window, dimensions, filters)
+        max_rows, more_pages = get_max_rows(dimensions, days), True
+        while more_pages:
+            row_limit = self.get_page_row_limit(max_rows, offset)
+            body = {"startRow": offset, "rowLimit": row_limit, **payload}
+            time_extracted = utils.now()
+            LOGGER.info(f"body = {body}")
+            try:
+                rows = CountingIterator(self.get_page_rows(site_path, body, split=bool(parts)))
+                # filtered pages may be fetched by shard threads, ahead of the consumer
+                if self.get_prefetch_pages or filters:
+                    rows = list(rows)
+            except SPLITTABLE_ERRORS as err:
+                if not parts or not splits.take():
+                    raise
+                LOGGER.warning(
+                    f"Splitting the {self.tap_stream_id} {site_url} {sub_type} request of {window_start} "
+                    f"{window_end} {list(filters)} in {len(parts)} after {type(err).__name__}"
+                )
+                return (yield from self.get_split_pages(
+                    site_path, site_url, sub_type, state, window, payload, parts, splits, learn=True
+                ))
+            yield ReportPage(window, offset, row_limit, dimensions, rows, time_extracted, filters)
+            if limit:
+                # the smaller request succeeded, the next runs start with its size
+                self.write_request_limits(state, site_url, sub_type, **limit)
+                limit = None
+            batch_count = len(rows) if isinstance(rows, list) else rows.count
+            offset = offset + batch_count
+            more_pages = batch_count == row_limit
+        return offset
+
+    def get_page_row_limit(self, max_rows: Optional[int], offset: int) -> int:
+        """Returns the row limit of the page starting at `offset`, for
+        reports with at most `max_rows` rows one more row than the
+        remaining rows can fill, so that the last page never comes back
+        full."""
+        if max_rows is None:
+            return self.row_limit
+        return min(self.row_limit, max(max_rows - offset, 0) + 1)
+
+    def get_split_pages(
+        self, site_path: str, site_url: str, sub_type: str, state: Dict, window: DateWindow, payload: Dict,
+        parts: List[Tuple[DateWindow, Tuple[Dict, ...]]], splits: SplitBudget, learn: bool = False,
+    ) -> Iterator["ReportPage"]:
+        """Yields the pages of the smaller requests a window is split in, as
+        pages of that window, returns its number of rows.
+
+        The window is only fully fetched once all its parts are, its
+        bookmark and page checkpoint stay on the whole window. With
+        `learn` the size of each part is recorded once it succeeds.
+        """
+        rows = 0
+        for part_window, part_filters in parts:
+            part_limit = None
+            if learn:
+                part_limit = (
+                    {"max_days": (part_window[1] - part_window[0]).days + 1} if part_window != window
+                    else {"filter_splits": len(part_filters)}
+                )
+            for page in self.get_window_pages(
+                site_path, site_url, sub_type, state, part_window, payload, 0, part_filters, splits, part_limit
+            ):
+                yield page._replace(window=window, split=True)
+                rows += len(page.rows) if isinstance(page.rows, list) else page.rows.count
+        return rows
 
-            start_dt_tm, end_dt_tm = self.modify_start_end_dt_tm(end_dt_tm)
+    def get_records_for_sub_type(
+        self, site_url: str, sub_type: str, state: Dict, schema: Dict, stream_metadata: Dict
+    ) -> int:
+        """Sync the data for a given sub_type, stream, site Gets the bookmark
+        value or start date value, extracts data in consecutive date windows
+        of `DATE_WINDOW_SIZE` days. Returns the number of records
+        extracted."""
+        records_extracted = 0
+        pinned = self.get_pinned_sub_types(stream_metadata)
+        start_date, end_date = self.get_sync_range(
+            state, self.tap_stream_id, sub_type, site_url, prune=pinned is None
+        )
+        # the expired request limits are dropped, their larger requests are tried again
+        self.write_request_limits(state, site_url, sub_type)
+        window_size = functools.partial(self.get_window_size, state, site_url, sub_type)
+        windows, offset = plan_windows(start_date, end_date, window_size), 0
+        resume = self.get_page_checkpoint(state, site_url, sub_type) if self.checkpoint_pages else None
+        if resume:
+            resume_start, resume_end = date.fromisoformat(resume["start_date"]), date.fromisoformat(resume["end_date"])
+            windows = itertools.chain(
+                [(resume_start, resume_end)],
+                plan_windows(resume_end + timedelta(days=1), end_date, window_size),
+            )
+            offset = resume["offset"]
+            LOGGER.info(f"Resuming {self.tap_stream_id} {site_url} {sub_type} at offset {offset}")
+        LOGGER.info(f"bookmark value or start date for {self.tap_stream_id} {site_url} {sub_type}: {start_date}")
+        if self.fingerprints:
+            # the days before the range are not synced again
+            self.fingerprints.prune(self.tap_stream_id, site_url, sub_type, start_date)
+        # latest date of the records written, only bookmarked once their window is fully fetched: the rows of a
+        # window come sorted by clicks, a bookmark moved after its first page would skip the rest of the window
+        bookmark_value = self.get_bookmark(state, self.tap_stream_id, site_url, sub_type, self.config.get("start_date"))
+        window = None
+        # compiled once for the unit, the rows are built into their final records in one pass
+        transformer = RecordTransformer.compile(self.tap_stream_id, schema, stream_metadata)
+        # the next pages are fetched while the current one is transformed and written
+        pages = prefetch(self.get_pages(site_url, sub_type, state, stream_metadata, windows, offset),
+                         self.get_prefetch_pages)
+        for page in pages:
+            start_str, end_str = page.window[0].isoformat(), page.window[1].isoformat()
+            if page.window != window:
+                if window is not None:
+                    self.write_bookmark(state, site_url, sub_type, bookmark_value)
+                window = page.window
+                self.write_page_checkpoint(
+                    state, site_url, sub_type,
+                    {"start_date": start_str, "end_date": end_str,
+                     "offset": 0 if page.filters or page.split else page.offset},
+                )
+            records = CountingIterator(self.get_page_records(site_url, sub_type, page, transformer))
+            bookmark_value, records_count = self.process_records(
+                schema, stream_metadata, records, page.time_extracted, bookmark_value, transformer is not None
+            )
+            batch_count = records.count
+            if not batch_count:
+                LOGGER.info(f"There are no raw data records for date window {start_str} to {end_str}, "
+                            f" from offset value {page.offset}")
+            LOGGER.info(f"Total synced records for {sub_type} {self.tap_stream_id}: {batch_count}")
+            records_extracted += records_count
+            # the next page to fetch, the window start once all its pages are fetched,
+            # a window split in smaller requests resumes at its start
+            checkpoint = None
+            if page.filters or page.split:
+                checkpoint = {"start_date": start_str, "end_date": end_str, "offset": 0}
+            elif batch_count == page.row_limit:
+                checkpoint = {"start_date": start_str, "end_date": end_str, "offset": page.offset + batch_count}
+            self.write_page_checkpoint(state, site_url, sub_type, checkpoint)
+            self.checkpointer.checkpoint(state, records_count)
+        if window is not None:
+            self.write_bookmark(state, site_url, sub_type, bookmark_value)
+        self.write_page_checkpoint(state, site_url, sub_type, None)
+        self.finalize_provisional_days(state, site_url, sub_type, end_date)
+        return records_extracted + self.sync_fresh_days(
+            site_url, sub_type, state, schema, stream_metadata, prune=pinned is None
+        )
+
+    def sync_fresh_days(
+        self, site_url: str, sub_type: str, state: Dict, schema: Dict, stream_metadata: Dict, prune: bool = True
+    ) -> int:
+        """Syncs the days after the latest finalized date with their fresh
+        data (`dataState: all`), in one day windows. Returns the number of
+        records extracted.
+
+        The bookmark is left at the latest finalized date and the days are
+        kept in the state under `provisional_days`, so that they are
+        synced again once final, the final rows replacing the fresh ones.
+        """
+        if not (self.fresh_data and self.probe_data_availability):
+            return 0
+        today = self.now_dt_tm.date()
+        latest_date = get_latest_date(self.client, self.site_metadata, site_url, today)
+        if latest_date is None or latest_date >= today:
+            return 0
+        if prune and self.prune_sub_types and not get_data_dates(
+            self.client, self.site_metadata, state, site_url, sub_type, today
+        ):
+            return 0
+        start_date = latest_date + timedelta(days=1)
+        # recorded before the rows are written, an interrupted lane is finalized all the same
+        self.write_provisional_days(
+            state, site_url, sub_type, {"start_date": start_date.isoformat(), "end_date": today.isoformat()}
+        )
+        records_extracted = 0
+        transformer = RecordTransformer.compile(self.tap_stream_id, schema, stream_metadata)
+        windows = plan_windows(start_date, today, FRESH_WINDOW_SIZE)
+        for page in self.get_pages(site_url, sub_type, state, stream_metadata, windows, data_state="all"):
+            _, records_count = self.process_records(
+                schema, stream_metadata, self.get_page_records(site_url, sub_type, page, transformer),
+                page.time_extracted, transformed=transformer is not None,
+            )
+            records_extracted += records_count
+        LOGGER.info(f"Total fresh records for {sub_type} {self.tap_stream_id}: {records_extracted}")
+        self.checkpointer.checkpoint(state, records_extracted)
+        return records_extracted
+
+    def sync_sub_type(self, site_url: str, sub_type: str, state: Dict, schema: Dict, stream_metadata: Dict) -> None:
+        """Syncs a single (site, sub_type) unit and logs the total number of
+        extracted records."""
+        LOGGER.info(f"Starting Sync for Stream {self.tap_stream_id}, Site {site_url}, Type {sub_type}")
+        records_extracted = self.get_records_for_sub_type(site_url, sub_type, state, schema, stream_metadata)
+        # always checkpoint at the unit boundary
+        self.checkpointer.flush(state)
+        if self.fingerprints:
+            self.fingerprints.commit(self.tap_stream_id, site_url, sub_type)
+        LOGGER.info(
+            f"Total records extracted for Stream: {self.tap_stream_id}, Site: {site_url}, Type: {sub_type}:"
+            f" {records_extracted}"
+        )
+        LOGGER.info(f"Finished Sync for Stream {self.tap_stream_id}, Site {site_url}, Type {sub_type}")
+
+    def get_units_for_site(self, site_url: str, state: Dict, schema: Dict, stream_metadata: Dict) -> List[WorkUnit]:
+        """Returns one independent work unit per sub_type for a given
+        site."""
+        pinned = self.get_pinned_sub_types(stream_metadata)
+        return [
+            WorkUnit(
+                (site_url, sub_type),
+                functools.partial(self.sync_sub_type, site_url, sub_type, state, schema, stream_metadata),
+                group=site_url,
+            )
+            for sub_type in (self.sub_types if pinned is None else pinned)
+        ]
 
     def get_records_for_site(self, site_url: str, state: Dict, schema: Dict, stream_metadata: Dict) -> None:
-        """Starts Syncing data for each sub_type for a given site Logs the
-        total number of extracted records."""
-        for sub_type in self.sub_types:
-            LOGGER.info(f"Starting Sync for Stream {self.tap_stream_id}, Site {site_url}, Type {sub_type}")
-            self.records_extracted = 0
-            self.get_records_for_sub_type(site_url, sub_type, state, schema, stream_metadata)
-            LOGGER.info(
-                f"Total records extracted for Stream: {self.tap_stream_id}, Site: {site_url}, Type: {sub_type}:"
-                f" {self.records_extracted}"
-            )
-            LOGGER.info(f"Finished Sync for Stream {self.tap_stream_id}, Site {site_url}, Type {sub_type}")
+        """Starts Syncing data for each sub_type for a given site."""
+        for unit in self.get_units_for_site(site_url, state, schema, stream_metadata):
+            unit.func()
 
     def get_records(self, state: Dict, schema: Dict, stream_metadata: Dict) -> None:
-        """starts extracting data for each site_url configured by the user."""
+        """starts extracting data for each site_url configured by the user,
+        (site, sub_type) units run concurrently on up to `max_workers`
+        threads."""
+        units = []
         for site in self.get_site_url():
-            LOGGER.info(f"Starting Sync for Stream {self.tap_stream_id}, Site {site}")
-            self.get_records_for_site(site, state, schema, stream_metadata)
-            LOGGER.info(f"Finished Sync for Stream {self.tap_stream_id}, Site {site}")
+            units.extend(self.get_units_for_site(site, state, schema, stream_metadata))
+        # interrupted units first, they resume at their checkpointed page
+        units.sort(key=lambda unit: self.get_page_checkpoint(state, *unit.key) is None)
+        WorkScheduler(self.get_max_workers).run(units)
 
     def sync(self, state: Dict, schema: Dict, stream_metadata: Dict) -> None:
         """Starts Sync."""
         LOGGER.info(f"Starting Sync for Stream {self.tap_stream_id}")
-        self.get_records(state, schema, stream_metadata)
+        try:
+            self.get_records(state, schema, stream_metadata)
+        finally:
+            # the bookmarks only cover records already written, keep the progress on failures too
+            self.checkpointer.flush(state)
         LOGGER.info(f"Finished Sync for Stream {self.tap_stream_id}")
 
 
@@ -3,7 +3,10 @@ from typing import Dict
 import singer
 from singer import Catalog, metadata
 
+from . import output
 from .client import GoogleClient as Client
+from .fingerprints import get_fingerprint_store
+from .site_metadata import SiteMetadataCache
 from .streams import STREAMS
 
 LOGGER = singer.get_logger()
@@ -12,20 +15,29 @@ LOGGER = singer.get_logger()
 def sync(client: Client, config: Dict, state: Dict, catalog: Catalog):
     """Sync data from tap source"""
 
-    for stream in catalog.get_selected_streams(state):
-        tap_stream_id = stream.tap_stream_id
-        stream_obj = STREAMS[tap_stream_id](client, config)
-        stream_schema = stream.schema.to_dict()
-        stream_metadata = metadata.to_map(stream.metadata)
+    # what a stream learns about the sites is reused by the streams after it
+    site_metadata = SiteMetadataCache()
+    # fingerprints of the records emitted by the previous runs, opt-in
+    fingerprints = get_fingerprint_store(config.get("fingerprint_db"))
+    try:
+        with output.buffered_output(config):
+            for stream in catalog.get_selected_streams(state):
+                tap_stream_id = stream.tap_stream_id
+                stream_obj = STREAMS[tap_stream_id](client, config, site_metadata, fingerprints)
+                stream_schema = stream.schema.to_dict()
+                stream_metadata = metadata.to_map(stream.metadata)
 
-        LOGGER.info("Starting sync for stream: %s", tap_stream_id)
+                LOGGER.info("Starting sync for stream: %s", tap_stream_id)
 
-        state = singer.set_currently_syncing(state, tap_stream_id)
-        singer.write_state(state)
+                state = singer.set_currently_syncing(state, tap_stream_id)
+                output.write_state(state)
 
-        singer.write_schema(tap_stream_id, stream_schema, stream_obj.key_properties, stream.replication_key)
+                output.write_schema(tap_stream_id, stream_schema, stream_obj.key_properties, stream.replication_key)
 
-        stream_obj.sync(state, stream_schema, stream_metadata)
+                stream_obj.sync(state, stream_schema, stream_metadata)
 
-    state = singer.set_currently_syncing(state, None)
-    singer.write_state(state)
+            state = singer.set_currently_syncing(state, None)
+            output.write_state(state)
+    finally:
+        if fingerprints:
+            fingerprints.close()
@@ -0,0 +1,120 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import singer
+
+LOGGER = singer.get_logger()
+
+# multiplicative decrease factor applied on a throttling signal
+DECREASE_FACTOR = 0.5
+# additive increase of the rate scale per healthy response
+RATE_INCREASE_STEP = 0.02
+MIN_RATE_SCALE = 0.05
+# only one decrease per cooldown, so a burst of 429s from in-flight requests counts as one signal
+DECREASE_COOLDOWN = 5.0
+LATENCY_SMOOTHING = 0.2
+# weight of every response in the baseline latency, following the typical latency of the requests slowly
+BASELINE_SMOOTHING = 0.02
+# responses observed before the smoothed latency is compared to the baseline
+BASELINE_MIN_SAMPLES = 10
+# smoothed latency, as a multiple of the baseline, above which responses are considered congested
+LATENCY_RATIO = 2.5
+# smoothed latency (seconds) under which responses are never considered congested
+MIN_CONGESTED_LATENCY = 1.0
+# smoothed latency, as a share of the request timeout, considered congested whatever the baseline
+TIMEOUT_RATIO = 0.5
+
+
+class AIMDController:
+    """Adaptive additive-increase/multiplicative-decrease control of the
+    request rate and of the number of requests in flight.
+
+    Throttling signals (429, quota exceeded, slow responses) halve the
+    rate scale of the rate limiter and the allowed concurrency, healthy
+    responses grow them back step by step up to the configured limits.
+    Responses are slow compared to the baseline latency learned from the
+    previous ones, so that heavy but healthy requests are not taken for
+    congestion, or when they come close to the `request_timeout`.
+    """
+
+    def __init__(self, rate_limiter, max_concurrency: int = 1, request_timeout: Optional[float] = None) -> None:
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max(max_concurrency, 1)
+        self.concurrency = self.max_concurrency
+        self.request_timeout = request_timeout
+        self.latency = None
+        self.baseline = None
+        self.__samples = 0
+        self.__in_flight = 0
+        self.__successes = 0
+        self.__last_decrease = float("-inf")
+        self.__condition = threading.Condition()
+
+    @property
+    def rate_scale(self) -> float:
+        return self.rate_limiter.scale
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Holds one of the allowed in-flight request slots."""
+        with self.__condition:
+            while self.__in_flight >= self.concurrency:
+                self.__condition.wait()
+            self.__in_flight += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__in_flight -= 1
+                self.__condition.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        """Records a healthy response, grows rate and concurrency
+        additively."""
+        with self.__condition:
+            self.latency = latency if self.latency is None else (
+                LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency
+            )
+            self.baseline = latency if self.baseline is None else (
+                BASELINE_SMOOTHING * latency + (1 - BASELINE_SMOOTHING) * self.baseline
+            )
+            self.__samples += 1
+            if self.is_congested():
+                self.__decrease(f"smoothed latency {self.latency:.1f}s, baseline {self.baseline:.1f}s")
+                return
+            self.rate_limiter.scale = min(1.0, self.rate_limiter.scale + RATE_INCREASE_STEP)
+            # grow concurrency by one slot per round of `concurrency` healthy responses
+            self.__successes += 1
+            if self.__successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                self.__successes = 0
+                self.concurrency += 1
+                self.__condition.notify_all()
+
+    def is_congested(self) -> bool:
+        """Whether the smoothed latency is a throttling signal."""
+        if self.request_timeout and self.latency > TIMEOUT_RATIO * self.request_timeout:
+            return True
+        return (
+            self.__samples >= BASELINE_MIN_SAMPLES and self.latency > MIN_CONGESTED_LATENCY and
+            self.latency > LATENCY_RATIO * self.baseline
+        )
+
+    def on_throttled(self, reason: str = "rate limit exceeded") -> None:
+        """Records a throttling signal, shrinks rate and concurrency
+        multiplicatively."""
+        with self.__condition:
+            self.__decrease(reason)
+
+    def __decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        if now - self.__last_decrease < DECREASE_COOLDOWN:
+            return
+        self.__last_decrease, self.__successes = now, 0
+        self.rate_limiter.scale = max(MIN_RATE_SCALE, self.rate_limiter.scale * DECREASE_FACTOR)
+        self.concurrency = max(1, int(self.concurrency * DECREASE_FACTOR))
+        LOGGER.info(
+            f"Throttling requests on {reason}: rate scale {self.rate_limiter.scale:.2f}, "
+            f"concurrency {self.concurrency}"
+        )
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+
+import singer
+from singer import utils
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover, file locking is not available on Windows
+    fcntl = None
+
+LOGGER = singer.get_logger()
+
+
+def get_cache_key(client_id: str, refresh_token: str) -> str:
+    """Returns the key of the cached token, a hash of the OAuth
+    credentials."""
+    return hashlib.sha256(f"{client_id}:{refresh_token}".encode("utf-8")).hexdigest()
+
+
+class TokenCache:
+    """Access tokens persisted in a JSON file readable only by its owner,
+    shared by tap runs and processes through a lock file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.expanduser(path)
+
+    @contextmanager
+    def lock(self, exclusive: bool) -> Iterator[None]:
+        """Holds the lock file of the cache."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600), "r+", encoding="utf-8") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self) -> Dict:
+        try:
+            with open(self.path, encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key: str) -> Optional[Tuple[str, datetime, timedelta]]:
+        """Returns the cached (access token, expiry, lifetime) for the key,
+        if still valid."""
+        with self.lock(exclusive=False):
+            entry = self.read().get(key)
+        if not entry:
+            return None
+        expires = utils.strptime_to_utc(entry["expires_at"])
+        if expires <= utils.now():
+            return None
+        return entry["access_token"], expires, timedelta(seconds=entry["lifetime"])
+
+    def put(self, key: str, access_token: str, expires: datetime, lifetime: timedelta) -> None:
+        """Stores the token, dropping the expired entries of the cache."""
+        try:
+            with self.lock(exclusive=True):
+                now = utils.now()
+                entries = {
+                    cache_key: entry
+                    for cache_key, entry in self.read().items()
+                    if utils.strptime_to_utc(entry["expires_at"]) > now
+                }
+                entries[key] = {
+                    "access_token": access_token,
+                    "expires_at": utils.strftime(expires),
+                    "lifetime": lifetime.total_seconds(),
+                }
+                # replace the file atomically so that readers never see a partial write
+                file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+                with os.fdopen(file_descriptor, "w", encoding="utf-8") as temp_file:
+                    json.dump(entries, temp_file)
+                os.replace(temp_path, self.path)
+        except OSError as err:
+            LOGGER.warning(f"Unable to write the access token cache {self.path}: {err}")
@@ -0,0 +1,157 @@
+import calendar
+import re
+import threading
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+DateWindow = Tuple[date, date]
+
+# months of data kept by Search Console
+RETENTION_MONTHS = 16
+# bounds of the adaptive window size, Search Console keeps around 16 months of data
+MIN_WINDOW_SIZE = 1
+MAX_WINDOW_SIZE = 490
+# weight of the latest window in the smoothed rows per day
+DENSITY_SMOOTHING = 0.5
+# most distinct values of the bounded dimensions, `date` has one per day of the window
+DIMENSION_CARDINALITY = {"device": 3, "country": 300}
+DEVICES = ["DESKTOP", "MOBILE", "TABLET"]
+# dimensions split with a regular expression and its negation, the ones with the most values first
+REGEX_SPLIT_DIMENSIONS = ("query", "page", "country")
+# splits the values in two on their n-th character from the end
+SPLIT_PATTERN = "(?i)[a-m0-4].{{{}}}$"
+# most regular expression splits of a dimension
+MAX_FILTER_SPLITS = 6
+# most failing requests of one window split in smaller ones, so that an outage does not fan it out in failing requests
+MAX_WINDOW_SPLITS = 32
+
+
+def get_retention_start(today: date) -> date:
+    """Returns the oldest day Search Console may still have data for."""
+    year, month = divmod(today.year * 12 + today.month - 1 - RETENTION_MONTHS, 12)
+    return date(year, month + 1, min(today.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def plan_windows(start: date, end: date, size: Union[int, Callable[[], int]]) -> Iterator[DateWindow]:
+    """Splits the inclusive day range `start`..`end` into consecutive
+    windows of at most `size` days.
+
+    The `startDate` and `endDate` of a report query are both inclusive,
+    each window starts the day after the previous one ends so that no day
+    is requested twice. A callable `size` is evaluated before each window,
+    so that windows adapt as the sync goes.
+    """
+    while start <= end:
+        window_size = max(int(size() if callable(size) else size), 1)
+        window_end = min(start + timedelta(days=window_size - 1), end)
+        yield start, window_end
+        start = window_end + timedelta(days=1)
+
+
+def update_row_density(previous: Optional[float], rows: int, days: int) -> float:
+    """Blends the rows per day observed over a window into the previous
+    figure."""
+    observed = rows / max(days, 1)
+    if previous is None:
+        return observed
+    return DENSITY_SMOOTHING * observed + (1 - DENSITY_SMOOTHING) * previous
+
+
+def get_adaptive_window_size(density: Optional[float], target_rows: int, default: int) -> int:
+    """Returns the number of days expected to hold `target_rows` rows, or
+    `default` while the density is unknown."""
+    if density is None or not target_rows:
+        return default
+    if density <= 0:
+        return MAX_WINDOW_SIZE
+    return max(MIN_WINDOW_SIZE, min(MAX_WINDOW_SIZE, int(target_rows / density)))
+
+
+def get_max_rows(dimensions: Sequence[str], days: int) -> Optional[int]:
+    """Returns the most rows a query grouped by `dimensions` can return
+    over `days` days, None if any dimension is unbounded (e.g. `query`)."""
+    max_rows = 1
+    for dimension in dimensions:
+        if dimension == "date":
+            max_rows *= days
+        elif dimension in DIMENSION_CARDINALITY:
+            max_rows *= DIMENSION_CARDINALITY[dimension]
+        else:
+            return None
+    return max_rows
+
+
+def split_window(window: DateWindow) -> List[DateWindow]:
+    """Splits a window of several days in two halves."""
+    start, end = window
+    middle = start + timedelta(days=(end - start).days // 2)
+    return [(start, middle), (middle + timedelta(days=1), end)]
+
+
+def split_filters(dimensions: Sequence[str], filters: Tuple[Dict, ...]) -> Optional[List[Tuple[Dict, ...]]]:
+    """Splits the rows matching `filters` into disjoint sets with one more
+    dimension filter, None if they cannot be split further.
+
+    Only the dimensions grouped by are filtered on, so that every row
+    falls in exactly one set: by device, otherwise in two with a regular
+    expression and its negation.
+    """
+    if "device" in dimensions and not any(row_filter["dimension"] == "device" for row_filter in filters):
+        return [
+            filters + ({"dimension": "device", "operator": "equals", "expression": device},) for device in DEVICES
+        ]
+    for dimension in REGEX_SPLIT_DIMENSIONS:
+        if dimension in dimensions:
+            depth = sum(1 for row_filter in filters if row_filter["dimension"] == dimension)
+            if depth >= MAX_FILTER_SPLITS:
+                return None
+            expression = SPLIT_PATTERN.format(depth)
+            return [
+                filters + ({"dimension": dimension, "operator": operator, "expression": expression},)
+                for operator in ("includingRegex", "excludingRegex")
+            ]
+    return None
+
+
+class SplitBudget:
+    """Number of splits left to the failing requests of one window, shared
+    by the threads of its shards."""
+
+    def __init__(self, splits: Optional[int] = None) -> None:
+        self.remaining = MAX_WINDOW_SPLITS if splits is None else splits
+        self.__lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Uses one split, False if none are left."""
+        with self.__lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+def get_filter_shards(dimensions: Sequence[str], count: int) -> List[Tuple[Dict, ...]]:
+    """Splits the rows grouped by `dimensions` into at least `count`
+    disjoint sets of dimension filters, or as many as `split_filters`
+    allows."""
+    shards = [()]
+    while len(shards) < count:
+        parts = [split_filters(dimensions, shard) for shard in shards]
+        if any(part is None for part in parts):
+            break
+        shards = [shard for part in parts for shard in part]
+    return shards
+
+
+def get_prefix_shards(prefixes: Sequence[str]) -> List[Tuple[Dict, ...]]:
+    """Splits the rows grouped by page into one set per page prefix, and
+    one for the pages under none of them."""
+    expressions = [f"^{re.escape(prefix)}" for prefix in prefixes]
+    shards = [({"dimension": "page", "operator": "includingRegex", "expression": expression},)
+              for expression in expressions]
+    if expressions:
+        shards.append(
+            ({"dimension": "page", "operator": "excludingRegex",
+              "expression": f"^({'|'.join(re.escape(prefix) for prefix in prefixes)})"},)
+        )
+    return shards
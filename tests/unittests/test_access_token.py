@@ -0,0 +1,110 @@
+import os
+import stat
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+import tap_google_search_console.client as client
+from tap_google_search_console.token_cache import TokenCache, get_cache_key
+
+
+def get_token_response(expires_in=3600, token="abc"):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = f'{{"access_token": "{token}", "expires_in": {expires_in}}}'.encode()
+    return response
+
+
+@mock.patch("requests.Session.post")
+class TestAccessTokenRefresh(unittest.TestCase):
+    def test_concurrent_refreshes_are_coalesced(self, mocked_post):
+        """Verify threads needing a token at the same time share a single
+        token request."""
+
+        def slow_token_response(*args, **kwargs):
+            time.sleep(0.05)
+            return get_token_response()
+
+        mocked_post.side_effect = slow_token_response
+        google_client = client.GoogleClient("", "", "", "")
+        threads = [threading.Thread(target=google_client.get_access_token) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(mocked_post.call_count, 1)
+
+    def test_valid_token_is_reused(self, mocked_post):
+        """Verify no token request is made while the token is far from
+        expiry."""
+        mocked_post.return_value = get_token_response()
+        google_client = client.GoogleClient("", "", "", "")
+        google_client.get_access_token()
+        google_client.get_access_token()
+        self.assertEqual(mocked_post.call_count, 1)
+
+    def test_proactive_background_refresh(self, mocked_post):
+        """Verify a token within the refresh margin is renewed in the
+        background without blocking the caller."""
+        refreshed = threading.Event()
+        release = threading.Event()
+
+        def token_response(*args, **kwargs):
+            if mocked_post.call_count > 1:
+                release.wait(1)
+                refreshed.set()
+            return get_token_response(expires_in=600)
+
+        mocked_post.side_effect = token_response
+        google_client = client.GoogleClient("", "", "", "", token_refresh_margin=600)
+        google_client.get_access_token()
+        with mock.patch("tap_google_search_console.client.datetime") as mocked_datetime:
+            # move the clock into the refresh margin, half way to the expiry
+            mocked_datetime.now.return_value = client.utils.now() + client.timedelta(seconds=301)
+            google_client.get_access_token()
+            # returns with the still valid token while the refresh is running
+            self.assertFalse(refreshed.is_set())
+            google_client.get_access_token()
+        release.set()
+        self.assertTrue(refreshed.wait(1))
+        self.assertEqual(mocked_post.call_count, 2)
+
+
+@mock.patch("requests.Session.post")
+class TestTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.directory.name, "token.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_warm_start_skips_token_request(self, mocked_post):
+        """Verify a second client with the same credentials reuses the cached
+        token."""
+        mocked_post.return_value = get_token_response(token="cached")
+        client.GoogleClient("id", "secret", "refresh", "", token_cache_path=self.cache_path).get_access_token()
+        client.GoogleClient("id", "secret", "refresh", "", token_cache_path=self.cache_path).get_access_token()
+        self.assertEqual(mocked_post.call_count, 1)
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_path).st_mode), 0o600)
+
+    def test_cache_keyed_by_credentials(self, mocked_post):
+        """Verify the cached token of other credentials is not used."""
+        mocked_post.return_value = get_token_response()
+        client.GoogleClient("id", "secret", "refresh", "", token_cache_path=self.cache_path).get_access_token()
+        client.GoogleClient("id", "secret", "other", "", token_cache_path=self.cache_path).get_access_token()
+        self.assertEqual(mocked_post.call_count, 2)
+
+    def test_expired_token_is_not_used(self, mocked_post):
+        """Verify an expired cached token is fetched again."""
+        cache = TokenCache(self.cache_path)
+        key = get_cache_key("id", "refresh")
+        cache.put(key, "old", client.utils.now() - client.timedelta(seconds=1), client.timedelta(hours=1))
+        self.assertIsNone(cache.get(key))
+        mocked_post.return_value = get_token_response()
+        client.GoogleClient("id", "secret", "refresh", "", token_cache_path=self.cache_path).get_access_token()
+        self.assertEqual(mocked_post.call_count, 1)
@@ -0,0 +1,120 @@
+import decimal
+import io
+import json
+import time
+import unittest
+from unittest import mock
+
+import singer
+
+from tap_google_search_console import codec, output
+
+
+class TestCodec(unittest.TestCase):
+    def test_round_trip_for_every_installed_codec(self):
+        """Verify every installed codec serializes the same document."""
+        document = {"keys": ["2021-01-01", "café"], "ctr": 0.1, "clicks": 3, "value": decimal.Decimal("1.25")}
+        for name in codec.CODEC_PREFERENCE:
+            if codec.INSTALLED[name]:
+                selected = codec.get_codec(name)
+                self.assertEqual(selected.loads(selected.dumps(document)), {**document, "value": 1.25})
+                self.assertEqual(selected.loads(b'{"rows": []}'), {"rows": []})
+
+    def test_fallback_to_json(self):
+        """Verify a codec which is not installed falls back to the standard
+        library."""
+        with mock.patch.dict(codec.INSTALLED, {"orjson": False, "msgspec": False}):
+            self.assertEqual(codec.get_codec("orjson").name, "json")
+            self.assertEqual(codec.get_codec("auto").name, "json")
+
+    def test_unknown_codec(self):
+        """Verify an unknown codec name is rejected."""
+        with self.assertRaises(ValueError):
+            codec.get_codec("yaml")
+
+
+class TestOutput(unittest.TestCase):
+    def test_record_message(self):
+        """Verify records are written as one Singer RECORD message per
+        line."""
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            output.write_record("sites", {"site_url": "https://a.com"})
+            output.write_state({"bookmarks": {}})
+        lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(
+            lines,
+            [
+                {"type": "RECORD", "stream": "sites", "record": {"site_url": "https://a.com"}},
+                {"type": "STATE", "value": {"bookmarks": {}}},
+            ],
+        )
+
+
+class SlowStream(io.StringIO):
+    """Output stream recording the size of every write."""
+
+    def __init__(self, delay=0):
+        super().__init__()
+        self.delay, self.writes = delay, []
+
+    def write(self, text):
+        time.sleep(self.delay)
+        self.writes.append(text.count("\n"))
+        return super().write(text)
+
+
+class TestBufferedWriter(unittest.TestCase):
+    def test_batches_and_order(self):
+        """Verify messages are written in batches of the flush size, in the
+        order they were queued."""
+        stream = SlowStream()
+        writer = output.BufferedWriter(stream, buffer_size=100, flush_size=4, flush_interval=60)
+        for index in range(10):
+            writer.put(singer.RecordMessage(stream="sites", record={"index": index}))
+        writer.put(json.dumps({"type": "STATE", "value": {"index": 9}}))
+        writer.start().close()
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line["record"]["index"] for line in lines[:-1]], list(range(10)))
+        self.assertEqual(lines[-1], {"type": "STATE", "value": {"index": 9}})
+        self.assertEqual(stream.writes, [4, 4, 3])
+
+    def test_flush_interval(self):
+        """Verify a partial batch is written once the flush interval
+        elapses."""
+        stream = SlowStream()
+        writer = output.BufferedWriter(stream, flush_size=100, flush_interval=0.05).start()
+        writer.put(singer.RecordMessage(stream="sites", record={}))
+        time.sleep(0.5)
+        self.assertEqual(stream.writes, [1])
+        writer.close()
+
+    def test_backpressure(self):
+        """Verify producers block once the buffer is full."""
+        writer = output.BufferedWriter(SlowStream(delay=0.05), buffer_size=1, flush_size=1).start()
+        for _ in range(4):
+            writer.put(singer.RecordMessage(stream="sites", record={}))
+        writer.close()
+        self.assertGreater(writer.blocked_seconds, 0)
+        self.assertEqual(writer.messages, 4)
+
+    def test_write_error(self):
+        """Verify an error of the writer thread is raised to the producer."""
+        stream = SlowStream()
+        stream.close()
+        writer = output.BufferedWriter(stream, flush_size=1).start()
+        writer.put(singer.RecordMessage(stream="sites", record={}))
+        with self.assertRaises(ValueError):
+            writer.close()
+
+    def test_state_is_serialized_when_written(self):
+        """Verify a STATE message holds the state as it was when written,
+        not as it is when the writer gets to it."""
+        state = {"bookmarks": {"a": 1}}
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            with output.buffered_output({"output_flush_interval": 60}):
+                output.write_state(state)
+                state["bookmarks"]["a"] = 2
+                output.write_record("sites", {"site_url": "https://a.com"})
+        lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(lines[0], {"type": "STATE", "value": {"bookmarks": {"a": 1}}})
+        self.assertEqual(lines[1]["type"], "RECORD")
@@ -0,0 +1,253 @@
+import copy
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from tap_google_search_console.discover import get_schemas
+from tap_google_search_console.exceptions import GoogleQuotaExceededError
+from tap_google_search_console.output import StateCheckpointer
+from tap_google_search_console.scheduler import WorkScheduler, WorkUnit, get_max_workers
+from tap_google_search_console.streams.performance_reports import (
+    PerformanceReportCustom,
+    PerformanceReportDate,
+    PerformanceReportQuery,
+)
+
+
+class TestWorkScheduler(unittest.TestCase):
+    def test_max_workers_config_values(self):
+        """Verify the `max_workers` config value is parsed with a default of
+        1."""
+        self.assertEqual(get_max_workers(None), 1)
+        self.assertEqual(get_max_workers(""), 1)
+        self.assertEqual(get_max_workers("abc"), 1)
+        self.assertEqual(get_max_workers(0), 1)
+        self.assertEqual(get_max_workers("8"), 8)
+
+    def test_units_run_concurrently(self):
+        """Verify that units run in parallel up to `max_workers`."""
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def unit():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+        WorkScheduler(3).run([WorkUnit(idx, unit) for idx in range(9)])
+        self.assertEqual(peak[0], 3)
+
+    def test_error_is_raised(self):
+        """Verify that the error of a failing unit is raised to the caller."""
+
+        def failing_unit():
+            raise ValueError("failed unit")
+
+        with self.assertRaises(ValueError):
+            WorkScheduler(2).run([WorkUnit(1, failing_unit), WorkUnit(2, lambda: None)])
+
+
+class TestConcurrentSync(unittest.TestCase):
+    config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com, https://b.com", "max_workers": 4}
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_bookmarks_written_for_all_units(self, mocked_write_record, mocked_write_state):
+        """Verify every (site, sub_type) unit is synced and bookmarked when
+        run concurrently."""
+        client = mock.Mock()
+        client.post.side_effect = lambda path, **kwargs: kwargs["decoder"](
+            b'{"rows": [{"keys": ["2021-01-10"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}]}'
+        )
+        stream = PerformanceReportDate(client, self.config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=20)
+        state = {}
+        stream.sync(state, get_schemas()[0]["performance_report_date"], {})
+
+        for site in ("https://a.com", "https://b.com"):
+            self.assertEqual(
+                sorted(state["bookmarks"]["performance_report_date"][site]), sorted(PerformanceReportDate.sub_types)
+            )
+            for sub_type in PerformanceReportDate.sub_types:
+                self.assertEqual(
+                    state["bookmarks"]["performance_report_date"][site][sub_type], "2021-01-10T00:00:00.000000Z"
+                )
+
+    def test_make_payload_does_not_mutate_body_params(self):
+        """Verify that sub_type specific payload changes do not leak into the
+        shared class attribute."""
+        stream = PerformanceReportCustom(mock.Mock(), self.config)
+        metadata = {("properties", dim): {"selected": True} for dim in stream.dimension_list}
+        discover_payload = stream.make_payload("discover", "2021-01-01", "2021-01-02", metadata)
+        web_payload = stream.make_payload("web", "2021-01-01", "2021-01-02", metadata)
+        date_stream = PerformanceReportDate(mock.Mock(), self.config)
+        date_stream.make_payload("googleNews", "2021-01-01", "2021-01-02", {})
+
+        self.assertEqual(discover_payload["dimensions"], ["date", "country", "page"])
+        self.assertEqual(web_payload["dimensions"], ["date", "country", "device", "page", "query"])
+        self.assertEqual(PerformanceReportCustom.body_params, {"aggregationType": "auto"})
+        self.assertEqual(date_stream.make_payload("web", "2021-01-01", "2021-01-02", {})["aggregationType"],
+                         "byProperty")
+
+
+class TestQuotaParking(unittest.TestCase):
+    @mock.patch("tap_google_search_console.scheduler.MAX_PARKS", 1)
+    def test_parked_unit_resumes_while_other_sites_continue(self):
+        """Verify a unit hitting the quota is parked, units of other sites
+        keep running and the parked unit is run again later."""
+        calls = []
+
+        def quota_unit():
+            calls.append("a")
+            if calls.count("a") == 1:
+                raise GoogleQuotaExceededError("quota", retry_after=0.1)
+
+        units = [
+            WorkUnit(("a", "web"), quota_unit, group="a"),
+            WorkUnit(("b", "web"), lambda: calls.append("b"), group="b"),
+        ]
+        WorkScheduler(1).run(units)
+        self.assertEqual(calls, ["a", "b", "a"])
+
+    def test_unit_parked_too_often_raises(self):
+        """Verify the quota error is raised once the unit was parked
+        `MAX_PARKS` times."""
+
+        def quota_unit():
+            raise GoogleQuotaExceededError("quota", retry_after=0)
+
+        with self.assertRaises(GoogleQuotaExceededError):
+            WorkScheduler(2).run([WorkUnit(("a", "web"), quota_unit, group="a")])
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_unit_parked_mid_window_syncs_all_rows(self, mocked_write_record, mocked_write_state):
+        """Verify a unit parked after the first page of a window, whose rows
+        are sorted by clicks and not by date, still syncs the rest of the
+        window once run again."""
+        rows = [("q1", "2021-01-20", 9), ("q2", "2021-01-15", 7), ("q3", "2021-01-10", 5), ("q4", "2021-01-02", 3)]
+        parked = []
+
+        def get_page(path, **kwargs):
+            body = json.loads(kwargs["data"])
+            if body.get("type") == "web" and body["startRow"] == 2 and not parked:
+                parked.append(body)
+                raise GoogleQuotaExceededError("quota", retry_after=0)
+            page = [
+                '{"keys": ["%s", "%s"], "clicks": %d, "impressions": 10, "ctr": 0.5, "position": 1.0}'
+                % (day, query, clicks) for query, day, clicks in rows if body["startDate"] <= day <= body["endDate"]
+            ][body["startRow"]:body["startRow"] + body["rowLimit"]]
+            return kwargs["decoder"](('{"rows": [%s]}' % ", ".join(page)).encode())
+
+        client = mock.Mock()
+        client.post.side_effect = get_page
+        config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "ATTRIBUTION_DAYS": 0,
+                  "probe_data_start": False, "prune_sub_types": False, "probe_data_availability": False}
+        stream = PerformanceReportQuery(client, config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=20)
+        stream.row_limit = 2
+        state = {}
+        stream.sync(state, get_schemas()[0]["performance_report_query"], {})
+
+        self.assertTrue(parked)
+        written = {
+            call.args[1]["query"] for call in mocked_write_record.call_args_list
+            if call.args[1]["search_type"] == "web"
+        }
+        self.assertEqual(written, {"q1", "q2", "q3", "q4"})
+        self.assertEqual(
+            state["bookmarks"]["performance_report_query"]["https://a.com"]["web"], "2021-01-20T00:00:00.000000Z"
+        )
+
+
+class TestStateCheckpointer(unittest.TestCase):
+    config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "DATE_WINDOW_SIZE": 5}
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    def test_checkpoints_are_coalesced(self, mocked_write_state):
+        """Verify STATE is only emitted once enough records were written, or
+        when flushed with pending bookmark updates."""
+        checkpointer = StateCheckpointer(interval=60, records=10)
+        for _ in range(3):
+            checkpointer.checkpoint({}, 3)
+        self.assertEqual(mocked_write_state.call_count, 0)
+        checkpointer.checkpoint({}, 3)
+        self.assertEqual(mocked_write_state.call_count, 1)
+        checkpointer.flush({})
+        self.assertEqual(mocked_write_state.call_count, 1)
+        checkpointer.checkpoint({}, 0)
+        checkpointer.flush({})
+        self.assertEqual(mocked_write_state.call_count, 2)
+
+    def test_state_emitted_at_unit_boundaries_after_records(self):
+        """Verify a sync emits one STATE per (site, sub_type) unit instead of
+        one per page, each after the records its bookmark covers."""
+        client = mock.Mock()
+        client.post.side_effect = lambda path, **kwargs: kwargs["decoder"](
+            b'{"rows": [{"keys": ["%s"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}]}'
+            % json.loads(kwargs["data"])["endDate"].encode()
+        )
+        events = []
+        stream = PerformanceReportDate(client, self.config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=20)
+        with mock.patch("tap_google_search_console.streams.abstract.write_record",
+                        side_effect=lambda stream_name, record, **kwargs: events.append(record["date"])), \
+                mock.patch("tap_google_search_console.output.write_state",
+                           side_effect=lambda state: events.append(copy.deepcopy(state))):
+            stream.sync({}, get_schemas()[0]["performance_report_date"], {})
+
+        states = [event for event in events if isinstance(event, dict)]
+        self.assertEqual(len(states), len(PerformanceReportDate.sub_types))
+        written = []
+        for event in events:
+            if isinstance(event, dict):
+                for bookmark in event["bookmarks"]["performance_report_date"]["https://a.com"].values():
+                    self.assertLessEqual(bookmark[:10], max(written))
+            else:
+                written.append(event)
+
+
+class TestPageCheckpoints(unittest.TestCase):
+    config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "checkpoint_pages": "true",
+              "probe_data_start": False, "prune_sub_types": False, "probe_data_availability": False}
+
+    @staticmethod
+    def get_stream(client):
+        stream = PerformanceReportDate(client, TestPageCheckpoints.config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=20)
+        stream.row_limit = 2
+        return stream
+
+    @staticmethod
+    def get_page(path, **kwargs):
+        body = json.loads(kwargs["data"])
+        if body["startRow"] == 2:
+            raise GoogleQuotaExceededError("quota")
+        row = b'{"keys": ["2021-01-05"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}'
+        return kwargs["decoder"](b'{"rows": [%s, %s]}' % (row, row))
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_interrupted_unit_resumes_at_page(self, mocked_write_record, mocked_write_state):
+        """Verify an interrupted unit records its window and next page offset
+        and the next run resumes from that page."""
+        state, schema = {}, get_schemas()[0]["performance_report_date"]
+        client = mock.Mock()
+        client.post.side_effect = self.get_page
+        with self.assertRaises(GoogleQuotaExceededError):
+            self.get_stream(client).get_records_for_sub_type("https://a.com", "web", state, schema, {})
+        self.assertEqual(
+            state["currently_syncing_units"]["performance_report_date"]["https://a.com"]["web"],
+            {"start_date": "2021-01-01", "end_date": "2021-01-20", "offset": 2},
+        )
+
+        client = mock.Mock()
+        client.post.side_effect = lambda path, **kwargs: kwargs["decoder"](b'{"rows": []}')
+        self.get_stream(client).get_records_for_sub_type("https://a.com", "web", state, schema, {})
+        first_body = json.loads(client.post.call_args_list[0][1]["data"])
+        self.assertEqual((first_body["startRow"], first_body["startDate"]), (2, "2021-01-01"))
+        self.assertNotIn("currently_syncing_units", state)
@@ -1,4 +1,5 @@
 import unittest
+from json import dumps
 from unittest import mock
 
 import requests
@@ -286,7 +287,7 @@ class TestExceptionHandling(unittest.TestCase):
 
     def test_200_success(self, mocked_access_token, mocked_request):
         json = {"key": "value", "tap": "google search console"}
-        mocked_request.return_value = get_response(200, json)
+        mocked_request.return_value = get_response(200, json, content=dumps(json))
         google_client = client.GoogleClient("", "", "", "")
 
         response = google_client.request("")
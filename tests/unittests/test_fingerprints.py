@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+from tap_google_search_console.discover import get_schemas
+from tap_google_search_console.fingerprints import FingerprintStore
+from tap_google_search_console.streams.performance_reports import PerformanceReportDate
+
+KEY_PROPERTIES = ["site_url", "search_type", "date"]
+
+
+def get_record(day, clicks, site="https://a.com"):
+    return {"site_url": site, "search_type": "web", "date": f"{day}T00:00:00.000000Z", "clicks": clicks}
+
+
+class TestFingerprintStore(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "fingerprints.db")
+        self.store = FingerprintStore(self.path)
+        self.addCleanup(self.store.close)
+
+    def is_changed(self, store, record):
+        return store.is_changed("performance_report_date", record, KEY_PROPERTIES, "date")
+
+    def commit(self, store, site="https://a.com"):
+        store.commit("performance_report_date", site, "web")
+
+    def test_new_and_changed_records(self):
+        """Verify only the new records and the ones with changed values are
+        reported as changed."""
+        self.assertTrue(self.is_changed(self.store, get_record("2021-05-01", 1)))
+        self.assertFalse(self.is_changed(self.store, get_record("2021-05-01", 1)))
+        self.assertTrue(self.is_changed(self.store, get_record("2021-05-01", 2)))
+        self.assertTrue(self.is_changed(self.store, get_record("2021-05-02", 2)))
+
+    def test_prune(self):
+        """Verify the fingerprints of the days before the given day are
+        dropped."""
+        for day in ("2021-05-01", "2021-05-02", "2021-05-03"):
+            self.is_changed(self.store, get_record(day, 1))
+        self.commit(self.store)
+        self.assertEqual(self.store.prune("performance_report_date", "https://a.com", "web", date(2021, 5, 3)), 2)
+        self.assertTrue(self.is_changed(self.store, get_record("2021-05-02", 1)))
+        self.assertFalse(self.is_changed(self.store, get_record("2021-05-03", 1)))
+
+    def test_only_committed_fingerprints_kept(self):
+        """Verify the fingerprints not committed when the store is closed are
+        dropped."""
+        self.is_changed(self.store, get_record("2021-05-01", 1))
+        self.commit(self.store)
+        self.is_changed(self.store, get_record("2021-05-02", 1))
+        self.store.close()
+        store = FingerprintStore(self.path)
+        self.addCleanup(store.close)
+        self.assertFalse(self.is_changed(store, get_record("2021-05-01", 1)))
+        self.assertTrue(self.is_changed(store, get_record("2021-05-02", 1)))
+
+    def test_commit_only_writes_its_unit(self):
+        """Verify the commit of a unit leaves the fingerprints staged by
+        the other units uncommitted."""
+        self.is_changed(self.store, get_record("2021-05-01", 1, "https://a.com"))
+        self.is_changed(self.store, get_record("2021-05-01", 1, "https://b.com"))
+        self.commit(self.store, "https://a.com")
+        self.store.close()
+        store = FingerprintStore(self.path)
+        self.addCleanup(store.close)
+        self.assertFalse(self.is_changed(store, get_record("2021-05-01", 1, "https://a.com")))
+        self.assertTrue(self.is_changed(store, get_record("2021-05-01", 1, "https://b.com")))
+
+
+@mock.patch("tap_google_search_console.output.write_state")
+@mock.patch("tap_google_search_console.streams.abstract.write_record")
+class TestUnchangedRecordsSkipped(unittest.TestCase):
+    def test_lookback_rows_written_once(self, mocked_write_record, mocked_write_state):
+        """Verify the rows synced again by the lookback are only written if
+        their metrics changed."""
+        clicks = {"2021-05-29": 1, "2021-05-30": 1, "2021-05-31": 1}
+
+        def get_page(path, **kwargs):
+            body = json.loads(kwargs["data"])
+            rows = [
+                '{"keys": ["%s"], "clicks": %d, "impressions": 2, "ctr": 0.5, "position": 1.0}' % (day, count)
+                for day, count in clicks.items() if body["startDate"] <= day <= body["endDate"]
+            ]
+            return kwargs["decoder"](('{"rows": [%s]}' % ", ".join(rows)).encode())
+
+        client = mock.Mock()
+        client.post.side_effect = get_page
+        config = {"start_date": "2021-05-29T00:00:00Z", "site_urls": "https://a.com", "ATTRIBUTION_DAYS": 2,
+                  "probe_data_start": False, "prune_sub_types": False, "probe_data_availability": False}
+        with tempfile.TemporaryDirectory() as directory:
+            store = FingerprintStore(os.path.join(directory, "fingerprints.db"))
+            stream = PerformanceReportDate(client, config, fingerprints=store)
+            stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=5, day=31)
+            state, schema = {}, get_schemas()[0][stream.tap_stream_id]
+            stream.sync_sub_type("https://a.com", "web", state, schema, {})
+            self.assertEqual(mocked_write_record.call_count, 3)
+
+            mocked_write_record.reset_mock()
+            clicks["2021-05-30"] = 5
+            stream.sync_sub_type("https://a.com", "web", state, schema, {})
+            store.close()
+        self.assertEqual([call.args[1]["date"] for call in mocked_write_record.call_args_list],
+                         ["2021-05-30T00:00:00.000000Z"])
+        self.assertEqual(
+            state["bookmarks"]["performance_report_date"]["https://a.com"]["web"], "2021-05-31T00:00:00.000000Z"
+        )
@@ -1,3 +1,4 @@
+import time
 from unittest import TestCase
 
 from tap_google_search_console import helpers
@@ -52,3 +53,40 @@ class TestHelpers(TestCase):
         }
         self.assertEquals(helpers.add_site_url_search_type(input_data, "rows", "https://www.test.com"), expected_output)
 
+
+
+class TestPrefetch(TestCase):
+    def test_items_in_order(self):
+        """Tests the prefetched items are yielded in order, with or without
+        a background thread."""
+        for depth in (0, 1, 3):
+            self.assertEqual(list(helpers.prefetch(iter(range(10)), depth)), list(range(10)))
+
+    def test_runs_ahead(self):
+        """Tests the producer runs ahead of the consumer, by at most the
+        depth plus the item in hand."""
+        produced = []
+
+        def produce():
+            for item in range(10):
+                produced.append(item)
+                yield item
+
+        items = helpers.prefetch(produce(), 2)
+        self.assertEqual(next(items), 0)
+        time.sleep(0.2)
+        self.assertEqual(produced, [0, 1, 2, 3])
+        items.close()
+
+    def test_error_raised_to_consumer(self):
+        """Tests an error of the producer is raised to the consumer after the
+        items produced before it."""
+
+        def produce():
+            yield 1
+            raise ValueError("failed page")
+
+        items = helpers.prefetch(produce(), 1)
+        self.assertEqual(next(items), 1)
+        with self.assertRaises(ValueError):
+            next(items)
@@ -0,0 +1,282 @@
+import json
+import threading
+import time
+import unittest
+from datetime import date, datetime, timezone
+from unittest import mock
+
+from tap_google_search_console.discover import get_schemas
+from tap_google_search_console.probes import get_page_prefix
+from tap_google_search_console.site_metadata import SiteMetadataCache
+from tap_google_search_console.streams.performance_reports import (
+    PerformanceReportCountry,
+    PerformanceReportDate,
+)
+from tap_google_search_console.windows import get_retention_start
+
+
+class FakeClient:
+    """Client answering the date probe with `data_dates` and report
+    queries with no rows."""
+
+    def __init__(self, data_dates):
+        self.data_dates, self.bodies = data_dates, []
+        # shared by the streams synced with the client, as within a run
+        self.site_metadata = SiteMetadataCache()
+
+    def post(self, path, **kwargs):
+        body = json.loads(kwargs["data"])
+        self.bodies.append((kwargs["endpoint"], body))
+        rows = []
+        if kwargs["endpoint"] == "data_probe":
+            rows = [
+                '{"keys": ["%s"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}' % day
+                for day in self.data_dates
+            ]
+        return kwargs["decoder"](('{"rows": [%s]}' % ", ".join(rows)).encode())
+
+
+@mock.patch("tap_google_search_console.output.write_state")
+class TestStartOfData(unittest.TestCase):
+    config = {"start_date": "2018-01-01T00:00:00Z", "site_urls": "https://a.com", "probe_data_availability": False}
+
+    def sync(self, client, stream_class, state):
+        stream = stream_class(client, self.config, client.site_metadata)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=6, day=1)
+        stream.get_records_for_sub_type("https://a.com", "web", state, get_schemas()[0][stream.tap_stream_id], {})
+        return [body for endpoint, body in client.bodies if endpoint == stream.tap_stream_id]
+
+    def test_retention_start(self, mocked_write_state):
+        """Verify the retention horizon is 16 months back, on the same day
+        or the end of a shorter month."""
+        self.assertEqual(get_retention_start(date(2021, 3, 15)), date(2019, 11, 15))
+        self.assertEqual(get_retention_start(date(2022, 5, 31)), date(2021, 1, 31))
+        self.assertEqual(get_retention_start(date(2022, 6, 30)), date(2021, 2, 28))
+
+    def test_first_sync_starts_at_first_data_date(self, mocked_write_state):
+        """Verify a first sync starts at the first day with data, probed once
+        within the retention horizon for all the streams."""
+        client = FakeClient(["2021-03-07", "2021-03-05"])
+        date_bodies = self.sync(client, PerformanceReportDate, {})
+        country_bodies = self.sync(client, PerformanceReportCountry, {})
+
+        probes = [body for endpoint, body in client.bodies if endpoint == "data_probe"]
+        self.assertEqual(len(probes), 1)
+        self.assertEqual((probes[0]["startDate"], probes[0]["dimensions"]), ("2020-02-01", ["date"]))
+        self.assertEqual(date_bodies[0]["startDate"], "2021-03-05")
+        self.assertEqual(country_bodies[0]["startDate"], "2021-03-05")
+
+    def test_no_data(self, mocked_write_state):
+        """Verify a (site, sub_type) without data is not queried."""
+        client = FakeClient([])
+        self.assertEqual(self.sync(client, PerformanceReportDate, {}), [])
+
+    def test_bookmarked_sync_is_not_probed(self, mocked_write_state):
+        """Verify a sync from a bookmark does not probe for the first day with
+        data, but is clamped to the retention horizon."""
+        client = FakeClient([])
+        state = {"bookmarks": {"performance_report_date": {"https://a.com": {"web": "2019-01-01T00:00:00Z"}}}}
+        with mock.patch.dict(self.config, {"prune_sub_types": False}):
+            bodies = self.sync(client, PerformanceReportDate, state)
+        self.assertEqual(len(client.bodies), len(bodies))
+        self.assertEqual(bodies[0]["startDate"], "2020-02-01")
+
+
+class SubTypeClient(FakeClient):
+    """Client with data on `data_dates` for the `web` search type only."""
+
+    def post(self, path, **kwargs):
+        if json.loads(kwargs["data"])["type"] != "web":
+            self.bodies.append((kwargs["endpoint"], json.loads(kwargs["data"])))
+            return kwargs["decoder"](b'{"rows": []}')
+        return super().post(path, **kwargs)
+
+
+@mock.patch("tap_google_search_console.output.write_state")
+class TestSubTypePruning(unittest.TestCase):
+    config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "probe_data_availability": False}
+    bookmarks = {sub_type: "2021-05-01T00:00:00Z" for sub_type in PerformanceReportDate.sub_types}
+
+    def sync(self, client, stream_class, state, stream_metadata=None):
+        stream = stream_class(client, self.config, client.site_metadata)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=6, day=1)
+        state.setdefault("bookmarks", {})[stream.tap_stream_id] = {"https://a.com": dict(self.bookmarks)}
+        stream.sync(state, get_schemas()[0][stream.tap_stream_id], stream_metadata or {})
+        return {body["type"] for endpoint, body in client.bodies if endpoint == stream.tap_stream_id}
+
+    def test_empty_sub_types_skipped(self, mocked_write_state):
+        """Verify the sub_types without data are probed once for all the
+        streams, are not queried and are recorded in the history."""
+        client, state = SubTypeClient(["2021-05-20"]), {}
+        self.assertEqual(self.sync(client, PerformanceReportDate, state), {"web"})
+        self.assertEqual(self.sync(client, PerformanceReportCountry, state), {"web"})
+        probes = [body["type"] for endpoint, body in client.bodies if endpoint == "data_probe"]
+        self.assertEqual(sorted(probes), sorted(PerformanceReportDate.sub_types))
+        self.assertEqual(
+            state["sub_type_history"]["https://a.com"]["news"], {"empty_runs": 1, "probed_at": "2021-06-01"}
+        )
+        self.assertNotIn("web", state["sub_type_history"]["https://a.com"])
+
+    def test_history_skips_probe_until_reprobe(self, mocked_write_state):
+        """Verify a sub_type empty for enough runs is not probed again until
+        the re-probe delay has passed."""
+        client = SubTypeClient(["2021-05-20"])
+        state = {"sub_type_history": {"https://a.com": {
+            "news": {"empty_runs": 3, "probed_at": "2021-05-30"},
+            "video": {"empty_runs": 3, "probed_at": "2021-05-20"},
+            "web": {"empty_runs": 1, "probed_at": "2021-05-30"},
+        }}}
+        self.sync(client, PerformanceReportDate, state)
+        probes = {body["type"] for endpoint, body in client.bodies if endpoint == "data_probe"}
+        self.assertNotIn("news", probes)
+        self.assertIn("video", probes)
+        self.assertEqual(state["sub_type_history"]["https://a.com"]["video"]["empty_runs"], 4)
+        self.assertNotIn("web", state["sub_type_history"]["https://a.com"])
+
+    def test_pinned_sub_types(self, mocked_write_state):
+        """Verify the sub_types pinned in the catalog metadata are synced
+        without probing, and the others are not synced."""
+        client = SubTypeClient(["2021-05-20"])
+        synced = self.sync(client, PerformanceReportDate, {}, {(): {"sub_types": ["image", "web"]}})
+        self.assertEqual(synced, {"image", "web"})
+        self.assertFalse([endpoint for endpoint, body in client.bodies if endpoint == "data_probe"])
+
+
+class TestPagePrefixes(unittest.TestCase):
+    def test_page_prefix(self):
+        """Verify the prefix of a page is its first path segment, and none
+        for the pages at the root of the site."""
+        self.assertEqual(get_page_prefix("https://a.com/blog/post"), "https://a.com/blog/")
+        self.assertEqual(get_page_prefix("https://a.com/blog/"), "https://a.com/blog/")
+        self.assertIsNone(get_page_prefix("https://a.com/blog"))
+        self.assertIsNone(get_page_prefix("https://a.com/"))
+
+
+class TestSiteMetadataCache(unittest.TestCase):
+    def test_fact_loaded_once(self):
+        """Verify a fact is loaded once, even by concurrent readers."""
+        cache, loads = SiteMetadataCache(), []
+
+        def load():
+            loads.append(1)
+            time.sleep(0.05)
+            return "value"
+
+        threads = [threading.Thread(target=cache.get, args=("https://a.com", "fact", load)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.get("https://a.com", "fact", load), "value")
+        self.assertEqual(len(loads), 1)
+
+@mock.patch("tap_google_search_console.output.write_state")
+class TestDataAvailability(unittest.TestCase):
+    config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "prune_sub_types": False}
+
+    def sync(self, client, stream_class, bookmark):
+        stream = stream_class(client, self.config, client.site_metadata)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=6, day=1)
+        state = {"bookmarks": {stream.tap_stream_id: {"https://a.com": {"web": bookmark}}}}
+        stream.get_records_for_sub_type("https://a.com", "web", state, get_schemas()[0][stream.tap_stream_id], {})
+        return [(body["startDate"], body["endDate"]) for endpoint, body in client.bodies
+                if endpoint == stream.tap_stream_id]
+
+    def test_range_ends_at_latest_finalized_date(self, mocked_write_state):
+        """Verify the range starts after the bookmark and ends at the latest
+        finalized date, probed once for the site."""
+        client = FakeClient(["2021-05-27", "2021-05-29"])
+        self.assertEqual(self.sync(client, PerformanceReportDate, "2021-05-20T00:00:00Z"),
+                         [("2021-05-21", "2021-05-29")])
+        self.assertEqual(self.sync(client, PerformanceReportCountry, "2021-05-25T00:00:00Z"),
+                         [("2021-05-26", "2021-05-29")])
+        probes = [body for endpoint, body in client.bodies if endpoint == "data_probe"]
+        self.assertEqual([(body["startDate"], body["type"]) for body in probes], [("2021-05-22", "web")])
+
+    def test_nothing_to_sync_after_latest_date(self, mocked_write_state):
+        """Verify a unit bookmarked at the latest finalized date makes no
+        report request."""
+        client = FakeClient(["2021-05-29"])
+        self.assertEqual(self.sync(client, PerformanceReportDate, "2021-05-29T00:00:00Z"), [])
+
+    def test_explicit_attribution_days(self, mocked_write_state):
+        """Verify a configured ATTRIBUTION_DAYS still re-syncs the days
+        before the latest finalized date."""
+        client = FakeClient(["2021-05-29"])
+        with mock.patch.dict(self.config, {"ATTRIBUTION_DAYS": 3}):
+            self.assertEqual(self.sync(client, PerformanceReportDate, "2021-05-29T00:00:00Z"),
+                             [("2021-05-26", "2021-05-29")])
+
+    def test_now_evaluated_per_stream(self, mocked_write_state):
+        """Verify the current time is taken when the stream is created, not
+        when the module is imported."""
+        now = datetime(2021, 6, 1, tzinfo=timezone.utc)
+        with mock.patch("tap_google_search_console.streams.abstract.utils.now", return_value=now):
+            self.assertEqual(PerformanceReportDate(FakeClient([]), self.config).now_dt_tm, now)
+
+
+class FreshClient(FakeClient):
+    """Client returning one row per day for the report queries."""
+
+    def post(self, path, **kwargs):
+        body = json.loads(kwargs["data"])
+        if kwargs["endpoint"] == "data_probe":
+            return super().post(path, **kwargs)
+        self.bodies.append((kwargs["endpoint"], body))
+        row = '{"keys": ["%s"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}' % body["startDate"]
+        return kwargs["decoder"](('{"rows": [%s]}' % row if body["startRow"] == 0 else '{"rows": []}').encode())
+
+
+@mock.patch("tap_google_search_console.output.write_state")
+@mock.patch("tap_google_search_console.streams.abstract.write_record")
+class TestFreshData(unittest.TestCase):
+    config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "prune_sub_types": False,
+              "fresh_data": True}
+
+    def sync(self, client, state):
+        stream = PerformanceReportDate(client, self.config, client.site_metadata)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=6, day=1)
+        state.setdefault("bookmarks", {"performance_report_date": {"https://a.com": {"web": "2021-05-29T00:00:00Z"}}})
+        stream.get_records_for_sub_type("https://a.com", "web", state, get_schemas()[0][stream.tap_stream_id], {})
+        return [(body["startDate"], body["endDate"], body.get("dataState")) for endpoint, body in client.bodies
+                if endpoint == stream.tap_stream_id]
+
+    def test_fresh_days_synced_as_provisional(self, mocked_write_record, mocked_write_state):
+        """Verify the days after the latest finalized date are synced with
+        fresh data one day at a time, kept as provisional and not
+        bookmarked."""
+        state = {}
+        self.assertEqual(self.sync(FreshClient(["2021-05-29"]), state), [
+            ("2021-05-30", "2021-05-30", "all"), ("2021-05-31", "2021-05-31", "all"),
+            ("2021-06-01", "2021-06-01", "all"),
+        ])
+        self.assertEqual(mocked_write_record.call_count, 3)
+        self.assertEqual(state["provisional_days"], {"performance_report_date": {"https://a.com": {
+            "web": {"start_date": "2021-05-30", "end_date": "2021-06-01"}
+        }}})
+        self.assertEqual(state["bookmarks"]["performance_report_date"]["https://a.com"]["web"], "2021-05-29T00:00:00Z")
+
+    def test_provisional_days_finalized(self, mocked_write_record, mocked_write_state):
+        """Verify the provisional days are synced again once final, and only
+        the days still not final are kept as provisional."""
+        state = {
+            "bookmarks": {"performance_report_date": {"https://a.com": {"web": "2021-05-31T00:00:00Z"}}},
+            "provisional_days": {"performance_report_date": {"https://a.com": {
+                "web": {"start_date": "2021-05-30", "end_date": "2021-06-01"}
+            }}},
+        }
+        with mock.patch.dict(self.config, {"fresh_data": False}):
+            self.assertEqual(self.sync(FreshClient(["2021-05-31"]), state), [("2021-05-30", "2021-05-31", None)])
+        self.assertEqual(
+            state["provisional_days"]["performance_report_date"]["https://a.com"]["web"],
+            {"start_date": "2021-06-01", "end_date": "2021-06-01"},
+        )
+
+        self.assertEqual(self.sync(FreshClient(["2021-06-01"]), state), [("2021-06-01", "2021-06-01", None)])
+        self.assertNotIn("provisional_days", state)
+
+    def test_no_fresh_days(self, mocked_write_record, mocked_write_state):
+        """Verify nothing is provisional when today is already final."""
+        state = {}
+        self.assertEqual(self.sync(FreshClient(["2021-06-01"]), state), [("2021-05-30", "2021-06-01", None)])
+        self.assertNotIn("provisional_days", state)
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from tap_google_search_console import ratelimit
+
+
+class TestApiMethod(unittest.TestCase):
+    def test_search_analytics_path(self):
+        """Verify the site url is decoded from a search analytics path."""
+        self.assertEqual(
+            ratelimit.get_api_method("sites/https%3A%2F%2Fa.com%2F/searchAnalytics/query"),
+            ("https://a.com/", ratelimit.SEARCH_ANALYTICS_METHOD),
+        )
+
+    def test_other_paths(self):
+        """Verify other endpoints are accounted against the default method."""
+        self.assertEqual(ratelimit.get_api_method("sites/sc-domain%3Aa.com/sitemaps"),
+                         ("sc-domain:a.com", ratelimit.DEFAULT_METHOD))
+        self.assertEqual(ratelimit.get_api_method(None), (None, ratelimit.DEFAULT_METHOD))
+
+
+class TestBackends(unittest.TestCase):
+    def test_memory_backend_waits_when_empty(self):
+        """Verify that the tokens above the bucket capacity have to be waited
+        for."""
+        backend = ratelimit.MemoryBackend()
+        waits = [backend.reserve("key", rate=2, capacity=2) for _ in range(4)]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 0.5, places=2)
+        self.assertAlmostEqual(waits[3], 1.0, places=2)
+
+    def test_sqlite_backend_shared_between_instances(self):
+        """Verify that two backends on the same file share the budget."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "limits.db")
+            first, second = ratelimit.SQLiteBackend(path), ratelimit.SQLiteBackend(path)
+            self.assertEqual(first.reserve("key", rate=1, capacity=1), 0.0)
+            self.assertAlmostEqual(second.reserve("key", rate=1, capacity=1), 1.0, places=1)
+            first.close()
+            second.close()
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_buckets_for_search_analytics(self):
+        """Verify search analytics requests use the project, site and method
+        buckets."""
+        limiter = ratelimit.RateLimiter("client")
+        self.assertEqual(
+            limiter.get_buckets("https://a.com", ratelimit.SEARCH_ANALYTICS_METHOD),
+            [
+                ("client:project:searchAnalytics.query", 40000),
+                ("client:site:searchAnalytics.query:https://a.com", 1200),
+                ("client:method:searchAnalytics.query", 1200),
+            ],
+        )
+        self.assertEqual(limiter.get_buckets("https://a.com", ratelimit.DEFAULT_METHOD),
+                         [("client:method:default", 200)])
+
+    @mock.patch("time.sleep")
+    def test_acquire_sleeps_for_most_constrained_bucket(self, mocked_sleep):
+        """Verify that acquire sleeps once the per-site budget is spent."""
+        limiter = ratelimit.RateLimiter("client", limits={"default": {"site": 60, "method": 120}})
+        limiter.acquire("https://a.com", "default")
+        mocked_sleep.assert_not_called()
+        limiter.acquire("https://a.com", "default")
+        self.assertAlmostEqual(mocked_sleep.call_args[0][0], 1.0, places=1)
@@ -0,0 +1,96 @@
+import unittest
+from unittest import mock
+
+import requests
+
+import tap_google_search_console.client as client
+from tap_google_search_console import exceptions
+from tap_google_search_console.retry import RetryPolicy, RetryRule, constant
+
+
+def get_mock_http_response(status_code, contents, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = contents.encode()
+    response.headers.update(headers or {})
+    return response
+
+
+QUOTA_EXCEEDED = '{"error": {"errors": [{"reason": "quotaExceeded"}]}}'
+
+
+class TestRetryAfter(unittest.TestCase):
+    def test_retry_after_seconds(self):
+        """Verify the `Retry-After` header is attached to the raised error."""
+        response = get_mock_http_response(429, "{}", {"Retry-After": "42"})
+        with self.assertRaises(exceptions.GoogleRateLimitExceeded) as err:
+            exceptions.raise_for_error(response)
+        self.assertEqual(err.exception.retry_after, 42.0)
+
+    def test_retry_after_http_date_in_past(self):
+        """Verify an HTTP date in the past means retrying at once."""
+        response = get_mock_http_response(503, "{}", {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        with self.assertRaises(exceptions.GoogleServiceUnavailable) as err:
+            exceptions.raise_for_error(response)
+        self.assertEqual(err.exception.retry_after, 0.0)
+
+    def test_no_retry_after(self):
+        """Verify `retry_after` is empty without the header."""
+        with self.assertRaises(exceptions.GoogleBadRequestError) as err:
+            exceptions.raise_for_error(get_mock_http_response(400, "{}"))
+        self.assertIsNone(err.exception.retry_after)
+
+
+@mock.patch("time.sleep")
+class TestRetryPolicy(unittest.TestCase):
+    def test_separate_attempt_budget_per_rule(self, mocked_sleep):
+        """Verify each rule counts its own attempts."""
+        policy = RetryPolicy(RetryRule((ValueError,), 2, constant(1)), RetryRule((KeyError,), 3, constant(2)))
+        func = mock.Mock(side_effect=[ValueError, KeyError, KeyError, "done"])
+        self.assertEqual(policy.call(func), "done")
+        self.assertEqual([call[0][0] for call in mocked_sleep.call_args_list], [1, 2, 2])
+
+    def test_split_raises_early(self, mocked_sleep):
+        """Verify a caller able to split the request gets the error after the
+        `split_after` attempts of the rule."""
+        policy = RetryPolicy(RetryRule((ValueError,), 5, constant(1), split_after=2))
+        func = mock.Mock(side_effect=ValueError)
+        with self.assertRaises(ValueError):
+            policy.call(func, split=True)
+        self.assertEqual(func.call_count, 2)
+        func.reset_mock()
+        with self.assertRaises(ValueError):
+            policy.call(func)
+        self.assertEqual(func.call_count, 5)
+
+    def test_unmatched_error_is_raised(self, mocked_sleep):
+        """Verify errors without a rule are not retried."""
+        policy = RetryPolicy(RetryRule((ValueError,), 2, constant(1)))
+        func = mock.Mock(side_effect=TypeError)
+        with self.assertRaises(TypeError):
+            policy.call(func)
+        self.assertEqual(func.call_count, 1)
+
+
+@mock.patch("time.sleep")
+@mock.patch("requests.Session.request")
+@mock.patch("tap_google_search_console.client.GoogleClient.get_access_token")
+class TestClientRetries(unittest.TestCase):
+    def test_retry_after_is_honored(self, mocked_access_token, mocked_request, mocked_sleep):
+        """Verify the wait of a rate limit error follows `Retry-After`."""
+        mocked_request.side_effect = [
+            get_mock_http_response(429, "{}", {"Retry-After": "7"}),
+            get_mock_http_response(200, "{}"),
+        ]
+        client.GoogleClient("", "", "", "").request("GET", "sites")
+        mocked_sleep.assert_called_with(7.0)
+
+    def test_quota_exceeded_is_parked(self, mocked_access_token, mocked_request, mocked_sleep):
+        """Verify a parkable request raises at once instead of sleeping 15
+        minutes."""
+        mocked_request.return_value = get_mock_http_response(403, QUOTA_EXCEEDED)
+        with self.assertRaises(exceptions.GoogleQuotaExceededError) as err:
+            client.GoogleClient("", "", "", "").post("sites/a/searchAnalytics/query", park_on_quota=True)
+        self.assertEqual(err.exception.retry_after, 900)
+        self.assertEqual(mocked_request.call_count, 1)
+        mocked_sleep.assert_not_called()
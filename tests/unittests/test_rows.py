@@ -0,0 +1,118 @@
+import importlib
+import json
+import sys
+import unittest
+from unittest import mock
+
+from singer import Transformer
+from singer.transform import SchemaMismatch
+
+from tap_google_search_console import rows
+from tap_google_search_console.discover import get_schemas
+
+RESPONSE = {
+    "rows": [
+        {"keys": ["2021-01-10", "fr", "MOBILE", "https://a.com/", "tap"], "clicks": 3, "impressions": 40,
+         "ctr": 0.075, "position": 2.5},
+        {"keys": ["2021-01-11", "usa", "DESKTOP", "https://a.com/b", "singer"], "clicks": 0, "impressions": 1,
+         "ctr": 0, "position": 11},
+    ],
+    "responseAggregationType": "byPage",
+}
+DIMENSIONS = ["date", "country", "device", "page", "query"]
+RECORDS = [
+    {"clicks": 3, "impressions": 40, "ctr": 0.075, "position": 2.5, "date": "2021-01-10", "country": "fr",
+     "device": "MOBILE", "page": "https://a.com/", "query": "tap", "site_url": "https://a.com/", "search_type": "web"},
+    {"clicks": 0, "impressions": 1, "ctr": 0, "position": 11, "date": "2021-01-11", "country": "usa",
+     "device": "DESKTOP", "page": "https://a.com/b", "query": "singer", "site_url": "https://a.com/",
+     "search_type": "web"},
+]
+DIMENSIONS_HASH_KEYS = ["7e60ff5dbab2d26efc24ccd543bf6b08", "9e69d17e60c6cce646ca1bb3a1b1ce84"]
+
+
+def get_expected(stream_name):
+    if stream_name != "performance_report_custom":
+        return RECORDS
+    return [{**record, "dimensions_hash_key": hash_key} for record, hash_key in zip(RECORDS, DIMENSIONS_HASH_KEYS)]
+
+
+def get_records(module, stream_name):
+    page = module.decode_report_page(json.dumps(RESPONSE).encode("utf-8"))
+    return [row.to_record(stream_name, "https://a.com/", "web", DIMENSIONS) for row in page]
+
+
+class TestReportRows(unittest.TestCase):
+    def test_records(self):
+        """Verify typed rows produce the records with their dimensions
+        denested, plus `dimensions_hash_key` for the custom report."""
+        for stream_name in ("performance_report_custom", "performance_report_query"):
+            self.assertEqual(get_records(rows, stream_name), get_expected(stream_name))
+
+    def test_slots_fallback_without_msgspec(self):
+        """Verify the `__slots__` rows are used and equivalent when msgspec is
+        not installed."""
+        self.addCleanup(importlib.reload, rows)
+        with mock.patch.dict(sys.modules, {"msgspec": None}):
+            fallback = importlib.reload(rows)
+        self.assertIsNone(fallback.msgspec)
+        self.assertFalse(hasattr(fallback.ReportRow(), "__dict__"))
+        self.assertEqual(get_records(fallback, "performance_report_custom"), get_expected("performance_report_custom"))
+
+    def test_row_from_dict(self):
+        """Verify streamed rows convert to the same typed rows."""
+        row = rows.row_from_dict(RESPONSE["rows"][0])
+        self.assertEqual(row.keys, tuple(RESPONSE["rows"][0]["keys"]))
+        self.assertEqual((row.clicks, row.impressions, row.ctr, row.position), (3, 40, 0.075, 2.5))
+
+    def test_empty_page(self):
+        """Verify responses without rows decode to an empty page."""
+        self.assertEqual(rows.decode_report_page(b""), [])
+        self.assertEqual(rows.decode_report_page(b'{"responseAggregationType": "auto"}'), [])
+
+
+class TestRecordTransformer(unittest.TestCase):
+    def transform_both(self, stream_name, stream_metadata, page, dimensions=DIMENSIONS):
+        schema = get_schemas()[0][stream_name]
+        transformer = rows.RecordTransformer.compile(stream_name, schema, stream_metadata)
+        expected = []
+        for row in page:
+            with Transformer() as singer_transformer:
+                expected.append(singer_transformer.transform(
+                    row.to_record(stream_name, "https://a.com/", "web", dimensions), schema, stream_metadata
+                ))
+        return [transformer.transform(row, "https://a.com/", "web", dimensions) for row in page], expected
+
+    def test_records_match_singer_transformer(self):
+        """Verify the compiled records equal the singer `Transformer` output,
+        values, types and field order, whatever the catalog selection."""
+        page = rows.decode_report_page(json.dumps(RESPONSE).encode("utf-8")) + [
+            rows.ReportRow(("2021-01-12", "", "TABLET", "https://a.com/c", "tap"), 1.0, 2, None, None),
+            rows.ReportRow(),
+        ]
+        unselected = {("properties", "ctr"): {"selected": False}, ("properties", "query"): {"selected": False},
+                      ("properties", "page"): {"inclusion": "unsupported"}}
+        for stream_name in ("performance_report_custom", "performance_report_query", "performance_report_date"):
+            for stream_metadata in ({}, unselected):
+                records, expected = self.transform_both(stream_name, stream_metadata, page)
+                self.assertEqual(records, expected)
+                self.assertEqual([list(record) for record in records], [list(record) for record in expected])
+                self.assertEqual([[type(value) for value in record.values()] for record in records],
+                                 [[type(value) for value in record.values()] for record in expected])
+
+    def test_invalid_values_raise_like_singer(self):
+        """Verify a value the compiled converters reject gives the singer
+        `Transformer` result or error."""
+        records, expected = self.transform_both(
+            "performance_report_date", {}, [rows.ReportRow(("2021-01-10",), "1,000", "", 0.5, 1)], ["date"]
+        )
+        self.assertEqual(records, expected)
+        self.assertEqual(records[0]["clicks"], 1000)
+        with self.assertRaises(SchemaMismatch):
+            self.transform_both("performance_report_date", {}, [rows.ReportRow(("not a date",), 1, 2, 0.5, 1)],
+                                ["date"])
+
+    def test_unsupported_schema(self):
+        """Verify schemas with types the compiled converters do not cover
+        are left to the singer `Transformer`."""
+        schema = {"type": "object", "properties": {"tags": {"type": ["null", "array"], "items": {"type": "string"}}}}
+        self.assertIsNone(rows.RecordTransformer.compile("performance_report_date", schema, {}))
@@ -0,0 +1,139 @@
+import json
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+import tap_google_search_console.client as client
+from tap_google_search_console.discover import get_schemas
+from tap_google_search_console.streaming import iter_json_array
+from tap_google_search_console.streams.performance_reports import PerformanceReportQuery
+
+RESPONSE = {
+    "rows": [
+        {"keys": ["2021-01-10", "café ☕"], "clicks": 12, "impressions": 1234, "ctr": 0.1, "position": 3.25},
+        {"keys": ["2021-01-11", "tap \"quoted\" , ] }"], "clicks": 0, "impressions": 7, "ctr": 0, "position": 1e2},
+    ],
+    "responseAggregationType": "byProperty",
+}
+
+
+def split(data: bytes, size: int):
+    return [data[idx:idx + size] for idx in range(0, len(data), size)]
+
+
+class TestIterJsonArray(unittest.TestCase):
+    def test_rows_across_chunk_boundaries(self):
+        """Verify rows are parsed the same whatever the chunk size, including
+        multi-byte characters and numbers split across chunks."""
+        data = json.dumps(RESPONSE, indent=1).encode("utf-8")
+        for size in (1, 2, 7, 64, len(data)):
+            fields = {}
+            self.assertEqual(list(iter_json_array(split(data, size), "rows", fields)), RESPONSE["rows"])
+            self.assertEqual(fields, {"responseAggregationType": "byProperty"})
+
+    def test_rows_are_yielded_incrementally(self):
+        """Verify the first row is yielded before the rest of the body is
+        read."""
+        data = json.dumps(RESPONSE).encode("utf-8")
+        chunks = iter(split(data, 16))
+        rows = iter_json_array(chunks, "rows")
+        self.assertEqual(next(rows), RESPONSE["rows"][0])
+        self.assertIsNotNone(next(chunks, None))
+
+    def test_empty_responses(self):
+        """Verify responses without rows yield nothing."""
+        self.assertEqual(list(iter_json_array([b""], "rows")), [])
+        self.assertEqual(list(iter_json_array([b"{}"], "rows")), [])
+        self.assertEqual(list(iter_json_array([b'{"rows": [], "a": 1}'], "rows")), [])
+        self.assertEqual(list(iter_json_array([b'{"responseAggregationType": "auto"}'], "rows")), [])
+
+    def test_invalid_json(self):
+        """Verify a truncated body raises an error."""
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'{"rows": [{"a": 1}'], "rows"))
+
+
+@mock.patch("requests.Session.request")
+@mock.patch("tap_google_search_console.client.GoogleClient.get_access_token")
+class TestStreamedSync(unittest.TestCase):
+    @staticmethod
+    def get_streamed_response(*args, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = mock.Mock()
+        response.iter_content = lambda chunk_size: iter(split(json.dumps(RESPONSE).encode("utf-8"), 10))
+        return response
+
+    def sync(self, stream_responses):
+        config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com",
+                  "stream_responses": stream_responses}
+        stream = PerformanceReportQuery(client.GoogleClient("", "", "", ""), config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=20)
+        with mock.patch("tap_google_search_console.streams.abstract.write_record") as mocked_write_record, \
+                mock.patch("tap_google_search_console.output.write_state"):
+            stream.get_records_for_sub_type("https://a.com", "web", {}, get_schemas()[0][stream.tap_stream_id], {})
+        return [call[0][1] for call in mocked_write_record.call_args_list]
+
+    def test_streamed_records_match_loaded_records(self, mocked_access_token, mocked_request):
+        """Verify streaming mode emits the same records as loading the whole
+        response."""
+        mocked_request.side_effect = self.get_streamed_response
+        streamed = self.sync(True)
+        self.assertTrue(mocked_request.call_args[1]["stream"])
+
+        mocked_request.side_effect = lambda *args, **kwargs: mock.Mock(status_code=200, content=json.dumps(RESPONSE))
+        self.assertEqual(streamed, self.sync(False))
+        self.assertEqual([record["query"] for record in streamed], ["café ☕", "tap \"quoted\" , ] }"])
+
+    @mock.patch("time.sleep")
+    def test_body_failing_partway_resumes_at_row(self, mocked_sleep, mocked_access_token, mocked_request):
+        """Verify a response body failing partway is requested again from
+        its first row not read yet."""
+
+        def get_streamed_response(*args, **kwargs):
+            rows = RESPONSE["rows"][json.loads(kwargs["data"])["startRow"] - 10:]
+
+            def iter_content(chunk_size):
+                chunks = ['{"rows": [' + json.dumps(rows[0])] + [", " + json.dumps(row) for row in rows[1:]] + ["]}"]
+                for idx, chunk in enumerate(chunks):
+                    if mocked_request.call_count == 1 and idx == 2:
+                        raise requests.exceptions.ChunkedEncodingError()
+                    yield chunk.encode("utf-8")
+
+            response = requests.Response()
+            response.status_code, response.raw = 200, mock.Mock()
+            response.iter_content = iter_content
+            return response
+
+        mocked_request.side_effect = get_streamed_response
+        google_client = client.GoogleClient("", "", "", "")
+        rows = google_client.post("sites/a/searchAnalytics/query", data=json.dumps({"startRow": 10, "rowLimit": 100}),
+                                  stream_key="rows")
+        self.assertEqual(list(rows), RESPONSE["rows"])
+        self.assertEqual(json.loads(mocked_request.call_args[1]["data"]), {"startRow": 11, "rowLimit": 99})
+
+    def test_slot_held_until_body_read(self, mocked_access_token, mocked_request):
+        """Verify the in-flight slot of a streamed response is held, and its
+        latency recorded, only once the body is read."""
+        mocked_request.side_effect = self.get_streamed_response
+        google_client = client.GoogleClient("", "", "", "")
+        acquired = threading.Event()
+
+        def acquire():
+            with google_client.throttle.slot():
+                acquired.set()
+
+        with mock.patch.object(google_client.throttle, "on_success") as mocked_on_success:
+            rows = google_client.post("sites/a/searchAnalytics/query", data=json.dumps({"rowLimit": 10}),
+                                      stream_key="rows")
+            next(rows)
+            thread = threading.Thread(target=acquire)
+            thread.start()
+            self.assertFalse(acquired.wait(0.1))
+            mocked_on_success.assert_not_called()
+            list(rows)
+            self.assertTrue(acquired.wait(5))
+            thread.join()
+            mocked_on_success.assert_called_once()
@@ -0,0 +1,122 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+import tap_google_search_console.client as client
+from tap_google_search_console import exceptions
+from tap_google_search_console.ratelimit import RateLimiter
+from tap_google_search_console.throttle import AIMDController
+
+
+def get_mock_http_response(status_code, contents):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = contents.encode()
+    return response
+
+
+class TestAIMDController(unittest.TestCase):
+    def test_multiplicative_decrease(self):
+        """Verify a throttling signal halves rate scale and concurrency once
+        per cooldown."""
+        controller = AIMDController(RateLimiter(), max_concurrency=8)
+        controller.on_throttled()
+        controller.on_throttled()
+        self.assertEqual(controller.rate_scale, 0.5)
+        self.assertEqual(controller.concurrency, 4)
+
+    def test_additive_increase(self):
+        """Verify healthy responses grow rate scale and concurrency back up to
+        their limits."""
+        controller = AIMDController(RateLimiter(), max_concurrency=4)
+        controller.on_throttled()
+        for _ in range(4):
+            controller.on_success(0.1)
+        self.assertAlmostEqual(controller.rate_scale, 0.58)
+        self.assertEqual(controller.concurrency, 3)
+        for _ in range(100):
+            controller.on_success(0.1)
+        self.assertEqual(controller.rate_scale, 1.0)
+        self.assertEqual(controller.concurrency, 4)
+
+    def test_latency_close_to_timeout_is_a_throttling_signal(self):
+        """Verify responses coming close to the request timeout shrink the
+        rate."""
+        controller = AIMDController(RateLimiter(), max_concurrency=2, request_timeout=200)
+        controller.on_success(120)
+        self.assertEqual(controller.rate_scale, 0.5)
+        self.assertEqual(controller.concurrency, 1)
+
+    def test_latency_above_baseline_is_a_throttling_signal(self):
+        """Verify heavy but steady responses are healthy, and responses
+        becoming much slower than the learned baseline shrink the rate."""
+        controller = AIMDController(RateLimiter(), max_concurrency=2, request_timeout=300)
+        for _ in range(50):
+            controller.on_success(60)
+        self.assertEqual((controller.rate_scale, controller.concurrency), (1.0, 2))
+
+        controller = AIMDController(RateLimiter(), max_concurrency=2, request_timeout=300)
+        for _ in range(20):
+            controller.on_success(2)
+        self.assertEqual(controller.rate_scale, 1.0)
+        for _ in range(10):
+            controller.on_success(10)
+        self.assertEqual((controller.rate_scale, controller.concurrency), (0.5, 1))
+
+    def test_fast_responses_jitter_is_healthy(self):
+        """Verify latency variations of fast responses are not a throttling
+        signal."""
+        controller = AIMDController(RateLimiter(), max_concurrency=2)
+        for latency in [0.05] * 20 + [0.5] * 10:
+            controller.on_success(latency)
+        self.assertEqual(controller.rate_scale, 1.0)
+
+    def test_slot_limits_requests_in_flight(self):
+        """Verify no more than `concurrency` slots are held at once."""
+        controller = AIMDController(RateLimiter(), max_concurrency=2)
+        in_flight, peak, lock = [0], [0], threading.Lock()
+
+        def worker():
+            with controller.slot():
+                with lock:
+                    in_flight[0] += 1
+                    peak[0] = max(peak[0], in_flight[0])
+                time.sleep(0.02)
+                with lock:
+                    in_flight[0] -= 1
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+
+
+@mock.patch("time.sleep")
+@mock.patch("requests.Session.request")
+@mock.patch("tap_google_search_console.client.GoogleClient.get_access_token")
+class TestClientThrottling(unittest.TestCase):
+    def test_rate_limit_response_shrinks_rate(self, mocked_access_token, mocked_request, mocked_sleep):
+        """Verify a 429 response is reported to the controller."""
+        mocked_request.side_effect = [
+            get_mock_http_response(429, '{"error": {"code": 429}}'),
+            get_mock_http_response(200, '{"rows": []}'),
+        ]
+        google_client = client.GoogleClient("", "", "", "", max_workers=4)
+        self.assertEqual(google_client.request("GET", "sites"), {"rows": []})
+        self.assertEqual(google_client.throttle.concurrency, 2)
+        self.assertAlmostEqual(google_client.rate_limiter.scale, 0.52)
+
+    def test_quota_exceeded_response_shrinks_rate(self, mocked_access_token, mocked_request, mocked_sleep):
+        """Verify a quota exceeded response is reported to the controller."""
+        mocked_request.return_value = get_mock_http_response(
+            403, '{"error": {"errors": [{"reason": "quotaExceeded"}]}}'
+        )
+        google_client = client.GoogleClient("", "", "", "")
+        with self.assertRaises(exceptions.GoogleQuotaExceededError):
+            google_client.request("GET", "sites")
+        self.assertEqual(google_client.rate_limiter.scale, 0.5)
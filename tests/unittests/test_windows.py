@@ -0,0 +1,494 @@
+import json
+import re
+import threading
+import unittest
+from collections import Counter
+from datetime import date, timedelta
+from unittest import mock
+
+import requests
+
+from tap_google_search_console.client import GoogleClient
+from tap_google_search_console.discover import get_schemas
+from tap_google_search_console.exceptions import GoogleQuotaExceededError, Server5xxError
+from tap_google_search_console.streams.performance_reports import (
+    PerformanceReportDate,
+    PerformanceReportDevices,
+    PerformanceReportPage,
+    PerformanceReportQuery,
+)
+from tap_google_search_console.windows import (
+    MAX_WINDOW_SIZE,
+    MIN_WINDOW_SIZE,
+    get_adaptive_window_size,
+    get_filter_shards,
+    get_max_rows,
+    get_prefix_shards,
+    plan_windows,
+    split_filters,
+    split_window,
+    update_row_density,
+)
+
+
+def get_days(start, end):
+    return [start + timedelta(days=day) for day in range((end - start).days + 1)]
+
+
+class TestPlanWindows(unittest.TestCase):
+    def test_windows_cover_every_day_once(self):
+        """Verify the windows cover every day of the range exactly once, in
+        order and within the window size."""
+        start = date(2021, 1, 1)
+        for length in (1, 2, 29, 30, 31, 95):
+            end = start + timedelta(days=length - 1)
+            for size in (1, 7, 30, 31, 200):
+                windows = list(plan_windows(start, end, size))
+                days = [day for window in windows for day in get_days(*window)]
+                self.assertEqual(days, get_days(start, end))
+                self.assertTrue(all((window_end - window_start).days < size for window_start, window_end in windows))
+
+    def test_empty_range(self):
+        """Verify a range ending before it starts has no window."""
+        self.assertEqual(list(plan_windows(date(2021, 1, 2), date(2021, 1, 1), 30)), [])
+
+
+class TestNoDayRequestedTwice(unittest.TestCase):
+    config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "DATE_WINDOW_SIZE": 7,
+              "prune_sub_types": False, "probe_data_availability": False}
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_sync_requests_each_day_once(self, mocked_write_record, mocked_write_state):
+        """Verify a sync with paginated and empty windows requests every day
+        from the bookmark to today once per sub_type, writes every row
+        returned, and never asks for a page after the last one."""
+        requested = Counter()
+
+        def get_page(path, **kwargs):
+            body = json.loads(kwargs["data"])
+            days = get_days(date.fromisoformat(body["startDate"]), date.fromisoformat(body["endDate"]))
+            if body["startRow"] == 0:
+                requested.update((body["type"], day) for day in days)
+            # one row per day, except for the second window which has no data
+            if body["startDate"] == "2021-01-10":
+                days = []
+            rows = [
+                '{"keys": ["%s"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}' % day
+                for day in days[body["startRow"]:body["startRow"] + body["rowLimit"]]
+            ]
+            return kwargs["decoder"](('{"rows": [%s]}' % ", ".join(rows)).encode())
+
+        client = mock.Mock()
+        client.post.side_effect = get_page
+        stream = PerformanceReportDate(client, self.config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=31)
+        stream.row_limit = 4
+        state = {"bookmarks": {"performance_report_date": {"https://a.com": {"web": "2021-01-03T00:00:00.000000Z"}}}}
+        stream.get_records_for_sub_type("https://a.com", "web", state, get_schemas()[0][stream.tap_stream_id], {})
+
+        self.assertEqual(requested, Counter(("web", day) for day in get_days(date(2021, 1, 3), date(2021, 1, 31))))
+        # 5 windows, 3 of 7 days paginated in 4 + 3 rows, 1 empty and the last day
+        self.assertEqual(mocked_write_record.call_count, 22)
+        self.assertEqual(client.post.call_count, 8)
+        self.assertEqual(
+            state["bookmarks"]["performance_report_date"]["https://a.com"]["web"], "2021-01-31T00:00:00.000000Z"
+        )
+
+
+class TestAdaptiveWindows(unittest.TestCase):
+    config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "target_rows_per_request": 100,
+              "probe_data_start": False, "prune_sub_types": False, "probe_data_availability": False}
+
+    def test_window_size_from_density(self):
+        """Verify the window size targets the configured rows, within
+        bounds, and falls back to the default while the density is
+        unknown."""
+        self.assertEqual(get_adaptive_window_size(None, 100, 30), 30)
+        self.assertEqual(get_adaptive_window_size(10, 0, 30), 30)
+        self.assertEqual(get_adaptive_window_size(10, 100, 30), 10)
+        self.assertEqual(get_adaptive_window_size(1000, 100, 30), MIN_WINDOW_SIZE)
+        self.assertEqual(get_adaptive_window_size(0, 100, 30), MAX_WINDOW_SIZE)
+        self.assertEqual(update_row_density(None, 70, 7), 10)
+        self.assertEqual(update_row_density(10, 140, 7), 15)
+
+    def test_callable_size(self):
+        """Verify a callable size is evaluated for every window."""
+        sizes = iter([2, 3, 10])
+        self.assertEqual(
+            list(plan_windows(date(2021, 1, 1), date(2021, 1, 8), lambda: next(sizes))),
+            [(date(2021, 1, 1), date(2021, 1, 2)), (date(2021, 1, 3), date(2021, 1, 5)),
+             (date(2021, 1, 6), date(2021, 1, 8))],
+        )
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_density_persisted_and_used(self, mocked_write_record, mocked_write_state):
+        """Verify the observed rows per day are kept in the state and size
+        the windows of the next run."""
+        windows = []
+
+        def get_page(path, **kwargs):
+            body = json.loads(kwargs["data"])
+            windows.append((body["startDate"], body["endDate"]))
+            row = '{"keys": ["%s"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}' % body["endDate"]
+            return kwargs["decoder"](('{"rows": [%s]}' % ", ".join([row] * 20)).encode())
+
+        client = mock.Mock()
+        client.post.side_effect = get_page
+        stream = PerformanceReportDate(client, self.config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=3, day=1)
+        state, schema = {}, get_schemas()[0][stream.tap_stream_id]
+        stream.get_records_for_sub_type("https://a.com", "web", state, schema, {})
+
+        # 20 rows over the first 30 days window, then windows sized for 100 rows
+        self.assertEqual(windows[:2], [("2021-01-01", "2021-01-30"), ("2021-01-31", "2021-03-01")])
+        self.assertEqual(state["row_density"]["performance_report_date"]["https://a.com"]["web"], 0.667)
+
+        windows.clear()
+        state["row_density"]["performance_report_date"]["https://a.com"]["web"] = 20
+        state["bookmarks"] = {"performance_report_date": {"https://a.com": {"web": "2021-02-20T00:00:00Z"}}}
+        stream.get_records_for_sub_type("https://a.com", "web", state, schema, {})
+        self.assertEqual(windows[0], ("2021-02-20", "2021-02-24"))
+
+
+class TestLastPagePredictor(unittest.TestCase):
+    def test_max_rows(self):
+        """Verify the row bound of bounded dimensions, and none for
+        unbounded ones."""
+        self.assertEqual(get_max_rows(["date"], 30), 30)
+        self.assertEqual(get_max_rows(["date", "device"], 30), 90)
+        self.assertEqual(get_max_rows([], 30), 1)
+        self.assertIsNone(get_max_rows(["date", "query"], 30))
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_exactly_full_window_in_one_request(self, mocked_write_record, mocked_write_state):
+        """Verify a window holding as many rows as its bound is fetched with
+        a single request."""
+        bodies = []
+
+        def get_page(path, **kwargs):
+            body = json.loads(kwargs["data"])
+            bodies.append(body)
+            days = get_days(date.fromisoformat(body["startDate"]), date.fromisoformat(body["endDate"]))
+            row = '{"keys": ["%s", "%s"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}'
+            rows = [row % (day, device) for day in days for device in ("DESKTOP", "MOBILE", "TABLET")]
+            page = rows[body["startRow"]:][:body["rowLimit"]]
+            return kwargs["decoder"](('{"rows": [%s]}' % ", ".join(page)).encode())
+
+        client = mock.Mock()
+        client.post.side_effect = get_page
+        config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "probe_data_start": False,
+                  "prune_sub_types": False, "probe_data_availability": False}
+        stream = PerformanceReportDevices(client, config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=10)
+        stream.get_records_for_sub_type("https://a.com", "web", {}, get_schemas()[0][stream.tap_stream_id], {})
+        self.assertEqual([(body["startRow"], body["rowLimit"]) for body in bodies], [(0, 31)])
+        self.assertEqual(mocked_write_record.call_count, 30)
+
+
+class TestPrefetchPages(unittest.TestCase):
+    @mock.patch("tap_google_search_console.output.write_state")
+    def test_next_page_fetched_while_writing(self, mocked_write_state):
+        """Verify the next page is requested while the records of the
+        current one are being written, and all the records are written in
+        order."""
+        second_page_requested, overlapped, written = threading.Event(), [], []
+
+        def get_page(path, **kwargs):
+            body = json.loads(kwargs["data"])
+            if body["startRow"]:
+                second_page_requested.set()
+            rows = [
+                '{"keys": ["2021-01-01", "query %d"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}' % row
+                for row in range(5)
+            ]
+            page = rows[body["startRow"]:][:body["rowLimit"]]
+            return kwargs["decoder"](('{"rows": [%s]}' % ", ".join(page)).encode())
+
+        def write_record(stream_name, record, **kwargs):
+            if not written:
+                overlapped.append(second_page_requested.wait(5))
+            written.append(record["query"])
+
+        client = mock.Mock()
+        client.post.side_effect = get_page
+        config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "prefetch_pages": 1,
+                  "probe_data_start": False, "prune_sub_types": False, "probe_data_availability": False}
+        stream = PerformanceReportQuery(client, config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=1)
+        stream.row_limit = 2
+        with mock.patch("tap_google_search_console.streams.abstract.write_record", side_effect=write_record):
+            stream.get_records_for_sub_type("https://a.com", "web", {}, get_schemas()[0][stream.tap_stream_id], {})
+        self.assertEqual(overlapped, [True])
+        self.assertEqual(written, [f"query {row}" for row in range(5)])
+
+
+def matches(value, row_filter):
+    """Evaluates a dimension filter of the request splitter."""
+    if row_filter["operator"] == "equals":
+        return value == row_filter["expression"]
+    found = re.search(row_filter["expression"], value) is not None
+    return found if row_filter["operator"] == "includingRegex" else not found
+
+
+class TestRequestSplitting(unittest.TestCase):
+    config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "DATE_WINDOW_SIZE": 8,
+              "ATTRIBUTION_DAYS": 0, "probe_data_start": False, "prune_sub_types": False,
+              "probe_data_availability": False}
+
+    def test_split_window(self):
+        """Verify a window is split in two halves covering every day once."""
+        self.assertEqual(split_window((date(2021, 1, 1), date(2021, 1, 3))),
+                         [(date(2021, 1, 1), date(2021, 1, 2)), (date(2021, 1, 3), date(2021, 1, 3))])
+
+    def test_split_filters(self):
+        """Verify the rows are split by device first, then with a regular
+        expression and its negation, only on the dimensions grouped by."""
+        by_device = split_filters(["date", "device"], ())
+        self.assertEqual([filters[0]["expression"] for filters in by_device], ["DESKTOP", "MOBILE", "TABLET"])
+        self.assertIsNone(split_filters(["date", "device"], by_device[0]))
+        first, second = split_filters(["date", "query"], ())
+        self.assertEqual([row_filter["operator"] for row_filter in first + second],
+                         ["includingRegex", "excludingRegex"])
+        deeper = split_filters(["date", "query"], first)
+        self.assertEqual([len(filters) for filters in deeper], [2, 2])
+        self.assertNotEqual(deeper[0][1]["expression"], first[0]["expression"])
+        self.assertIsNone(split_filters(["date"], ()))
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_timeouts_split_window_by_date(self, mocked_write_record, mocked_write_state):
+        """Verify a window timing out is split by date until the requests
+        succeed, and the working size is used by the next runs."""
+        windows = []
+
+        def get_page(path, **kwargs):
+            body = json.loads(kwargs["data"])
+            windows.append((body["startDate"], body["endDate"]))
+            days = get_days(date.fromisoformat(body["startDate"]), date.fromisoformat(body["endDate"]))
+            if len(days) > 2:
+                self.assertTrue(kwargs["split_on_failure"])
+                raise requests.exceptions.Timeout()
+            rows = [
+                '{"keys": ["%s"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}' % day for day in days
+            ]
+            return kwargs["decoder"](('{"rows": [%s]}' % ", ".join(rows)).encode())
+
+        client = mock.Mock()
+        client.post.side_effect = get_page
+        stream = PerformanceReportDate(client, self.config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=8)
+        state, schema = {}, get_schemas()[0][stream.tap_stream_id]
+        stream.get_records_for_sub_type("https://a.com", "web", state, schema, {})
+        self.assertEqual(windows, [
+            ("2021-01-01", "2021-01-08"), ("2021-01-01", "2021-01-04"), ("2021-01-01", "2021-01-02"),
+            ("2021-01-03", "2021-01-04"), ("2021-01-05", "2021-01-08"), ("2021-01-05", "2021-01-06"),
+            ("2021-01-07", "2021-01-08"),
+        ])
+        self.assertEqual(mocked_write_record.call_count, 8)
+        self.assertEqual(state["request_limits"]["performance_report_date"]["https://a.com"]["web"],
+                         {"max_days": 2, "since": "2021-01-08"})
+
+        windows.clear()
+        state["bookmarks"] = {"performance_report_date": {"https://a.com": {"web": "2021-01-05T00:00:00Z"}}}
+        stream.get_records_for_sub_type("https://a.com", "web", state, schema, {})
+        self.assertEqual(windows, [("2021-01-05", "2021-01-06"), ("2021-01-07", "2021-01-08")])
+
+        # once expired, the larger request is tried again and the limits are dropped if it succeeds
+        windows.clear()
+        stream.now_dt_tm = stream.now_dt_tm.replace(day=16)
+        state["bookmarks"] = {"performance_report_date": {"https://a.com": {"web": "2021-01-14T00:00:00Z"}}}
+        stream.get_records_for_sub_type("https://a.com", "web", state, schema, {})
+        self.assertEqual(windows, [("2021-01-14", "2021-01-16"), ("2021-01-14", "2021-01-15"),
+                                   ("2021-01-16", "2021-01-16")])
+        self.assertEqual(state["request_limits"]["performance_report_date"]["https://a.com"]["web"],
+                         {"max_days": 1, "since": "2021-01-16"})
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_expired_limits_dropped(self, mocked_write_record, mocked_write_state):
+        """Verify the request limits are dropped once expired, when the
+        larger requests succeed."""
+        client = mock.Mock()
+        client.post.side_effect = lambda path, **kwargs: kwargs["decoder"](b'{"rows": []}')
+        stream = PerformanceReportDate(client, self.config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=8)
+        state = {"request_limits": {"performance_report_date": {"https://a.com": {
+            "web": {"max_days": 1, "since": "2020-12-31"}}}}}
+        stream.get_records_for_sub_type("https://a.com", "web", state, get_schemas()[0][stream.tap_stream_id], {})
+        self.assertEqual(client.post.call_count, 1)
+        self.assertNotIn("request_limits", state)
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_splits_capped_per_window(self, mocked_write_record, mocked_write_state):
+        """Verify a window failing at every size is split at most
+        `MAX_WINDOW_SPLITS` times, and no limit is kept for the requests
+        that never succeeded."""
+        client = mock.Mock()
+        client.post.side_effect = Server5xxError()
+        stream = PerformanceReportQuery(client, self.config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=8)
+        with mock.patch("tap_google_search_console.windows.MAX_WINDOW_SPLITS", 5), \
+                self.assertRaises(Server5xxError):
+            stream.get_records_for_sub_type("https://a.com", "web", {}, get_schemas()[0][stream.tap_stream_id], {})
+        self.assertEqual(client.post.call_count, 6)
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_window_split_after_first_page_keeps_bookmark(self, mocked_write_record, mocked_write_state):
+        """Verify a window split by date after its first page is only
+        bookmarked once all its halves are fetched, its rows being sorted
+        by clicks and not by date."""
+        rows = [("q1", "2021-01-10", 9), ("q2", "2021-01-02", 8), ("q3", "2021-01-03", 7), ("q4", "2021-01-07", 6)]
+
+        def get_page(path, **kwargs):
+            body = json.loads(kwargs["data"])
+            if (body["startDate"], body["endDate"], body["startRow"]) == ("2021-01-01", "2021-01-10", 2):
+                raise requests.exceptions.Timeout()
+            if body["startDate"] == "2021-01-06":
+                raise GoogleQuotaExceededError("quota")
+            page = [
+                '{"keys": ["%s", "%s"], "clicks": %d, "impressions": 10, "ctr": 0.5, "position": 1.0}'
+                % (day, query, clicks) for query, day, clicks in rows if body["startDate"] <= day <= body["endDate"]
+            ][body["startRow"]:body["startRow"] + body["rowLimit"]]
+            return kwargs["decoder"](('{"rows": [%s]}' % ", ".join(page)).encode())
+
+        client = mock.Mock()
+        client.post.side_effect = get_page
+        stream = PerformanceReportQuery(client, {**self.config, "DATE_WINDOW_SIZE": 10, "checkpoint_pages": True})
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=10)
+        stream.row_limit = 2
+        state = {}
+        with self.assertRaises(GoogleQuotaExceededError):
+            stream.get_records_for_sub_type("https://a.com", "web", state, get_schemas()[0][stream.tap_stream_id], {})
+        self.assertNotIn("bookmarks", state)
+        self.assertEqual(
+            state["currently_syncing_units"]["performance_report_query"]["https://a.com"]["web"],
+            {"start_date": "2021-01-01", "end_date": "2021-01-10", "offset": 0},
+        )
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_server_errors_split_day_by_filter(self, mocked_write_record, mocked_write_state):
+        """Verify a single day failing with server errors is split by
+        dimension filter, every row being written once."""
+        queries, bodies = ["alpha", "mike", "zulu", "yankee"], []
+
+        def get_page(path, **kwargs):
+            body = json.loads(kwargs["data"])
+            bodies.append(body)
+            filters = body.get("dimensionFilterGroups", [{"filters": []}])[0]["filters"]
+            if not filters:
+                raise Server5xxError()
+            rows = [
+                '{"keys": ["2021-01-01", "%s"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}' % query
+                for query in queries if all(matches(query, row_filter) for row_filter in filters)
+            ]
+            return kwargs["decoder"](('{"rows": [%s]}' % ", ".join(rows)).encode())
+
+        client = mock.Mock()
+        client.post.side_effect = get_page
+        stream = PerformanceReportQuery(client, self.config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=1)
+        state, schema = {}, get_schemas()[0][stream.tap_stream_id]
+        stream.get_records_for_sub_type("https://a.com", "web", state, schema, {})
+        self.assertEqual(sorted(call.args[1]["query"] for call in mocked_write_record.call_args_list), sorted(queries))
+        self.assertEqual(len(bodies), 3)
+        self.assertEqual(state["request_limits"]["performance_report_query"]["https://a.com"]["web"],
+                         {"filter_splits": 1, "since": "2021-01-01"})
+
+        # the next runs split the day up front
+        bodies.clear()
+        stream.get_records_for_sub_type("https://a.com", "web", {**state, "bookmarks": {}}, schema, {})
+        self.assertEqual(len(bodies), 2)
+
+
+class TestSharding(unittest.TestCase):
+    pages = ["https://a.com/", "https://a.com/about", "https://a.com/blog/one", "https://a.com/blog/two",
+             "https://a.com/shop/item", "https://a.com/shopping/cart"]
+
+    def test_prefix_shards_are_disjoint(self):
+        """Verify every page falls in exactly one page prefix shard."""
+        shards = get_prefix_shards(["https://a.com/blog/", "https://a.com/shop/"])
+        self.assertEqual(len(shards), 3)
+        for page in self.pages:
+            self.assertEqual(sum(all(matches(page, row_filter) for row_filter in shard) for shard in shards), 1)
+
+    def test_filter_shards(self):
+        """Verify the filter shards are split until there are enough of
+        them, and not for dimensions that cannot be split."""
+        self.assertEqual(len(get_filter_shards(["date", "query"], 4)), 4)
+        self.assertEqual(len(get_filter_shards(["date", "device"], 2)), 3)
+        self.assertEqual(get_filter_shards(["date"], 4), [()])
+
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_shards_fetched_concurrently(self, mocked_write_record, mocked_write_state):
+        """Verify a window of the page report is split by the probed page
+        prefixes, the shards are fetched concurrently and every row is
+        written once."""
+        # the 3 shard requests only go through once they are all in flight
+        barrier, bodies = threading.Barrier(3, timeout=5), []
+        impressions = {"https://a.com/blog/one": 10, "https://a.com/blog/two": 10, "https://a.com/shop/item": 5,
+                       "https://a.com/shopping/cart": 1, "https://a.com/about": 50}
+
+        def get_page(path, **kwargs):
+            body = json.loads(kwargs["data"])
+            row = '{"keys": [%s], "clicks": 1, "impressions": %d, "ctr": 0.5, "position": 1.0}'
+            if kwargs["endpoint"] == "page_probe":
+                rows = [row % (json.dumps(page), count) for page, count in impressions.items()]
+            else:
+                bodies.append(body)
+                barrier.wait()
+                filters = body["dimensionFilterGroups"][0]["filters"]
+                rows = [row % (f'"2021-01-01", {json.dumps(page)}', 1) for page in self.pages
+                        if all(matches(page, row_filter) for row_filter in filters)]
+            return kwargs["decoder"](('{"rows": [%s]}' % ", ".join(rows)).encode())
+
+        client = mock.Mock()
+        client.post.side_effect = get_page
+        config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "report_shards": 3,
+                  "ATTRIBUTION_DAYS": 0, "probe_data_start": False, "prune_sub_types": False,
+                  "probe_data_availability": False}
+        stream = PerformanceReportPage(client, config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=1)
+        stream.get_records_for_sub_type("https://a.com", "web", {}, get_schemas()[0][stream.tap_stream_id], {})
+        self.assertEqual(len(bodies), 3)
+        self.assertEqual(sorted(call.args[1]["page"] for call in mocked_write_record.call_args_list),
+                         sorted(self.pages))
+
+    @mock.patch("tap_google_search_console.client.GoogleClient.get_access_token")
+    @mock.patch("tap_google_search_console.output.write_state")
+    @mock.patch("tap_google_search_console.streams.abstract.write_record")
+    def test_shards_fetched_concurrently_through_client(
+        self, mocked_write_record, mocked_write_state, mocked_access_token
+    ):
+        """Verify the client lets the shards of a window be in flight at
+        the same time with a single sync worker."""
+        barrier = threading.Barrier(4, timeout=5)
+        queries = ["alpha", "mike", "zulu", "yankee", "bravo", "oscar"]
+
+        def request(method, url, **kwargs):
+            barrier.wait()
+            filters = json.loads(kwargs["data"])["dimensionFilterGroups"][0]["filters"]
+            rows = [
+                '{"keys": ["2021-01-01", "%s"], "clicks": 1, "impressions": 2, "ctr": 0.5, "position": 1.0}' % query
+                for query in queries if all(matches(query, row_filter) for row_filter in filters)
+            ]
+            response = requests.Response()
+            response.status_code, response._content = 200, ('{"rows": [%s]}' % ", ".join(rows)).encode()
+            return response
+
+        config = {"start_date": "2021-01-01T00:00:00Z", "site_urls": "https://a.com", "report_shards": 4,
+                  "ATTRIBUTION_DAYS": 0, "probe_data_start": False, "prune_sub_types": False,
+                  "probe_data_availability": False}
+        google_client = GoogleClient("", "", "", "https://a.com", report_shards=config["report_shards"])
+        self.assertEqual(google_client.throttle.concurrency, 4)
+        stream = PerformanceReportQuery(google_client, config)
+        stream.now_dt_tm = stream.now_dt_tm.replace(year=2021, month=1, day=1)
+        with mock.patch("requests.Session.request", side_effect=request):
+            stream.get_records_for_sub_type("https://a.com", "web", {}, get_schemas()[0][stream.tap_stream_id], {})
+        self.assertEqual(sorted(call.args[1]["query"] for call in mocked_write_record.call_args_list), sorted(queries))